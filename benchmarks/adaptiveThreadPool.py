@@ -0,0 +1,118 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+"""
+Throughput of the request ThreadPool with a fixed vs. an adaptive number of workers,
+for a graph that mixes I/O-bound and CPU-bound operators.
+
+Each block is read from a (simulated) slow storage backend, which mostly waits,
+and is then processed by a CPU-bound operator (numpy releases the GIL).
+With one worker per CPU, the workers spend much of their time blocked in reads.
+The adaptive pool should notice the idle CPUs and activate more workers.
+
+The adaptive pool needs a few sampling intervals to settle, so the
+first pass is not representative.  We report the best of a few passes.
+"""
+import time
+import multiprocessing
+
+import numpy
+
+from lazyflow.graph import Graph, Operator, InputSlot, OutputSlot
+from lazyflow.request import Request, RequestPool
+
+NUM_BLOCKS = 200
+BLOCK_SHAPE = (64, 64, 64)
+READ_LATENCY = 0.02 # seconds
+NUM_PASSES = 3
+
+class OpSlowStorage(Operator):
+    """
+    Provides random data, after waiting a while for each block (like a network file system would).
+    """
+    io_bound = True
+    Output = OutputSlot()
+
+    def setupOutputs(self):
+        self.Output.meta.shape = (NUM_BLOCKS,) + BLOCK_SHAPE
+        self.Output.meta.dtype = numpy.float32
+
+    def execute(self, slot, subindex, roi, result):
+        time.sleep( READ_LATENCY )
+        result[:] = 1.0
+        return result
+
+    def propagateDirty(self, slot, subindex, roi):
+        pass
+
+class OpHeavyFilter(Operator):
+    """
+    CPU-bound processing of its input.
+    """
+    Input = InputSlot()
+    Output = OutputSlot()
+
+    def setupOutputs(self):
+        self.Output.meta.assignFrom(self.Input.meta)
+
+    def execute(self, slot, subindex, roi, result):
+        data = self.Input(roi.start, roi.stop).wait()
+        for _ in range(5):
+            data = numpy.sqrt( data*data + 1.0 )
+        result[:] = data
+        return result
+
+    def propagateDirty(self, slot, subindex, roi):
+        pass
+
+def process_all_blocks(op):
+    pool = RequestPool()
+    for i in range(NUM_BLOCKS):
+        pool.add( op.Output( (i,0,0,0), (i+1,) + BLOCK_SHAPE ) )
+    for _ in pool.as_completed():
+        pass
+
+def measure(num_workers, adaptive):
+    Request.reset_thread_pool(num_workers, adaptive=adaptive)
+    graph = Graph()
+    opStorage = OpSlowStorage( graph=graph )
+    opFilter = OpHeavyFilter( graph=graph )
+    opFilter.Input.connect( opStorage.Output )
+
+    timings = []
+    for _ in range(NUM_PASSES):
+        t1 = time.time()
+        process_all_blocks(opFilter)
+        timings.append( time.time() - t1 )
+    active_workers = Request.global_thread_pool.active_workers
+    return min(timings), active_workers
+
+if __name__ == "__main__":
+    num_cpus = multiprocessing.cpu_count()
+    print "{} blocks of {}, {}ms read latency, {} CPUs".format( NUM_BLOCKS, BLOCK_SHAPE, READ_LATENCY*1000, num_cpus )
+    for num_workers, adaptive in [ (num_cpus, False),
+                                   (4*num_cpus, False),
+                                   (4*num_cpus, True) ]:
+        total, active_workers = measure(num_workers, adaptive)
+        mode = "adaptive" if adaptive else "fixed"
+        print "  {:>3} workers, {:>8}: {:.3f} seconds, {:.1f} blocks/s ({} workers active at the end)"\
+              .format( num_workers, mode, total, NUM_BLOCKS/total, active_workers )
+    Request.reset_thread_pool()
@@ -0,0 +1,136 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+"""
+Latency of block lookup and dirty propagation in OpUnblockedArrayCache,
+against the number of cached blocks.
+
+The cache keeps a spatial index (RoiIndex) over its stored blocks. For
+comparison, the same queries are answered by looking at every block, as
+the cache did before.
+
+Each block count is measured twice: once with equally sized blocks only,
+and once where a tiny block is stored first (the index must not keep its
+grid cells at that size).
+"""
+import sys
+import time
+
+import numpy
+
+from lazyflow.graph import Graph
+from lazyflow.roi import containing_rois, getIntersection
+from lazyflow.rtype import SubRegion
+from lazyflow.operators.cacheMemoryManager import CacheMemoryManager
+from lazyflow.operators.opArrayPiper import OpArrayPiper
+from lazyflow.operators.opUnblockedArrayCache import OpUnblockedArrayCache
+
+BLOCK_SIZE = 8
+NUM_QUERIES = 200
+# the linear search is slow, use fewer queries
+NUM_LINEAR_QUERIES = 20
+
+def linearContaining(cache, roi):
+    outer_rois = containing_rois( cache._block_data.keys(), roi )
+    if len(outer_rois) > 0:
+        return cache._standardize_roi( *outer_rois[0] )
+    return None
+
+def linearIntersecting(cache, roi):
+    return [ block_roi for block_roi in cache._block_data.keys()
+             if getIntersection(block_roi, roi, assertIntersect=False) ]
+
+def median_time(f, args_list):
+    latencies = []
+    for args in args_list:
+        t = time.time()
+        f(*args)
+        latencies.append( time.time() - t )
+    return sorted(latencies)[len(latencies)//2]
+
+def measure(num_blocks, small_first=False):
+    """
+    Return median latencies (in seconds) of
+    (indexed lookup, linear lookup, propagateDirty, linear dirty query).
+
+    If small_first is True, a 1x1 block (outside of the others) is stored before them.
+    """
+    side = int(numpy.ceil(numpy.sqrt(num_blocks)))
+    shape = (side*BLOCK_SIZE + 1, side*BLOCK_SIZE)
+    data = numpy.zeros(shape, dtype=numpy.uint8)
+
+    g = Graph()
+    op = OpArrayPiper(graph=g)
+    op.Input.setValue(data)
+    cache = OpUnblockedArrayCache(graph=g)
+    cache.Input.connect(op.Output)
+
+    if small_first:
+        small_block = numpy.zeros((1, 1), dtype=numpy.uint8)
+        cache.setInSlot(cache.Input, (), SubRegion(cache.Input, (shape[0]-1, 0), (shape[0], 1)), small_block)
+
+    block = numpy.zeros((BLOCK_SIZE, BLOCK_SIZE), dtype=numpy.uint8)
+    block_starts = [ (x*BLOCK_SIZE, y*BLOCK_SIZE)
+                     for x in range(side) for y in range(side) ][:num_blocks]
+    for start in block_starts:
+        stop = (start[0] + BLOCK_SIZE, start[1] + BLOCK_SIZE)
+        cache.setInSlot(cache.Input, (), SubRegion(cache.Input, start, stop), block)
+    assert len(cache._block_data) == num_blocks + int(small_first)
+
+    # small rois inside random blocks
+    rng = numpy.random.RandomState(0)
+    queries = []
+    for i in rng.randint(0, num_blocks, NUM_QUERIES):
+        start = numpy.array(block_starts[i]) + 1
+        queries.append( cache._standardize_roi( start, start + BLOCK_SIZE//2 ) )
+
+    def indexedContaining(roi):
+        with cache._lock:
+            assert cache._get_containing_block_roi(roi) is not None
+    indexed_lookup = median_time( indexedContaining, [(q,) for q in queries] )
+    linear_queries = [(cache, q) for q in queries[:NUM_LINEAR_QUERIES]]
+    linear_lookup = median_time( linearContaining, linear_queries )
+    linear_dirty = median_time( linearIntersecting, linear_queries )
+
+    # Each query frees (at most) one block, like a small brush stroke.
+    # (The cache is its own downstream, dirtiness stops there.)
+    dirty_rois = [ (SubRegion(cache.Input, *q),) for q in queries ]
+    propagate = median_time( lambda roi: cache.propagateDirty(cache.Input, (), roi), dirty_rois )
+    assert len(cache._block_data) < num_blocks + int(small_first)
+    return indexed_lookup, linear_lookup, propagate, linear_dirty
+
+if __name__ == "__main__":
+    block_counts = [10**3, 10**4, 10**5]
+    if len(sys.argv) > 1:
+        block_counts = map(int, sys.argv[1:])
+
+    # No cleanups in the background
+    CacheMemoryManager().disable()
+
+    print "median latency over {} queries ({} for the linear search), blocks of {}x{} pixels"\
+          .format( NUM_QUERIES, NUM_LINEAR_QUERIES, BLOCK_SIZE, BLOCK_SIZE )
+    for num_blocks in block_counts:
+        for small_first in (False, True):
+            lookup, linear_lookup, propagate, linear_dirty = measure(num_blocks, small_first)
+            print "{:>7} blocks{}:  lookup: {:7.1f}us (linear: {:9.1f}us)  "\
+                  "propagateDirty: {:7.1f}us (linear dirty query alone: {:9.1f}us)"\
+                  .format( num_blocks, " (small first)" if small_first else "              ",
+                           lookup*1e6, linear_lookup*1e6, propagate*1e6, linear_dirty*1e6 )
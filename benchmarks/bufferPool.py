@@ -0,0 +1,109 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+"""
+Allocation-heavy graph: many block-sized requests through a chain of operators,
+each of which allocates a fresh scratch array per request.
+
+Compares plain numpy scratch allocations with allocations from the default BufferPool.
+(Request results are always plain numpy arrays.)
+"""
+import gc
+import time
+
+import numpy
+
+from lazyflow.graph import Graph, Operator, InputSlot, OutputSlot
+from lazyflow.request import RequestPool
+from lazyflow.roi import getIntersectingBlocks, getBlockBounds
+from lazyflow.utility import Memory, default_buffer_pool
+
+SHAPE = (200, 1024, 1024)
+BLOCKSHAPE = (10, 256, 256)
+CHAIN_LENGTH = 4
+NUM_PASSES = 3
+
+class OpScale(Operator):
+    """
+    Multiplies its input by 2, via a (pooled) temporary array.
+    """
+    Input = InputSlot()
+    Output = OutputSlot()
+
+    def setupOutputs(self):
+        self.Output.meta.assignFrom(self.Input.meta)
+
+    def execute(self, slot, subindex, roi, result):
+        data = self.Input.stype.allocateDestination(roi, pooled=True)
+        self.Input(roi.start, roi.stop).writeInto(data).wait()
+        numpy.multiply(data, 2, out=result)
+        return result
+
+    def propagateDirty(self, slot, subindex, roi):
+        self.Output.setDirty(roi)
+
+def build_graph():
+    graph = Graph()
+    data = numpy.ones( SHAPE, dtype=numpy.float32 )
+    upstream = None
+    for _ in range(CHAIN_LENGTH):
+        op = OpScale( graph=graph )
+        if upstream is None:
+            op.Input.setValue( data )
+        else:
+            op.Input.connect( upstream.Output )
+        upstream = op
+    return upstream
+
+def measure(enabled):
+    default_buffer_pool.enabled = enabled
+    default_buffer_pool.clear()
+    default_buffer_pool.reset_stats()
+    gc.collect()
+
+    op = build_graph()
+    block_starts = getIntersectingBlocks( BLOCKSHAPE, ((0,)*len(SHAPE), SHAPE) )
+    rss_before = Memory.getMemoryUsage()
+    t1 = time.time()
+    for _ in range(NUM_PASSES):
+        pool = RequestPool()
+        for block_start in block_starts:
+            block_roi = getBlockBounds( SHAPE, BLOCKSHAPE, block_start )
+            pool.add( op.Output(*block_roi) )
+        pool.wait()
+        pool.clean()
+    t2 = time.time()
+    rss_after = Memory.getMemoryUsage()
+    return t2-t1, rss_after-rss_before
+
+if __name__ == "__main__":
+    num_blocks = len( getIntersectingBlocks( BLOCKSHAPE, ((0,)*len(SHAPE), SHAPE) ) )
+    print "{} passes over {} blocks of {} through {} operators".format( NUM_PASSES, num_blocks, BLOCKSHAPE, CHAIN_LENGTH )
+
+    duration, rss_increase = measure(False)
+    print "  numpy allocations: {:6.2f}s  RSS increase: {}".format( duration, Memory.format(rss_increase) )
+
+    duration, rss_increase = measure(True)
+    stats = default_buffer_pool.stats()
+    print "  buffer pool:       {:6.2f}s  RSS increase: {}  reuse rate: {:.1f}% ({} of {} allocations, {} reused)"\
+          .format( duration, Memory.format(rss_increase), 100*stats['reuse_rate'],
+                   stats['reused'], stats['allocations'], Memory.format(stats['reused_bytes']) )
+    default_buffer_pool.enabled = True
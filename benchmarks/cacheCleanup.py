@@ -0,0 +1,138 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+"""
+Latency of a CacheMemoryManager cleanup pass, against the number of
+cached blocks.
+
+Caches with indexedBlocks = True keep the manager's eviction index up to
+date whenever they store, access or free a block, so a cleanup pass only
+pops its victims from the index. The blocks of other caches are collected
+with getBlockCosts() and sorted in every pass. Each pass here frees
+NUM_VICTIMS blocks, which are then stored again.
+"""
+import gc
+import sys
+import time
+
+from lazyflow.operators.opCache import ManagedBlockedCache
+from lazyflow.operators.cacheMemoryManager import CacheMemoryManager
+from lazyflow.utility import Memory
+
+NUM_VICTIMS = 1000
+NUM_PASSES = 5
+
+class FakeBlockedCache(ManagedBlockedCache):
+    """
+    Blocks of one byte each, without any data.
+    """
+    def __init__(self, name, indexed):
+        self.name = name
+        self.parent = None
+        self.children = []
+        self.indexedBlocks = indexed
+        self._manager = CacheMemoryManager()
+        self._access_times = {}
+        self.registerWithMemoryManager()
+
+    def addBlock(self, block_id):
+        self._access_times[block_id] = time.time()
+        if self.indexedBlocks:
+            self._manager.blockAdded(self, block_id, 1)
+
+    def usedMemory(self):
+        return len(self._access_times)
+
+    def fractionOfUsedMemoryDirty(self):
+        return 0.0
+
+    def getBlockAccessTimes(self):
+        return self._access_times.items()
+
+    def getBlockCosts(self):
+        return [(k, t, 0.0, 1) for k, t in self._access_times.iteritems()]
+
+    def freeBlock(self, block_id):
+        if self._access_times.pop(block_id, None) is None:
+            return 0
+        if self.indexedBlocks:
+            self._manager.blockRemoved(self, block_id)
+        return 1
+
+    def freeMemory(self):
+        mem = len(self._access_times)
+        for block_id in self._access_times.keys():
+            self.freeBlock(block_id)
+        return mem
+
+    def freeDirtyMemory(self):
+        return 0.0
+
+def measure(num_blocks, indexed):
+    """
+    Return the time to store a block and the median latency of a cleanup pass (in seconds).
+    """
+    mgr = CacheMemoryManager()
+    cache = FakeBlockedCache("cache", indexed)
+
+    t1 = time.time()
+    for i in xrange(num_blocks):
+        cache.addBlock(i)
+    t2 = time.time()
+
+    # Free NUM_VICTIMS blocks per pass
+    Memory.setAvailableRamCaches(num_blocks - 1)
+    target_usage = mgr._target_usage
+    mgr._target_usage = (num_blocks - NUM_VICTIMS) / float(num_blocks - 1)
+    latencies = []
+    try:
+        for i in range(NUM_PASSES):
+            t3 = time.time()
+            mgr._cleanup()
+            latencies.append( time.time() - t3 )
+            assert cache.usedMemory() == num_blocks - NUM_VICTIMS
+            for block_id in xrange(num_blocks + i*NUM_VICTIMS, num_blocks + (i+1)*NUM_VICTIMS):
+                cache.addBlock(block_id)
+    finally:
+        mgr._target_usage = target_usage
+        Memory.setAvailableRamCaches(-1)
+
+    del cache
+    gc.collect()
+    return (t2 - t1)/num_blocks, sorted(latencies)[len(latencies)//2]
+
+if __name__ == "__main__":
+    block_counts = [10**5, 10**6]
+    if len(sys.argv) > 1:
+        block_counts = map(int, sys.argv[1:])
+
+    # No cleanups in the background
+    CacheMemoryManager().disable()
+
+    print "cleanup pass that frees {} blocks (median of {} passes)".format( NUM_VICTIMS, NUM_PASSES )
+    for num_blocks in block_counts:
+        polled_insert, polled_latency = measure(num_blocks, False)
+        indexed_insert, indexed_latency = measure(num_blocks, True)
+        print "{:>8} blocks:  polled: {:8.1f}ms ({:.1f}us/insert)  indexed: {:8.1f}ms ({:.1f}us/insert)  ({:.1f}x)"\
+              .format( num_blocks,
+                       polled_latency*1000.0, polled_insert*1e6,
+                       indexed_latency*1000.0, indexed_insert*1e6,
+                       polled_latency/indexed_latency )
@@ -0,0 +1,127 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+"""
+Replay of a cache access trace under different eviction policies.
+
+Each line of a trace describes one block access:
+
+    <block id> <compute time in seconds> <size in bytes>
+
+A miss costs the compute time of the block, which is then inserted into
+the (simulated) cache. Like the CacheMemoryManager, the replay runs a
+cleanup pass every CLEANUP_INTERVAL accesses, which frees the blocks
+with the lowest priority until the cache is back to 90% of its limit.
+
+Run with a recorded trace file as the first argument, or without one to
+use a synthetic trace of a viewer session: the user pans around a volume
+and looks at the raw data (cheap to reload) and at predictions (expensive
+to compute), and now and then scrolls through raw data only.
+"""
+import sys
+import random
+
+from lazyflow.utility import PriorityQueue
+from lazyflow.operators.cacheMemoryManager import LRUEvictionPolicy, GreedyDualSizeEvictionPolicy
+
+BLOCK_SIZE = 2*2**20 # 2 MiB
+CACHE_LIMIT = 200*BLOCK_SIZE
+TARGET_USAGE = 0.9
+CLEANUP_INTERVAL = 20
+NUM_ACCESSES = 20000
+
+def synthetic_trace(seed=0):
+    """
+    A list of (block id, compute time, size) tuples.
+    """
+    rng = random.Random(seed)
+    raw_cost = 0.001
+    prediction_cost = 40.0
+    num_tiles = 2000
+    hot_tiles = range(150)
+
+    trace = []
+    while len(trace) < NUM_ACCESSES:
+        if rng.random() < 0.3:
+            # scroll through some raw data
+            start = rng.randrange(num_tiles)
+            for tile in range(start, min(start + 50, num_tiles)):
+                trace.append( ("raw {}".format(tile), raw_cost, BLOCK_SIZE) )
+        else:
+            # look at raw data and predictions around the region of interest
+            tile = int( rng.paretovariate(1.2) ) % len(hot_tiles)
+            trace.append( ("raw {}".format(tile), raw_cost, BLOCK_SIZE) )
+            trace.append( ("prediction {}".format(tile), prediction_cost, BLOCK_SIZE) )
+    return trace[:NUM_ACCESSES]
+
+def load_trace(filename):
+    trace = []
+    with open(filename) as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            block_id, compute_time, size = line.rsplit(None, 2)
+            trace.append( (block_id, float(compute_time), int(size)) )
+    return trace
+
+def replay(trace, policy):
+    """
+    Return the total recomputation time and the hit rate.
+    """
+    blocks = {} # block id : [access time, compute time, size]
+    used = 0
+    recompute_time = 0.0
+    hits = 0
+    for now, (block_id, compute_time, size) in enumerate(trace):
+        if block_id in blocks:
+            blocks[block_id][0] = now
+            hits += 1
+        else:
+            blocks[block_id] = [now, compute_time, size]
+            used += size
+            recompute_time += compute_time
+
+        if now % CLEANUP_INTERVAL == 0 and used > CACHE_LIMIT:
+            q = PriorityQueue()
+            for key, (t, c, s) in blocks.items():
+                q.push( (policy.priority(t, c, s), key) )
+            policy.forget( min( t for t, c, s in blocks.values() ) )
+            while used > TARGET_USAGE * CACHE_LIMIT and len(q) > 0:
+                priority, key = q.pop()
+                used -= blocks.pop(key)[2]
+                policy.evicted(priority, now)
+    return recompute_time, hits/float(len(trace))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        trace = load_trace(sys.argv[1])
+    else:
+        trace = synthetic_trace()
+
+    print "{} accesses, {} distinct blocks, cache limit: {} MiB"\
+          .format( len(trace), len(set(block_id for block_id, _, _ in trace)), CACHE_LIMIT/2**20 )
+    results = []
+    for name, policy in [ ("LRU", LRUEvictionPolicy()),
+                          ("GreedyDual-Size", GreedyDualSizeEvictionPolicy()) ]:
+        recompute_time, hit_rate = replay(trace, policy)
+        results.append(recompute_time)
+        print "{:>16}: recomputation time: {:10.1f}s  hit rate: {:5.1f}%".format( name, recompute_time, hit_rate*100 )
+    print "{:>16}: {:.2f}x less recomputation".format( "", results[0]/results[1] )
@@ -0,0 +1,103 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+"""
+Import time of lazyflow.
+
+The modules of the lazyflow package, and the operator modules in
+lazyflow.operators, are only imported when they are first accessed.
+So 'import lazyflow' shouldn't pull in vigra, h5py, psutil, vigraOperators,
+the classifiers, etc.  Each import is timed in a fresh interpreter
+(the best of NUM_REPETITIONS runs is reported).
+
+The script exits with an error if 'import lazyflow' imports any of the
+DEFERRED_MODULES.  Pass --max-seconds=X to also fail if it takes longer
+than X seconds, e.g. to catch regressions in a CI job.
+
+Remaining gap: lazyflow.graph (and therefore every operator) still imports
+vigra (in slot and stype) and psutil (graph's version check)
+eagerly.  Only the bare package import and the operator registry are lazy.
+"""
+import ast
+import sys
+import subprocess
+
+NUM_REPETITIONS = 5
+
+# Modules that should only be imported once an operator that needs them is used.
+DEFERRED_MODULES = [ 'vigra',
+                     'h5py',
+                     'psutil',
+                     'lazyflow.operators.generic',
+                     'lazyflow.operators.vigraOperators',
+                     'lazyflow.operators.classifierOperators',
+                     'lazyflow.operators.opBlockedArrayCache',
+                     'lazyflow.classifiers',
+                     'sklearn' ]
+
+SCENARIOS = [ ("import lazyflow", "import lazyflow"),
+              ("import lazyflow.graph", "import lazyflow.graph"),
+              ("from lazyflow.operators import OpArrayPiper", "from lazyflow.operators import OpArrayPiper"),
+              ("from lazyflow.operators import OpPixelFeaturesPresmoothed", "from lazyflow.operators import OpPixelFeaturesPresmoothed") ]
+
+MEASURE_TEMPLATE = """
+import sys, time
+start = time.time()
+{statement}
+stop = time.time()
+loaded = [ m for m in {deferred!r} if sys.modules.get(m) is not None ]
+print repr( (stop - start, len(sys.modules), loaded) )
+"""
+
+def measure(statement):
+    """
+    Run the statement in a fresh interpreter.
+    Return (seconds, number of loaded modules, deferred modules that were loaded anyway).
+    """
+    code = MEASURE_TEMPLATE.format( statement=statement, deferred=DEFERRED_MODULES )
+    output = subprocess.check_output( [sys.executable, '-c', code] )
+    return ast.literal_eval( output.strip().split('\n')[-1] )
+
+def best_of(statement):
+    results = [ measure(statement) for _ in range(NUM_REPETITIONS) ]
+    return min( results, key=lambda r: r[0] )
+
+if __name__ == "__main__":
+    max_seconds = None
+    for arg in sys.argv[1:]:
+        if arg.startswith('--max-seconds='):
+            max_seconds = float( arg[len('--max-seconds='):] )
+
+    import_time = None
+    for description, statement in SCENARIOS:
+        seconds, num_modules, loaded = best_of(statement)
+        if import_time is None:
+            import_time, import_loaded = seconds, loaded
+        print "{:>60}: {:7.1f}ms ({:4d} modules)".format( description, seconds*1000.0, num_modules )
+        if loaded:
+            print "{:>60}  also imported: {}".format( '', ', '.join(loaded) )
+
+    if import_loaded:
+        print "FAILED: 'import lazyflow' imported {}".format( ', '.join(import_loaded) )
+        sys.exit(1)
+    if max_seconds is not None and import_time > max_seconds:
+        print "FAILED: 'import lazyflow' took {:.1f}ms (limit: {:.1f}ms)".format( import_time*1000.0, max_seconds*1000.0 )
+        sys.exit(1)
@@ -0,0 +1,111 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+"""
+Reconfiguration time of a large graph after a meta data change at its source.
+
+Operators that declare their metaDependencies skip setupOutputs() if only
+other meta data keys change (e.g. the display_mode), and merely copy the
+new values to their outputs.  This benchmark compares that with the
+full setupOutputs() cascade (all declarations removed).
+"""
+import time
+
+import numpy
+
+from lazyflow.graph import Graph, Operator, InputSlot, OutputSlot
+from lazyflow.operators import OpArrayPiper, OpPixelOperator
+from lazyflow.operators.opUnblockedArrayCache import OpUnblockedArrayCache
+
+NUM_BRANCHES = 10
+BRANCH_LENGTH = 30 # 300 operators in total
+NUM_REPETITIONS = 20
+
+DECLARING_OPERATORS = [ OpArrayPiper, OpPixelOperator, OpUnblockedArrayCache ]
+
+class OpSource(Operator):
+    Input = InputSlot()
+    ExtraMeta = InputSlot()
+    Output = OutputSlot()
+
+    def setupOutputs(self):
+        self.Output.meta.assignFrom(self.Input.meta)
+        self.Output.meta.update(self.ExtraMeta.value)
+
+    def execute(self, slot, subindex, roi, result):
+        self.Input(roi.start, roi.stop).writeInto(result).wait()
+
+    def propagateDirty(self, slot, subindex, roi):
+        # Meta data changes don't make the data dirty.
+        # (We only want to measure the reconfiguration.)
+        if slot is self.Input:
+            self.Output.setDirty(roi)
+
+def build_graph():
+    graph = Graph()
+    opSource = OpSource( graph=graph )
+    opSource.Input.setValue( numpy.zeros( (100,100), dtype=numpy.float32 ) )
+    opSource.ExtraMeta.setValue( { 'drange' : (0,1), 'display_mode' : 'grayscale' } )
+
+    operators = []
+    for _ in range(NUM_BRANCHES):
+        upstream = opSource.Output
+        for i in range(BRANCH_LENGTH):
+            if i % 3 == 0:
+                op = OpArrayPiper( graph=graph )
+            elif i % 3 == 1:
+                op = OpUnblockedArrayCache( graph=graph )
+            else:
+                op = OpPixelOperator( graph=graph )
+                op.Function.setValue( lambda a: a+1 )
+            op.Input.connect( upstream )
+            upstream = op.Output
+            operators.append(op)
+    return opSource, operators
+
+def measure(key, values):
+    opSource, operators = build_graph()
+    setups_before = sum( op._setup_count for op in operators )
+    t1 = time.time()
+    for i in range(NUM_REPETITIONS):
+        opSource.ExtraMeta.setValue( { 'drange' : (0,1), 'display_mode' : 'grayscale', key : values[i % 2] } )
+    t2 = time.time()
+    setups = sum( op._setup_count for op in operators ) - setups_before
+    return (t2-t1)*1000.0/NUM_REPETITIONS, setups/float(NUM_REPETITIONS)
+
+def measure_without_declarations(key, values):
+    declarations = [ (cls, cls.__dict__['metaDependencies']) for cls in DECLARING_OPERATORS ]
+    for cls, _ in declarations:
+        cls.metaDependencies = None
+    try:
+        return measure(key, values)
+    finally:
+        for cls, dependencies in declarations:
+            cls.metaDependencies = dependencies
+
+if __name__ == "__main__":
+    print "{} operators, {} repetitions".format( NUM_BRANCHES*BRANCH_LENGTH, NUM_REPETITIONS )
+    for key, values in [ ('display_mode', ('grayscale', 'rgba')),
+                         ('drange', ((0,1), (0,2))) ]:
+        full_time, full_setups = measure_without_declarations(key, values)
+        incremental_time, incremental_setups = measure(key, values)
+        print "{:>13} change:  full: {:8.2f}ms ({:5.1f} setups)  incremental: {:8.2f}ms ({:5.1f} setups)  ({:.2f}x)"\
+              .format( key, full_time, full_setups, incremental_time, incremental_setups, full_time/incremental_time )
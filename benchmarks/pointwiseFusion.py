@@ -0,0 +1,84 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+"""
+Fused execution of a chain of pointwise operators (see lazyflow.fusion):
+OpConvertDtype -> OpPixelOperator -> OpConvertDtype -> OpDtypeView
+
+Without fusion, each operator allocates its own result array and executes its own request.
+With fusion, the chain runs as a single request: the source is requested once,
+and the stages are applied chunk by chunk, directly into the final result array.
+"""
+import time
+
+import numpy
+
+from lazyflow.graph import Graph
+from lazyflow import fusion
+from lazyflow.operators import OpArrayPiper
+from lazyflow.operators.generic import OpPixelOperator, OpConvertDtype, OpDtypeView
+
+NUM_REPETITIONS = 10
+SHAPES = ( (10,10), (256,256), (50,512,512) )
+
+def build_chain(shape):
+    graph = Graph()
+    data = numpy.random.randint( 0, 255, size=shape ).astype( numpy.uint8 )
+
+    opSource = OpArrayPiper( graph=graph )
+    opSource.Input.setValue( data )
+
+    opConvert = OpConvertDtype( graph=graph )
+    opConvert.Input.connect( opSource.Output )
+    opConvert.ConversionDtype.setValue( numpy.float32 )
+
+    opPixel = OpPixelOperator( graph=graph )
+    opPixel.Input.connect( opConvert.Output )
+    opPixel.Function.setValue( fusion.pointwise( lambda x: x*0.5 + 1 ) )
+
+    opConvert2 = OpConvertDtype( graph=graph )
+    opConvert2.Input.connect( opPixel.Output )
+    opConvert2.ConversionDtype.setValue( numpy.uint32 )
+
+    opView = OpDtypeView( graph=graph )
+    opView.Input.connect( opConvert2.Output )
+    opView.OutputDtype.setValue( numpy.int32 )
+    return opView
+
+def measure(shape, enabled, repetitions):
+    output = build_chain(shape).Output
+    fusion.enabled = enabled
+    try:
+        t1 = time.time()
+        for _ in xrange(repetitions):
+            output[:].wait()
+        t2 = time.time()
+    finally:
+        fusion.enabled = True
+    return (t2-t1)*1000.0/repetitions
+
+if __name__ == "__main__":
+    for shape in SHAPES:
+        repetitions = NUM_REPETITIONS * max(1, 10000 // numpy.prod(shape))
+        unfused = measure(shape, False, repetitions)
+        fused = measure(shape, True, repetitions)
+        print "shape {:>14}:  unfused: {:9.3f}ms  fused: {:9.3f}ms  ({:.2f}x)"\
+              .format( shape, unfused, fused, unfused/fused )
@@ -0,0 +1,108 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+"""
+Compare the ThreadPool and the ProcessPool backends on a GIL-bound operator.
+
+The operator computes a histogram entropy for every small patch of each slice
+in a pure-Python loop (similar to the histogramming in OpDetectMissing),
+so the request ThreadPool cannot run it in parallel.
+"""
+import time
+import multiprocessing
+
+import numpy
+
+from lazyflow.graph import Graph
+from lazyflow.operator import Operator
+from lazyflow.slot import InputSlot, OutputSlot
+from lazyflow.request import Request, RequestPool, ProcessPool
+
+SHAPE = (64, 256, 256)
+PATCH_SIZE = 8
+NUM_BINS = 16
+
+def patch_entropy(data):
+    """
+    For every patch of every slice, compute the entropy of the patch's histogram.
+    Must be a module-level function, so it can be sent to the worker processes.
+    """
+    result = numpy.zeros(data.shape, dtype=numpy.float32)
+    for z in range(data.shape[0]):
+        for y in range(0, data.shape[1], PATCH_SIZE):
+            for x in range(0, data.shape[2], PATCH_SIZE):
+                patch = data[z, y:y+PATCH_SIZE, x:x+PATCH_SIZE]
+                hist = numpy.bincount( patch.ravel() / (256 / NUM_BINS), minlength=NUM_BINS )
+                p = hist[hist > 0] / float(patch.size)
+                result[z, y:y+PATCH_SIZE, x:x+PATCH_SIZE] = -(p*numpy.log(p)).sum()
+    return result
+
+class OpPatchEntropy(Operator):
+    Input = InputSlot()
+    UseProcessPool = InputSlot(value=False)
+    Output = OutputSlot()
+
+    def setupOutputs(self):
+        self.Output.meta.assignFrom(self.Input.meta)
+        self.Output.meta.dtype = numpy.float32
+
+    def execute(self, slot, subindex, roi, result):
+        data = self.Input(roi.start, roi.stop).wait()
+        if self.UseProcessPool.value:
+            ProcessPool.global_process_pool.apply( patch_entropy, data, out=result )
+        else:
+            result[:] = patch_entropy(data)
+
+    def propagateDirty(self, slot, subindex, roi):
+        self.Output.setDirty()
+
+def measure(op, use_process_pool):
+    op.UseProcessPool.setValue(use_process_pool)
+
+    t1 = time.time()
+    pool = RequestPool()
+    for z in range(SHAPE[0]):
+        pool.add( op.Output( (z, 0, 0), (z+1,) + SHAPE[1:] ) )
+    pool.wait()
+    t2 = time.time()
+    return t2 - t1
+
+if __name__ == "__main__":
+    num_workers = multiprocessing.cpu_count()
+    Request.reset_thread_pool(num_workers)
+
+    # Fork the worker processes before the graph is built
+    ProcessPool.reset_global_process_pool(num_workers)
+
+    data = numpy.random.randint(0, 256, size=SHAPE).astype(numpy.uint8)
+
+    graph = Graph()
+    op = OpPatchEntropy(graph=graph)
+    op.Input.setValue(data)
+
+    print "Workers: {}, volume: {}, one request per slice".format( num_workers, SHAPE )
+    thread_time = measure(op, False)
+    print "THREAD POOL:   {:.3f} seconds".format( thread_time )
+    process_time = measure(op, True)
+    print "PROCESS POOL:  {:.3f} seconds".format( process_time )
+    print "SPEED-UP:      {:.2f}x".format( thread_time / process_time )
+
+    ProcessPool.global_process_pool.stop()
@@ -0,0 +1,78 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+"""
+Microbenchmark for the fixed cost of a single Request:
+creation, submission and waiting, without any real workload.
+
+Run this before and after changing request.py to make regressions visible.
+"""
+import gc
+import time
+import functools
+
+from lazyflow.request import Request
+
+NUM_REQUESTS = 20000
+NESTING_DEPTH = 20
+
+def empty_func():
+    pass
+
+def create(num_requests):
+    requests = [ Request(empty_func) for _ in xrange(num_requests) ]
+
+def create_and_wait(num_requests):
+    for _ in xrange(num_requests):
+        Request(empty_func).wait()
+
+def fan_out(num_requests):
+    requests = [ Request(empty_func) for _ in xrange(num_requests) ]
+    for req in requests:
+        req.submit()
+    for req in requests:
+        req.wait()
+
+def nested(num_requests):
+    # Create the requests NESTING_DEPTH levels deep in the request tree
+    def create_at_depth(depth):
+        if depth > 0:
+            return Request( functools.partial(create_at_depth, depth-1) ).wait()
+        create_and_wait(num_requests)
+    create_at_depth(NESTING_DEPTH)
+
+def measure(workload, within_request):
+    gc.collect()
+    t1 = time.time()
+    if within_request:
+        Request( functools.partial(workload, NUM_REQUESTS) ).wait()
+    else:
+        workload(NUM_REQUESTS)
+    t2 = time.time()
+    return (t2-t1)*1e6/NUM_REQUESTS
+
+if __name__ == "__main__":
+    print "{} requests, {} workers".format( NUM_REQUESTS, Request.global_thread_pool.num_workers )
+    print "CREATE:                        {:7.2f}us per request".format( measure(create, False) )
+    print "CREATE + WAIT (FOREIGN):       {:7.2f}us per request".format( measure(create_and_wait, False) )
+    print "CREATE + WAIT (IN REQUEST):    {:7.2f}us per request".format( measure(create_and_wait, True) )
+    print "CREATE + SUBMIT + WAIT:        {:7.2f}us per request".format( measure(fan_out, True) )
+    print "CREATE + WAIT (DEPTH {}):      {:7.2f}us per request".format( NESTING_DEPTH, measure(nested, True) )
@@ -0,0 +1,76 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+"""
+Measure the scheduling overhead per request of the default ThreadPool
+and the WorkStealingThreadPool, for various numbers of workers.
+
+The workload is a single root request that fans out many tiny child
+requests and waits for all of them, which is the typical pattern of a
+blockwise feature computation.
+"""
+import time
+import functools
+
+from lazyflow.request import Request, RequestPool
+
+NUM_REQUESTS = 20000
+
+def empty_func(b):
+    a = 7 + b
+
+def fan_out(num_requests):
+    requests = []
+    for i in range(num_requests):
+        req = Request(functools.partial(empty_func, b = 11))
+        req.submit()
+        requests.append(req)
+
+    for r in requests:
+        r.wait()
+
+def fan_out_pool(num_requests):
+    pool = RequestPool()
+    for i in range(num_requests):
+        pool.add( Request(functools.partial(empty_func, b = 11)) )
+    pool.wait()
+
+def measure(workload, num_workers, work_stealing):
+    Request.reset_thread_pool(num_workers, work_stealing=work_stealing)
+
+    # Make sure the workload runs entirely within greenlets.
+    t1 = time.time()
+    req = Request( functools.partial( workload, NUM_REQUESTS ) )
+    req.submit()
+    req.wait()
+    t2 = time.time()
+    return t2 - t1
+
+if __name__ == "__main__":
+    for workload in (fan_out, fan_out_pool):
+        print "\n\n"
+        print "WORKLOAD: {} ({} requests)".format( workload.__name__, NUM_REQUESTS )
+        for num_workers in (1, 8, 32):
+            for work_stealing in (False, True):
+                total = measure(workload, num_workers, work_stealing)
+                pool_name = "work-stealing" if work_stealing else "default"
+                print "  {:>2} workers, {:>13} pool:  {:.3f} seconds,  {:.2f}us per request"\
+                      .format( num_workers, pool_name, total, total*1e6/NUM_REQUESTS )
@@ -19,17 +19,45 @@
 # This information is also available on the ilastik web site at:
 #		   http://ilastik.org/license/
 ###############################################################################
+"""
+The modules of this package (e.g. ``lazyflow.graph``) can be accessed as
+attributes after a plain ``import lazyflow``.  They are only imported on
+first access, so importing the package itself doesn't pull in vigra, h5py,
+psutil, etc.  See benchmarks/importTime.py.
+"""
 try:
     import faulthandler
     faulthandler.enable()
 except ImportError:
     pass
 
-import utility
-import roi
-import rtype
-import stype
-import operators
-import request
-import graph
-import slot
+import os
+import sys
+import types
+import importlib
+
+def _isSubmodule(name):
+    package_dir = os.path.dirname(__file__)
+    return ( os.path.exists( os.path.join(package_dir, name + '.py') )
+             or os.path.exists( os.path.join(package_dir, name + '.pyc') )
+             or os.path.exists( os.path.join(package_dir, name, '__init__.py') ) )
+
+class _LazyPackage(types.ModuleType):
+    """
+    Stands in for this package in sys.modules, so that its modules can be
+    imported on first attribute access.
+    (Python 2 modules can't define __getattr__ themselves.)
+    """
+    def __getattr__(self, name):
+        if name.startswith('__') or not _isSubmodule(name):
+            raise AttributeError( "module '{}' has no attribute '{}'".format( __name__, name ) )
+        # (The import stores the module as an attribute of this package.)
+        return importlib.import_module( __name__ + '.' + name )
+
+_lazy_package = _LazyPackage(__name__, __doc__)
+_lazy_package.__dict__.update( sys.modules[__name__].__dict__ )
+
+# Keep the original module alive: when a Python 2 module is garbage
+# collected, its globals (which the functions above still use) are cleared.
+_lazy_package._original_module = sys.modules[__name__]
+sys.modules[__name__] = _lazy_package
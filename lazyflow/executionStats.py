@@ -0,0 +1,289 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+"""
+Per-operator execution statistics.
+
+Example::
+
+    with ExecutionStats() as stats:
+        opExport.run_export()
+    print stats.table()
+
+While an ExecutionStats object is active, every execution of an operator's output slot
+(i.e. every request created by Slot.get()) is measured.  For each operator and slot,
+it counts:
+
+- executes: the number of executions,
+- voxels and bytes: the size of the data produced,
+- total_time: the wall time of the executions (including time spent waiting for upstream requests),
+- blocked_time: the time spent in Request.wait() (i.e. waiting for upstream requests, or computing them),
+- exclusive_time: total_time - blocked_time, i.e. the time spent in the operator itself, and
+- cache_hits, cache_misses: for caches, the executions that did (not) need any upstream executions.
+
+Operators need no changes: the statistics are collected by Slot.RequestExecutionWrapper.
+(Requests that Slot.get() forwards past an operator don't execute it, so they aren't counted.)
+When no ExecutionStats object is active, this costs a single check per execution,
+and one more per Request.wait() that actually has to wait.
+"""
+import time
+import threading
+import collections
+
+import greenlet
+
+from lazyflow.request import Request
+from lazyflow.slot import Slot
+from lazyflow.operators.opCache import Cache
+
+class SlotStats(object):
+    """
+    The statistics of one output slot of one operator.
+    """
+    __slots__ = ( 'operator', 'slot_name', 'executes', 'voxels', 'bytes',
+                  'total_time', 'blocked_time', 'cache_hits', 'cache_misses' )
+
+    def __init__(self, operator, slot_name):
+        self.operator = operator
+        self.slot_name = slot_name
+        self.executes = 0
+        self.voxels = 0
+        self.bytes = 0
+        self.total_time = 0.0
+        self.blocked_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def exclusive_time(self):
+        return self.total_time - self.blocked_time
+
+    def _add(self, other):
+        self.executes += other.executes
+        self.voxels += other.voxels
+        self.bytes += other.bytes
+        self.total_time += other.total_time
+        self.blocked_time += other.blocked_time
+        self.cache_hits += other.cache_hits
+        self.cache_misses += other.cache_misses
+
+    def __repr__(self):
+        return "<SlotStats {}.{}: {} executes, {:.3f}s exclusive>"\
+               .format( self.operator.name, self.slot_name, self.executes, self.exclusive_time )
+
+class _Frame(object):
+    """
+    A single execution in progress.
+    """
+    __slots__ = ( 'stats', 'blocked_time', 'wait_depth', 'wait_start', 'upstream_executes' )
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.blocked_time = 0.0
+        self.wait_depth = 0
+        self.wait_start = None
+        self.upstream_executes = 0
+
+class ExecutionStats(object):
+    """
+    Collects SlotStats for every operator output slot executed while it is active.
+    Only one ExecutionStats object can be active at a time.
+    """
+    COLUMNS = ( 'executes', 'voxels', 'bytes', 'total_time', 'exclusive_time', 'blocked_time', 'cache_hits', 'cache_misses' )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = collections.OrderedDict()
+
+        # The executions in progress in each greenlet (innermost last).
+        # (Each greenlet only touches its own list.)
+        self._frames_by_greenlet = {}
+
+        # The execution in progress in each request.
+        # Used to find the downstream execution of requests that run in other greenlets.
+        self._frames_by_request = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """
+        Start collecting statistics.
+        """
+        assert Slot._execution_stats is None, "Another ExecutionStats object is already active."
+        Slot._execution_stats = self
+        Request._wait_listener = self._waiting
+
+    def stop(self):
+        """
+        Stop collecting statistics.  Executions that are still in progress are still counted when they finish.
+        """
+        if Slot._execution_stats is self:
+            Slot._execution_stats = None
+            Request._wait_listener = None
+
+    def reset(self):
+        """
+        Discard the statistics collected so far.
+        """
+        with self._lock:
+            self._stats.clear()
+
+    def slots(self):
+        """
+        Return the SlotStats of all slots executed so far.
+        """
+        with self._lock:
+            return list(self._stats.values())
+
+    def operators(self):
+        """
+        Return the statistics of all operators executed so far, summed over their slots.
+        (The slot_name of each returned SlotStats is '*'.)
+        """
+        totals = collections.OrderedDict()
+        for slot_stats in self.slots():
+            total = totals.get(slot_stats.operator)
+            if total is None:
+                total = totals[slot_stats.operator] = SlotStats(slot_stats.operator, '*')
+            total._add(slot_stats)
+        return totals.values()
+
+    def table(self, sort_by='exclusive_time', per_operator=False, limit=None):
+        """
+        Return a text table of the statistics, most costly first.
+
+        :param sort_by: The column to sort by (see COLUMNS).
+        :param per_operator: If True, sum the statistics of each operator's slots.
+        :param limit: The maximum number of rows.
+        """
+        assert sort_by in self.COLUMNS, "Unknown column: {}".format( sort_by )
+        rows = self.operators() if per_operator else self.slots()
+        rows = sorted( rows, key=lambda s: getattr(s, sort_by), reverse=True )[:limit]
+
+        lines = [ "{:<40} {:>9} {:>12} {:>10} {:>10} {:>10} {:>10} {:>7} {:>7}"
+                  .format( "operator.slot", "executes", "voxels", "MB", "total ms", "excl ms", "blocked ms", "hits", "misses" ) ]
+        for s in rows:
+            name = "{}.{}".format( s.operator.name, s.slot_name )
+            lines.append( "{:<40} {:>9} {:>12} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>7} {:>7}"
+                          .format( name[:40], s.executes, s.voxels, s.bytes / 1e6,
+                                   1000*s.total_time, 1000*s.exclusive_time, 1000*s.blocked_time,
+                                   s.cache_hits, s.cache_misses ) )
+        return "\n".join(lines)
+
+    def __str__(self):
+        return self.table()
+
+    #
+    # Hooks
+    #
+
+    def measure(self, wrapper, destination):
+        """
+        Execute the given Slot.RequestExecutionWrapper and record its statistics.
+        Called by the wrapper itself.
+        """
+        current_greenlet = greenlet.getcurrent()
+        current_request = Request._current_request()
+        frames = self._frames_by_greenlet.get(current_greenlet)
+        if frames:
+            parent = frames[-1]
+        else:
+            frames = self._frames_by_greenlet[current_greenlet] = []
+            parent = self._find_parent_frame(current_request)
+        if parent is not None:
+            parent.upstream_executes += 1
+
+        frame = _Frame( self._slot_stats(wrapper) )
+        frames.append(frame)
+        if current_request is not None:
+            self._frames_by_request[current_request] = frame
+
+        result = None
+        start = time.time()
+        try:
+            result = wrapper._call(destination)
+            return result
+        finally:
+            total_time = time.time() - start
+            frames.pop()
+            if not frames:
+                del self._frames_by_greenlet[current_greenlet]
+            if current_request is not None:
+                self._frames_by_request.pop(current_request, None)
+            self._record(frame, total_time, result)
+
+    def _waiting(self, started):
+        # Called by Request.wait() before and after waiting for an unfinished request.
+        frames = self._frames_by_greenlet.get( greenlet.getcurrent() )
+        if not frames:
+            return
+        frame = frames[-1]
+        if started:
+            frame.wait_depth += 1
+            if frame.wait_depth == 1:
+                frame.wait_start = time.time()
+        elif frame.wait_depth > 0:
+            frame.wait_depth -= 1
+            if frame.wait_depth == 0:
+                frame.blocked_time += time.time() - frame.wait_start
+
+    def _find_parent_frame(self, request):
+        # The execution that (indirectly) created the given request, if any.
+        while request is not None:
+            request = request.parent_request
+            frame = self._frames_by_request.get(request)
+            if frame is not None:
+                return frame
+        return None
+
+    def _slot_stats(self, wrapper):
+        key = (wrapper.operator, wrapper.slot.name)
+        stats = self._stats.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.get(key)
+                if stats is None:
+                    stats = self._stats[key] = SlotStats( wrapper.operator, wrapper.slot.name )
+        return stats
+
+    def _record(self, frame, total_time, result):
+        results = result if isinstance(result, list) else [result]
+        voxels = sum( getattr(r, 'size', 0) for r in results )
+        nbytes = sum( getattr(r, 'nbytes', 0) for r in results )
+        is_cache = isinstance( frame.stats.operator, Cache )
+
+        stats = frame.stats
+        with self._lock:
+            stats.executes += 1
+            stats.voxels += voxels
+            stats.bytes += nbytes
+            stats.total_time += total_time
+            stats.blocked_time += frame.blocked_time
+            if is_cache:
+                if frame.upstream_executes == 0:
+                    stats.cache_hits += 1
+                else:
+                    stats.cache_misses += 1
@@ -0,0 +1,285 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+"""
+Fused execution of chains of pointwise operators.
+
+Operators such as OpConvertDtype, OpPixelOperator, OpDtypeView and OpReorderAxes compute
+each output element from the corresponding input element (possibly with the axes permuted).
+Such operators describe their output via Operator.pointwiseStage().
+
+When a slot of such an operator is requested, Slot.get() looks for a chain of them
+(see findFusableChain()).  If there is one, the whole chain is executed in a single request:
+the data at the bottom of the chain is requested once (for the whole roi),
+then the stages' functions are applied chunk by chunk,
+and the results are written straight into the final destination.
+Stages that change the dtype only need a chunk-sized scratch buffer.
+Axis permutations and dtype reinterpretations are applied to views of the destination,
+so they cost nothing at all.
+
+User-supplied functions (e.g. of OpPixelOperator) are only fused if they are
+numpy ufuncs or have been marked with pointwise().
+
+The graph itself is not changed: all slots, their meta data and dirty propagation stay intact.
+A chain ends at any slot that has more than one consumer, so shared intermediate results
+are still computed (and cached) as usual.
+"""
+import numpy
+
+#: Set to False to disable operator fusion (e.g. for debugging or benchmarking).
+enabled = True
+
+#: Fused chains are executed in chunks of (roughly) this many bytes,
+#: so their scratch buffers and temporaries stay small (and in the CPU cache).
+CHUNK_BYTES = 1 << 20
+
+def pointwise(function):
+    """
+    Mark the given function as pointwise, i.e. each element of its result depends only on
+    the corresponding element of its input.  Returns the function.
+    Can be used as a decorator, or on lambdas::
+
+        opPixel.Function.setValue( fusion.pointwise( lambda x: x*2+1 ) )
+    """
+    function.pointwise = True
+    return function
+
+def isPointwise(function):
+    """
+    Return True if the given function is known to operate on each element independently.
+    """
+    return isinstance(function, numpy.ufunc) or getattr(function, 'pointwise', False)
+
+class PointwiseStage(object):
+    """
+    Describes how an output slot of an operator can be computed from one of its inputs,
+    element by element.  Returned by Operator.pointwiseStage().
+
+    A stage either
+
+    - maps its input data through a ``function`` that operates on each element independently, or
+    - merely reinterprets the output array: ``input_view(result)`` must return a writable view
+      of the result array with the shape and dtype of the (translated) input roi.
+    """
+    def __init__(self, operator, source, function=None, input_dtype=None, input_view=None, input_roi=None):
+        """
+        :param operator: The operator that owns the stage.
+        :param source: The input slot the output is computed from.
+        :param function: For mapping stages.  Computes the output data from an array of input data.
+        :param input_dtype: For mapping stages.  The dtype of the source data.
+        :param input_view: For view stages. See above.
+        :param input_roi: Optional.  Translates an output roi ``(start, stop)`` to the corresponding roi of the source.
+                          By default, the rois are the same.
+        """
+        assert (function is None) != (input_view is None), "A stage either maps or views its data."
+        self.operator = operator
+        self.source = source
+        self.function = function
+        self.input_dtype = input_dtype
+        self.input_view = input_view
+        self._input_roi = input_roi
+
+    def inputRoi(self, start, stop):
+        if self._input_roi is None:
+            return start, stop
+        return self._input_roi(start, stop)
+
+def executeIsOverridden(op, cls):
+    """
+    Return True if type(op) overrides cls.execute(),
+    in which case the stage that cls describes no longer applies.
+    """
+    return type(op).execute.im_func is not cls.execute.im_func
+
+def findFusableChain(slot):
+    """
+    Return the list of stages that compute the given output slot (starting with the slot's own stage),
+    or None if there is no chain of at least two pointwise stages.
+    """
+    stage = _stageFor(slot)
+    if stage is None:
+        return None
+
+    stages = [stage]
+    while True:
+        upstream = _exclusiveProducer(stage.source)
+        if upstream is None:
+            break
+        stage = _stageFor(upstream)
+        if stage is None:
+            break
+        stages.append(stage)
+
+    if len(stages) < 2:
+        return None
+    return stages
+
+def executeFused(stages, roi, result):
+    """
+    Compute the data of the first stage's output for the given roi into result.
+    """
+    rois = []
+    start, stop = roi.start, roi.stop
+    for stage in stages:
+        start, stop = stage.inputRoi(start, stop)
+        rois.append( (start, stop) )
+
+    # The stages below the last mapping stage merely provide views of its input.
+    mapping = [ k for k, stage in enumerate(stages) if stage.function is not None ]
+    if not mapping:
+        _fetchSource(stages, rois, 0, result)
+        return result
+    last = mapping[-1]
+
+    # The source data is requested once, for the whole roi.
+    data = _sourceBuffer(stages, rois, last, result)
+    _fetchSource(stages, rois, last+1, data)
+
+    # The functions are applied chunk by chunk.
+    source = (last, data, rois[last][0])
+    buffers = {} # stage index -> scratch buffer (reused for all chunks)
+    for axis, begin, end in _chunks(stages[:last+1], result):
+        start, stop = list(roi.start), list(roi.stop)
+        if axis is not None:
+            start[axis], stop[axis] = roi.start[axis] + begin, roi.start[axis] + end
+            dest = result[(slice(None),)*axis + (slice(begin, end),)]
+        else:
+            dest = result
+        chunk_rois = []
+        for stage in stages[:last+1]:
+            start, stop = stage.inputRoi(start, stop)
+            chunk_rois.append( (start, stop) )
+        _fill(stages, chunk_rois, 0, dest, source, buffers)
+    return result
+
+def _stageFor(slot):
+    if slot.level != 0 or slot.meta.has_mask:
+        return None
+    op = slot.getRealOperator()
+    if op is None or op._settingUp:
+        return None
+    return op.pointwiseStage(slot)
+
+def _exclusiveProducer(input_slot):
+    """
+    Follow the connections upstream of the given input slot (through pass-through operators, too)
+    to the output slot that produces its data.
+    Return None if there is no such slot, or if any slot on the way has other consumers.
+    """
+    slot = input_slot
+    while True:
+        if slot._value is not None:
+            return None
+        if slot.partner is not None:
+            slot = slot.partner
+            if len(slot.partners) != 1:
+                return None
+            continue
+        if slot._type == "input":
+            return None
+        op = slot.getRealOperator()
+        if op is None or op._settingUp:
+            return None
+        source = op.forwardingSource(slot)
+        if source is None:
+            return slot
+        slot = source
+
+def _chunks(stages, result):
+    """
+    Split the result into chunks of (roughly) CHUNK_BYTES along its first non-singleton axis,
+    taking the largest dtype of any stage into account.
+    Yield (axis, begin, end) for each chunk, or (None, None, None) for a single chunk.
+    """
+    axes = [ i for i, n in enumerate(result.shape) if n > 1 ]
+    if not axes:
+        yield None, None, None
+        return
+    axis = axes[0]
+    itemsize = max( [result.dtype.itemsize] + [ numpy.dtype(stage.input_dtype).itemsize
+                                                for stage in stages if stage.function is not None ] )
+    slice_bytes = itemsize * int( numpy.prod(result.shape[axis+1:]) )
+    step = max(1, CHUNK_BYTES // slice_bytes)
+    for begin in range(0, result.shape[axis], step):
+        yield axis, begin, min(begin + step, result.shape[axis])
+
+def _sourceBuffer(stages, rois, last, result):
+    """
+    Return the array that holds the input data of stages[last] for the whole roi.
+    If all stages above it compute in place, that's a view of the result itself.
+    """
+    dtype = numpy.dtype(stages[last].input_dtype)
+    data = result
+    for stage in stages[:last]:
+        if stage.input_view is not None:
+            data = stage.input_view(data)
+        elif numpy.dtype(stage.input_dtype) != data.dtype:
+            data = None
+            break
+    if data is None or data.dtype != dtype:
+        start, stop = rois[last]
+        data = numpy.empty( numpy.subtract(stop, start), dtype=dtype )
+    return data
+
+def _fetchSource(stages, rois, k, data):
+    """
+    Request the input data of the chain (for the whole roi) into data,
+    which is the input array of stages[k-1] (or the result, if k == 0).
+    """
+    for stage in stages[k:]:
+        data = stage.input_view(data)
+    stages[-1].source( *rois[-1] ).writeInto(data).wait()
+
+def _fill(stages, rois, k, dest, source, buffers):
+    """
+    Write the output of stages[k] for the current chunk into dest.
+    source is (last, data, origin): the last mapping stage,
+    the input data of that stage and the start of its roi.
+    """
+    stage = stages[k]
+    if stage.input_view is not None:
+        _fill(stages, rois, k+1, stage.input_view(dest), source, buffers)
+        return
+
+    last, data, origin = source
+    if k == last:
+        start, stop = rois[k]
+        src = data[ tuple( slice(a-o, b-o) for a, b, o in zip(start, stop, origin) ) ]
+    else:
+        if numpy.dtype(stage.input_dtype) == dest.dtype:
+            # Compute in place
+            src = dest
+        else:
+            src = _scratch(buffers, k, dest.shape, stage.input_dtype)
+        _fill(stages, rois, k+1, src, source, buffers)
+    dest[...] = stage.function(src)
+
+def _scratch(buffers, k, shape, dtype):
+    """
+    Return an uninitialized array of the given shape and dtype for the input of stages[k].
+    It is backed by the stage's scratch buffer, which is only (re)allocated if it is too small.
+    """
+    dtype = numpy.dtype(dtype)
+    nbytes = int( numpy.prod(shape) ) * dtype.itemsize
+    buf = buffers.get(k)
+    if buf is None or buf.nbytes < nbytes:
+        buf = buffers[k] = numpy.empty( (nbytes,), dtype=numpy.uint8 )
+    return buf[:nbytes].view(dtype).reshape(shape)
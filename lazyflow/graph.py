@@ -78,6 +78,7 @@ from lazyflow.slot import InputSlot, OutputSlot, Slot
 from lazyflow.operator import Operator, InputDict, OutputDict, OperatorMetaClass
 from lazyflow.operatorWrapper import OperatorWrapper
 from lazyflow.metaDict import MetaDict
+from lazyflow.roi import RegionSet
 
 class Graph(object):
     """
@@ -88,6 +89,8 @@ class Graph(object):
         self._setup_depth = 0
         self._sig_setup_complete = None
         self._lock = threading.Lock()
+        self._dirty_batch_depth = 0
+        self._dirty_batch = None # OrderedDict: slot -> RegionSet
 
     def call_when_setup_finished(self, fn):
         # The graph is considered in "setup" mode if any slot is executing a function that affects the state of the graph.
@@ -134,3 +137,79 @@ class Graph(object):
                         self._graph._sig_setup_complete = None
                 if sig_setup_complete:
                     sig_setup_complete()
+
+    def batchDirtyNotifications(self):
+        """
+        Return a context manager that defers all dirty notifications of this graph
+        until the (outermost) context exits.  Use it around bursts of edits, e.g.:
+
+        .. code-block:: python
+
+            with graph.batchDirtyNotifications():
+                for key, value in brush_strokes:
+                    op.Input[key] = value
+
+        Within the context, the rois passed to Slot.setDirty() are accumulated per slot
+        (see lazyflow.roi.RegionSet).  When the context exits, each slot is set dirty
+        once for each box of its merged region set, so downstream operators see
+        a few (possibly slightly larger) rois instead of one roi per edit.
+
+        Note: Requests executed within the context may see stale results from caches
+        whose dirty notifications are still pending.
+        """
+        return Graph.DirtyBatchContext(self)
+
+    class DirtyBatchContext(object):
+        """
+        A context manager that batches the dirty notifications of a graph.
+        See Graph.batchDirtyNotifications()
+        """
+        def __init__(self, g):
+            self._graph = g
+
+        def __enter__(self):
+            with self._graph._lock:
+                if self._graph._dirty_batch_depth == 0:
+                    self._graph._dirty_batch = collections.OrderedDict()
+                self._graph._dirty_batch_depth += 1
+
+        def __exit__(self, *args):
+            batch = None
+            with self._graph._lock:
+                self._graph._dirty_batch_depth -= 1
+                if self._graph._dirty_batch_depth == 0:
+                    batch = self._graph._dirty_batch
+                    self._graph._dirty_batch = None
+            if batch:
+                self._graph._flushDirtyBatch(batch)
+
+    def _batchDirty(self, slot, roi):
+        """
+        Called by Slot.setDirty().
+        Returns True if the roi was added to the current batch, i.e. the slot must not propagate it now.
+        """
+        if not isinstance(roi, rtype.SubRegion):
+            return False
+        with self._lock:
+            if self._dirty_batch is None:
+                return False
+            try:
+                regions = self._dirty_batch[slot]
+            except KeyError:
+                regions = self._dirty_batch[slot] = RegionSet()
+            regions.add( roi.start, roi.stop )
+        return True
+
+    def _flushDirtyBatch(self, batch):
+        for slot, regions in batch.iteritems():
+            shape = slot.meta.shape
+            if slot.operator is None or shape is None:
+                continue
+            for start, stop in regions.rois():
+                if len(start) != len(shape):
+                    # The slot has been reconfigured in the meantime.
+                    break
+                stop = map(min, stop, shape)
+                if any( b <= a for a, b in zip(start, stop) ):
+                    continue
+                slot.setDirty( rtype.SubRegion(slot, start, stop) )
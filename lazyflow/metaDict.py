@@ -98,6 +98,19 @@ class MetaDict(defaultdict):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def changedKeys(self, other):
+        """
+        Return the set of keys that were added, removed or changed in other,
+        compared to this MetaDict.  (The _dirty flag is ignored.)
+        """
+        changed = set()
+        for k in set(self.keys() + other.keys()):
+            if k.startswith('__') or k == '_dirty':
+                continue
+            if k not in other or k not in self or other[k] != self[k]:
+                changed.add(k)
+        return changed
+
     def assignFrom(self, other):
         """
         Copy all the elements from other into this
@@ -21,6 +21,7 @@
 ###############################################################################
 #Python
 import collections
+import copy
 import logging
 import threading
 import functools
@@ -170,6 +171,25 @@ class Operator(object):
     description = ""
     category = "lazyflow"
 
+    # Operators whose execute() mostly waits for disk or network I/O
+    # (e.g. file readers) should set this to True, so that their requests
+    # run in the separate I/O thread pool (see Request.reset_io_thread_pool).
+    io_bound = False
+
+    # Operators may declare which meta data keys of their inputs their
+    # setupOutputs() depends on, as a dict of { input slot name : keys },
+    # e.g. { 'Input' : ('shape', 'dtype', 'axistags') }.
+    # If only other keys of a declared input change (e.g. drange or display_mode),
+    # setupOutputs() is skipped, and the changed values are copied to the outputs
+    # that had copied the old values (see _handleIrrelevantMetaChange).
+    # A declared input's value must not be used by setupOutputs().
+    # Inputs that aren't declared always trigger setupOutputs().
+    # The declaration is not inherited, since subclasses usually extend setupOutputs().
+    metaDependencies = None
+
+    # Keys that always trigger setupOutputs(), whatever the declaration
+    _alwaysRelevantMetaKeys = frozenset(['_ready', 'NOTREADY', 'has_mask'])
+
     __metaclass__ = OperatorMetaClass
 
     def __new__(cls, *args, **kwargs):
@@ -227,6 +247,9 @@ class Operator(object):
         self._debug_text = None
         self._setup_count = 0
 
+        # Input meta data as of the last setupOutputs() (see metaDependencies)
+        self._setup_input_meta = {}
+
     @property
     def children(self):
         return list(self._children.keys())
@@ -481,8 +504,70 @@ class Operator(object):
             for k, oslot in self.outputs.items():
                 if oslot.partner is None:
                     oslot.disconnect() # Forces unready state
+            self._setup_input_meta = {}
             raise
 
+        dependencies = type(self).__dict__.get('metaDependencies')
+        if dependencies is not None:
+            self._setup_input_meta = { name : self.inputs[name].meta.copy()
+                                       for name in dependencies }
+
+    def _handleIrrelevantMetaChange(self, slot):
+        """
+        Called when the meta data of the given (configured) input slot changed.
+        If none of the changed keys matter to setupOutputs() (see metaDependencies),
+        copy the changed values to the outputs that had copied the old ones,
+        notify downstream operators, and return True.
+        Otherwise, return False: setupOutputs() must be called as usual.
+        """
+        dependencies = type(self).__dict__.get('metaDependencies')
+        if ( dependencies is None
+             or slot.name not in dependencies
+             or slot.operator is not self
+             or slot.level != 0
+             or slot._value is not None ):
+            return False
+
+        old_meta = self._setup_input_meta.get(slot.name)
+        if old_meta is None:
+            return False
+
+        changed_keys = old_meta.changedKeys(slot.meta)
+        relevant_keys = self._alwaysRelevantMetaKeys.union( dependencies[slot.name] )
+        if changed_keys & relevant_keys:
+            return False
+
+        # We can't tell which outputs should receive new keys.
+        if any( key not in old_meta for key in changed_keys ):
+            return False
+
+        outputs = self.outputs.values()
+        if any( oslot.level != 0 or not oslot.ready() for oslot in outputs ):
+            return False
+
+        changed_outputs = []
+        for oslot in outputs:
+            if oslot.partner is not None:
+                # Connected outputs get their meta data from upstream.
+                continue
+            meta = oslot.meta
+            for key in changed_keys:
+                if key not in meta or meta[key] != old_meta[key]:
+                    # This output didn't copy the old value
+                    continue
+                if key in slot.meta:
+                    meta[key] = copy.copy( slot.meta[key] )
+                else:
+                    del meta[key]
+                meta._dirty = True
+            if meta._dirty:
+                changed_outputs.append(oslot)
+
+        self._setup_input_meta[slot.name] = slot.meta.copy()
+        for oslot in changed_outputs:
+            oslot._changed()
+        return True
+
     def handleInputBecameUnready(self, slot):
         # One of our input slots was disconnected.
         # If it was optional, we don't care.
@@ -550,6 +635,73 @@ class Operator(object):
         raise NotImplementedError("Operator {} does not implement"
                                   " execute()".format(self.name))
 
+    def execute_many(self, slot, subindex, rois, results):
+        """ Compute the data for several rois of the given output slot
+        at once (see Slot.get_many()).  ``results`` contains one
+        destination array per roi.
+
+        Operators may override this method to share work between the
+        rois, e.g. overlapping halos, or blocks that must be loaded or
+        decompressed.  The default implementation computes each roi with
+        a separate request, i.e. via execute(). (For operators that
+        don't override this method, Slot.get_many() does that directly.)
+
+        Returns the list of results. """
+        requests = [ slot.get(roi).writeInto(result) for roi, result in zip(rois, results) ]
+        for req in requests:
+            req.submit()
+        return [ req.wait() for req in requests ]
+
+    def execute_points(self, slot, subindex, roi, result):
+        """ Compute the data for the sparse points of the given
+        rtype.PointSet (e.g. the features at some label positions)
+        into ``result``, an array of shape roi.resultShape(...).
+
+        Operators that can do this more efficiently than computing
+        whole regions (e.g. caches) may override this method.
+        For operators that don't, Slot.get() requests the data of
+        small tiles around the points instead (see PointSet.tiles()).
+        """
+        raise NotImplementedError("Operator {} does not implement"
+                                  " execute_points()".format(self.name))
+
+    def forwardingSource(self, slot):
+        """ Operators whose execute() merely copies the requested roi
+        from another slot (e.g. pipers, or caches in bypass mode) may
+        override this method to return that slot for the given output
+        slot.  Slot.get() then requests the data from the source slot
+        directly, instead of creating a request that only creates
+        another request.
+
+        The source must provide exactly the data execute() would have
+        produced, for any roi.  (Dirty notifications are unaffected:
+        they still pass through propagateDirty() as usual.)
+
+        Return None (the default) to have execute() called as usual. """
+        return None
+
+    def pointwiseStage(self, slot):
+        """ Operators whose output slot is computed element by element
+        from one of their inputs (e.g. dtype conversions or pixel-wise
+        functions) may override this method to return a
+        lazyflow.fusion.PointwiseStage for the given output slot.
+        Chains of such operators are then executed as a single request
+        (see lazyflow.fusion).
+
+        Return None (the default) if execute() must be called as usual. """
+        return None
+
+    def requiredInputRois(self, slot, roi):
+        """ Return the regions of the inputs that execute() reads to
+        compute the given roi of the given output slot, as a list of
+        (input slot, start, stop).  Operators that read a halo around
+        the roi (e.g. filters) should include it here.
+
+        This is used to plan requests through whole graphs
+        (see lazyflow.roiPlanner).  Return None (the default) if the
+        regions are unknown. """
+        return None
+
     def setInSlot(self, slot, subindex, roi, value):
         raise NotImplementedError("Can't use __setitem__ with Operator {}"
                                   " because it doesn't implement"
@@ -19,83 +19,153 @@
 # This information is also available on the ilastik web site at:
 #		   http://ilastik.org/license/
 ###############################################################################
-import traceback, os,  sys
+"""
+The operator classes below can be imported straight from this package,
+e.g. ``from lazyflow.operators import OpArrayPiper``.
+
+Importing the package itself is cheap: the module that defines an operator
+is only imported when that operator is first accessed.  (Submodules such
+as ``lazyflow.operators.opCache`` can also be accessed as attributes.)
+New operators that should be available here must be added to
+_OPERATOR_MODULES.  See benchmarks/importTime.py.
+"""
+import os
+import sys
+import types
+import importlib
 import logging
 logger = logging.getLogger(__name__)
 
-import lazyflow
-
 from lazyflow.graph import Operator
-from lazyflow.utility.helpers import itersubclasses
 
-# necessary because we used a factory
-from vigraOperators import Op1ToMulti, Op5ToMulti, Op50ToMulti
+# Module name (relative to this package, unless it contains a dot) : the operators it provides
+_OPERATOR_MODULES = {
+    'lazyflow.operatorWrapper' : ['OperatorWrapper'],
+    'classifierOperators' : [ 'OpAreas',
+                              'OpClassifierPredict',
+                              'OpPixelwiseClassifierPredict',
+                              'OpTrainClassifierBlocked',
+                              'OpTrainClassifierFromFeatureVectors',
+                              'OpTrainPixelwiseClassifierBlocked',
+                              'OpTrainVectorwiseClassifierBlocked',
+                              'OpVectorwiseClassifierPredict' ],
+    'generic' : [ 'OpConvertDtype',
+                  'OpDtypeView',
+                  'OpMaxChannelIndicatorOperator',
+                  'OpMultiArrayMerger',
+                  'OpMultiArraySlicer',
+                  'OpMultiArraySlicer2',
+                  'OpMultiArrayStacker',
+                  'OpMultiInputConcatenater',
+                  'OpPixelOperator',
+                  'OpSelectSubslot',
+                  'OpSingleChannelSelector',
+                  'OpSubRegion',
+                  'OpTransposeSlots',
+                  'OpWrapSlot' ],
+    'opArrayCache' : ['OpArrayCache'],
+    'opArrayPiper' : ['OpArrayPiper'],
+    'opBlockedArrayCache' : ['OpBlockedArrayCache'],
+    'opCacheFixer' : ['OpCacheFixer'],
+    'opCachedLabelImage' : ['OpCachedLabelImage'],
+    'opColorizeLabels' : ['OpColorizeLabels'],
+    'opCompressedCache' : ['OpCompressedCache'],
+    'opCompressedUserLabelArray' : ['OpCompressedUserLabelArray'],
+    'opConcatenateFeatureMatrices' : ['OpConcatenateFeatureMatrices'],
+    'opCrosshairMarkers' : ['OpCrosshairMarkers'],
+    'opFeatureMatrixCache' : ['OpFeatureMatrixCache'],
+    'opFilterLabels' : ['OpFilterLabels'],
+    'opInterpMissingData' : ['OpInterpMissingData'],
+    'opLabelImage' : ['OpLabelImage'],
+    'opLabelVolume' : ['OpLabelVolume'],
+    'opMaskedSelect' : ['OpMaskedSelect'],
+    'opMaskedWatershed' : ['OpMaskedWatershed'],
+    'opObjectFeatures' : ['OpObjectFeatures'],
+    'opRelabelConsecutive' : ['OpRelabelConsecutive'],
+    'opReorderAxes' : ['OpReorderAxes'],
+    'opResize' : ['OpResize'],
+    'opSelectLabel' : ['OpSelectLabel'],
+    'opSimpleBlockedArrayCache' : ['OpSimpleBlockedArrayCache'],
+    'opSimpleStacker' : ['OpSimpleStacker'],
+    'opSlicedBlockedArrayCache' : ['OpSlicedBlockedArrayCache'],
+    'opUnblockedArrayCache' : ['OpUnblockedArrayCache'],
+    'opVigraLabelVolume' : ['OpVigraLabelVolume'],
+    'opVigraWatershed' : ['OpVigraWatershed'],
+    'valueProviders' : [ 'ListToMultiOperator',
+                         'OpAttributeSelector',
+                         'OpDummyData',
+                         'OpMetadataInjector',
+                         'OpMetadataMerge',
+                         'OpMetadataSelector',
+                         'OpOutputProvider',
+                         'OpPrecomputedInput',
+                         'OpValueCache',
+                         'OpZeroDefault' ],
+    'vigraOperators' : [ 'Op1ToMulti',
+                         'Op50ToMulti',
+                         'Op5ToMulti',
+                         'OpBaseVigraFilter',
+                         'OpDifferenceOfGaussians',
+                         'OpGaussianGradientMagnitude',
+                         'OpGaussianSmoothing',
+                         'OpHessianOfGaussian',
+                         'OpHessianOfGaussianEigenvalues',
+                         'OpHessianOfGaussianEigenvaluesFirst',
+                         'OpImageReader',
+                         'OpLaplacianOfGaussian',
+                         'OpPixelFeaturesInterpPresmoothed',
+                         'OpPixelFeaturesPresmoothed',
+                         'OpStructureTensorEigenvalues' ],
+    'lazyflow.utility.testing' : [ 'OpArrayPiperWithAccessCount',
+                                   'OpCallWhenDirty' ],
+}
+
+# Operator name : absolute module name
+_OPERATOR_REGISTRY = {}
+for _module_name, _names in _OPERATOR_MODULES.items():
+    if '.' not in _module_name:
+        _module_name = __name__ + '.' + _module_name
+    for _name in _names:
+        _OPERATOR_REGISTRY[_name] = _module_name
+del _module_name, _names, _name
+
+__all__ = ['Operator'] + sorted(_OPERATOR_REGISTRY.keys())
+
+def _isSubmodule(name):
+    package_dir = os.path.dirname(__file__)
+    return ( os.path.exists( os.path.join(package_dir, name + '.py') )
+             or os.path.exists( os.path.join(package_dir, name + '.pyc') )
+             or os.path.exists( os.path.join(package_dir, name, '__init__.py') ) )
 
-try:
-    if modules != None:
-        pass
-except:
-    modules = []
-    import generic
-    import vigraOperators
-    import classifierOperators
-    import valueProviders
-    import operators
-    
-    ops = itersubclasses(Operator)
-    logger.debug("Loading default Operators...")
-    loaded = ""
-    for i, o in enumerate(ops):
-        loaded += o.__name__ + ' '
-        globals()[o.__name__] = o
-    loaded += os.linesep
-    logger.debug(loaded)
+class _LazyOperatorsModule(types.ModuleType):
+    """
+    Stands in for this package in sys.modules, so that operators can be
+    resolved on first attribute access.
+    (Python 2 modules can't define __getattr__ themselves.)
+    """
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
 
-    from opSimpleStacker import OpSimpleStacker
-    from opBlockedArrayCache import OpBlockedArrayCache
-    from opVigraWatershed import OpVigraWatershed
-    from opVigraLabelVolume import OpVigraLabelVolume
-    from opFilterLabels import OpFilterLabels
-    from opColorizeLabels import OpColorizeLabels
-    from opObjectFeatures import OpObjectFeatures
-    from opCompressedCache import OpCompressedCache
-    from opCompressedUserLabelArray import OpCompressedUserLabelArray
-    from opLabelImage import OpLabelImage
-    from opCachedLabelImage import OpCachedLabelImage
-    from opInterpMissingData import OpInterpMissingData
-    from opCrosshairMarkers import OpCrosshairMarkers
-    from opMaskedWatershed import OpMaskedWatershed
-    from opSelectLabel import OpSelectLabel
-    from opMaskedSelect import OpMaskedSelect
-    from opReorderAxes import OpReorderAxes
-    from opLabelVolume import OpLabelVolume
-    from opResize import OpResize
-    from opRelabelConsecutive import OpRelabelConsecutive
+        if name in _OPERATOR_REGISTRY:
+            module = importlib.import_module( _OPERATOR_REGISTRY[name] )
+            value = getattr(module, name)
+        elif _isSubmodule(name):
+            value = importlib.import_module( __name__ + '.' + name )
+        else:
+            raise AttributeError( "module '{}' has no attribute '{}'".format( __name__, name ) )
 
-    ops = list(itersubclasses(Operator))
-    '''
-    dirs = lazyflow.graph.CONFIG.get("Operators","directories", lazyflow.graph.CONFIG_DIR + "operators")
-    dirs = dirs.split(",")
-    for d in dirs:
-        print "Loading Operators from ", d,"..."
-        d = os.path.expanduser(d.strip())
-        sys.path.append(d)
-        files = os.listdir(d)
-        for f in files:
-            if os.path.isfile(d + "/" + f) and f[-3:] == ".py":
-                try:
-                    print "  Processing file", f
-                    module = __import__(f[:-2])
-                except Exception, e:
-                    traceback.print_exc(file=sys.stdout)
-                    pass
+        # Cache it, so __getattr__ isn't called for this name again.
+        setattr(self, name, value)
+        return value
 
-        ops2 = list(itersubclasses(Operator))
+    def __dir__(self):
+        return sorted( set(self.__dict__.keys()) | set(_OPERATOR_REGISTRY.keys()) )
 
-        newOps = list(set(list(ops2)).difference(set(list(ops))))
+_lazy_module = _LazyOperatorsModule(__name__, __doc__)
+_lazy_module.__dict__.update( sys.modules[__name__].__dict__ )
 
-        for o in newOps:
-            print "    Adding", o.__name__
-            globals()[o.__name__] = o
-        '''
-    #sys.stdout.write(os.linesep)
+# Keep the original module alive: when a Python 2 module is garbage
+# collected, its globals (which the functions above still use) are cleared.
+_lazy_module._original_module = sys.modules[__name__]
+sys.modules[__name__] = _lazy_module
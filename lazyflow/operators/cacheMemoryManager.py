@@ -22,6 +22,10 @@
 
 # Python
 import gc
+import time
+import heapq
+import bisect
+import itertools
 import threading
 import weakref
 import functools
@@ -42,6 +46,233 @@ logger = logging.getLogger(__name__)
 default_refresh_interval = 1
 
 
+class LRUEvictionPolicy(object):
+    """
+    Evict the least recently used blocks first.
+    """
+    def priority(self, access_time, compute_time, size):
+        """
+        get the priority of a block, blocks with lower priority are evicted first
+        """
+        return access_time
+
+    def evicted(self, priority, now=None):
+        """
+        notify the policy that a block with the given priority was evicted
+        """
+        pass
+
+    def forget(self, oldest_access_time):
+        """
+        notify the policy that no block was accessed before oldest_access_time
+        """
+        pass
+
+
+class GreedyDualSizeEvictionPolicy(LRUEvictionPolicy):
+    """
+    GreedyDual-Size eviction (Cao and Irani, 1997)
+
+    When a block is accessed, its priority is set to H = L + cost/size,
+    where L is the priority of the most recently evicted block. Blocks
+    with the lowest H are evicted first, i.e. blocks that are cheap to
+    recompute (per byte) and blocks that haven't been accessed for a long
+    time (their H was computed with an older, lower value of L).
+
+    Caches only report the time stamp of the last access, so the history
+    of L is kept and the value it had at that time is used.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._history_times = [float('-inf')]
+        self._history_values = [0.0]
+
+    def priority(self, access_time, compute_time, size):
+        with self._lock:
+            i = bisect.bisect_right(self._history_times, access_time) - 1
+            inflation = self._history_values[i]
+        # ties are broken by recency
+        return (inflation + compute_time / float(max(size, 1)), access_time)
+
+    def evicted(self, priority, now=None):
+        if now is None:
+            now = time.time()
+        with self._lock:
+            if priority[0] > self._history_values[-1]:
+                self._history_times.append(now)
+                self._history_values.append(priority[0])
+
+    def forget(self, oldest_access_time):
+        with self._lock:
+            i = bisect.bisect_right(self._history_times, oldest_access_time) - 1
+            del self._history_times[:i]
+            del self._history_values[:i]
+
+
+class BlockEvictionIndex(object):
+    """
+    Priority queue of the blocks of all caches that report when their
+    blocks are added, accessed and removed (see
+    ManagedBlockedCache.indexedBlocks).
+
+    The index is kept up to date incrementally, so the memory manager
+    doesn't have to collect the blocks of these caches in each cleanup
+    pass. Each update and each eviction is O(log n): outdated heap entries
+    are left in the heap and skipped when they reach the top.
+
+    Caches are kept with weak references, the blocks of garbage collected
+    caches are dropped from the index.
+    """
+    def __init__(self, policy):
+        self._lock = threading.Lock()
+        self._policy = policy
+        # heap of (priority, count, cache id, block id) tuples
+        # (only immutable entries, so the garbage collector can ignore them)
+        self._heap = []
+        self._counter = itertools.count()
+        self._num_entries = 0
+        self._used_memory = 0
+        # id(cache) : (weak reference to the cache,
+        #              {block id : (count, access time, compute time, size)})
+        # An entry of the heap is valid if its count matches the block's count.
+        self._caches = {}
+        # weak references of caches that were garbage collected
+        self._dead = []
+
+    def __len__(self):
+        return self._num_entries
+
+    def usedMemory(self):
+        """
+        get the total size of all blocks in the index
+        """
+        return self._used_memory
+
+    def setPolicy(self, policy):
+        """
+        recompute the priorities of all blocks with a new eviction policy
+        """
+        with self._lock:
+            self._policy = policy
+            self._heap = [(policy.priority(t, compute_time, size), count, cache_id, block_id)
+                          for cache_id, (_, blocks) in self._caches.iteritems()
+                          for block_id, (count, t, compute_time, size) in blocks.iteritems()]
+            heapq.heapify(self._heap)
+
+    def add(self, cache, block_id, size, compute_time=0.0):
+        """
+        add a block (or replace it, if it's in the index already)
+        """
+        with self._lock:
+            self._removeDead()
+            cache_id = id(cache)
+            record = self._caches.get(cache_id)
+            if record is None:
+                record = (weakref.ref(cache, self._dead.append), {})
+                self._caches[cache_id] = record
+            old_block = record[1].get(block_id)
+            if old_block is None:
+                self._num_entries += 1
+            else:
+                self._used_memory -= old_block[3]
+            self._used_memory += size
+            self._push(cache_id, record[1], block_id, compute_time, size)
+
+    def touch(self, cache, block_id):
+        """
+        update the priority of a block after it was accessed
+        """
+        with self._lock:
+            record = self._caches.get(id(cache))
+            if record is None or block_id not in record[1]:
+                return
+            _, _, compute_time, size = record[1][block_id]
+            self._push(id(cache), record[1], block_id, compute_time, size)
+
+    def remove(self, cache, block_id):
+        with self._lock:
+            record = self._caches.get(id(cache))
+            if record is None:
+                return
+            block = record[1].pop(block_id, None)
+            if block is not None:
+                self._num_entries -= 1
+                self._used_memory -= block[3]
+
+    def removeCache(self, cache):
+        """
+        remove all blocks of a cache
+        """
+        with self._lock:
+            record = self._caches.pop(id(cache), None)
+            if record is not None:
+                self._forgetBlocks(record[1])
+
+    def peek(self):
+        """
+        get the priority of the block that pop() would return, or None
+        """
+        with self._lock:
+            self._removeDead()
+            while self._heap and not self._isValid(self._heap[0]):
+                heapq.heappop(self._heap)
+            if not self._heap:
+                return None
+            return self._heap[0][0]
+
+    def pop(self):
+        """
+        remove the block with the lowest priority from the index
+
+        @return (priority, cache, block id), or None if the index is empty
+        """
+        with self._lock:
+            self._removeDead()
+            while self._heap:
+                entry = heapq.heappop(self._heap)
+                if not self._isValid(entry):
+                    continue
+                priority, _, cache_id, block_id = entry
+                ref, blocks = self._caches[cache_id]
+                self._used_memory -= blocks.pop(block_id)[3]
+                self._num_entries -= 1
+                cache = ref()
+                if cache is not None:
+                    return priority, cache, block_id
+            return None
+
+    def _isValid(self, entry):
+        _, count, cache_id, block_id = entry
+        record = self._caches.get(cache_id)
+        if record is None:
+            return False
+        block = record[1].get(block_id)
+        return block is not None and block[0] == count
+
+    def _push(self, cache_id, blocks, block_id, compute_time, size):
+        access_time = time.time()
+        count = self._counter.next()
+        blocks[block_id] = (count, access_time, compute_time, size)
+        priority = self._policy.priority(access_time, compute_time, size)
+        heapq.heappush(self._heap, (priority, count, cache_id, block_id))
+        if len(self._heap) > 2*self._num_entries + 1000:
+            # too many outdated entries, compact the heap
+            self._heap = [e for e in self._heap if self._isValid(e)]
+            heapq.heapify(self._heap)
+
+    def _forgetBlocks(self, blocks):
+        self._num_entries -= len(blocks)
+        self._used_memory -= sum(block[3] for block in blocks.itervalues())
+
+    def _removeDead(self):
+        while self._dead:
+            ref = self._dead.pop()
+            for cache_id, (r, blocks) in self._caches.items():
+                if r is ref:
+                    self._forgetBlocks(blocks)
+                    del self._caches[cache_id]
+
+
 class CacheMemoryManager(threading.Thread):
     """
     class for the management of cache memory
@@ -70,6 +301,26 @@ class CacheMemoryManager(threading.Thread):
     >>> CacheMemoryManager().setRefreshInterval(5)
     the interval is measured in seconds. Each change of refresh interval
     triggers cleanup.
+
+    Cache memory is freed when the caches use more than the high watermark
+    (a fraction of Memory.getAvailableRamCaches()), until they use less
+    than the low watermark. Both can be set with
+    >>> CacheMemoryManager().setWatermarks(1.0, .9)
+    Indexed caches (see below) call checkMemoryPressure() after they have
+    stored new blocks, so their memory is freed right away instead of at
+    the next refresh, no matter how fast the blocks are inserted.
+
+    Caches that implement the ManagedBlockedCache interface with
+    indexedBlocks = True report each block they add, access and free
+    (see blockAdded() etc.), so the manager maintains their eviction order
+    incrementally. The blocks of other caches are collected in each
+    cleanup pass.
+
+    Blocks are evicted with the GreedyDual-Size strategy, which weighs
+    the time it took to compute a block and its size alongside recency
+    (see GreedyDualSizeEvictionPolicy). Plain LRU eviction can be
+    restored with
+    >>> CacheMemoryManager().setEvictionPolicy(LRUEvictionPolicy())
     """
     __metaclass__ = Singleton
 
@@ -91,11 +342,18 @@ class CacheMemoryManager(threading.Thread):
         self._refresh_interval = default_refresh_interval
         self._first_class_caches_lock = threading.Lock()
 
-        # maximum fraction of *allowed memory* used
+        # maximum fraction of *allowed memory* used (high watermark)
         self._max_usage = 1.0
-        # target usage fraction
+        # target usage fraction (low watermark)
         self._target_usage = .90
 
+        # Memory used by caches that are not in the index
+        # (as measured in the last cleanup pass)
+        self._polled_usage = 0
+
+        self._eviction_policy = GreedyDualSizeEvictionPolicy()
+        self._index = BlockEvictionIndex(self._eviction_policy)
+
         self._stopped = False
         self.start()
         atexit.register(self.stop)
@@ -151,6 +409,64 @@ class CacheMemoryManager(threading.Thread):
         elif isinstance(cache, ManagedCache):
             self._managed_caches.add(cache)
 
+    def blockAdded(self, cache, block_id, size, compute_time=0.0):
+        """
+        notify the manager that a block of an indexed cache was stored
+
+        @param size memory used by the block (in bytes)
+        @param compute_time time (in seconds) it took to compute the block
+        """
+        self._index.add(cache, block_id, size, compute_time)
+
+    def blockAccessed(self, cache, block_id):
+        """
+        notify the manager that a block of an indexed cache was read
+        """
+        self._index.touch(cache, block_id)
+
+    def blockRemoved(self, cache, block_id):
+        """
+        notify the manager that a block of an indexed cache was freed
+        """
+        self._index.remove(cache, block_id)
+
+    def cacheCleared(self, cache):
+        """
+        notify the manager that all blocks of an indexed cache were freed
+        """
+        self._index.removeCache(cache)
+
+    def checkMemoryPressure(self):
+        """
+        free memory right away if the caches use more than the high watermark
+
+        Indexed caches call this after they have stored new blocks. It must
+        not be called while holding a cache lock, because blocks of any cache
+        (including the calling one) may be freed. Blocks are freed until the
+        caches use less than the low watermark.
+        """
+        if self._disabled:
+            return
+        cache_memory = Memory.getAvailableRamCaches()
+        if self._index.usedMemory() + self._polled_usage <= self._max_usage * cache_memory:
+            return
+
+        # No lock is held while freeing blocks (freeBlock() may suspend the
+        # calling request). Threads that free memory at the same time take
+        # different victims from the index.
+        try:
+            policy = self._eviction_policy
+            target = self._target_usage * cache_memory - self._polled_usage
+            while self._index.usedMemory() > target:
+                victim = self._index.pop()
+                if victim is None:
+                    break
+                priority, cache, block_id = victim
+                cache.freeBlock(block_id)
+                policy.evicted(priority)
+        except:
+            log_exception(logger)
+
     def run(self):
         """
         main loop
@@ -182,6 +498,7 @@ class CacheMemoryManager(threading.Thread):
                     total += cache.usedMemory()
             self.totalCacheMemory(total)
             cache = None
+            self._polled_usage = max(0, total - self._index.usedMemory())
 
             # check current memory state
             cache_memory = Memory.getAvailableRamCaches()
@@ -197,32 +514,7 @@ class CacheMemoryManager(threading.Thread):
                 return
 
             # === we need a cache cleanup ===
-
-            # queue holds time stamps and cleanup functions
-            q = PriorityQueue()
-            caches = list(self._managed_caches)
-            for c in caches:
-                q.push((c.lastAccessTime(), c.name, c.freeMemory))
-            caches = list(self._managed_blocked_caches)
-            for c in caches:
-                for k, t in c.getBlockAccessTimes():
-                    cleanupFun = functools.partial(c.freeBlock, k)
-                    info = "{}: {}".format(c.name, k)
-                    q.push((t, info, cleanupFun))
-            c = None
-            caches = None
-
-            while (total > self._target_usage * cache_memory
-                   and len(q) > 0):
-                t, info, cleanupFun = q.pop()
-                mem = cleanupFun()
-                logger.debug("Cleaned up {} ({})".format(
-                    info, Memory.format(mem)))
-                total -= mem
-            gc.collect()
-            # don't keep a reference until next loop iteration
-            cleanupFun = None
-            q = None
+            total = self._evict(total, cache_memory)
 
             msg = "Done cleaning up, cache memory usage is now at {}"\
                   .format( Memory.format(total))
@@ -233,6 +525,58 @@ class CacheMemoryManager(threading.Thread):
         except:
             log_exception(logger)
 
+    def _evict(self, total, cache_memory):
+        """
+        free blocks until total is below the low watermark
+
+        @return the new total
+        """
+        # queue holds eviction priorities and cleanup functions for
+        # the caches that aren't in the index
+        policy = self._eviction_policy
+        oldest_access_time = float('inf')
+        q = PriorityQueue()
+        caches = list(self._managed_caches)
+        for c in caches:
+            t = c.lastAccessTime()
+            oldest_access_time = min(oldest_access_time, t)
+            q.push((policy.priority(t, 0.0, 0), c.name, c.freeMemory))
+        caches = list(self._managed_blocked_caches)
+        for c in caches:
+            if c.indexedBlocks:
+                continue
+            for k, t, compute_time, size in c.getBlockCosts():
+                oldest_access_time = min(oldest_access_time, t)
+                cleanupFun = functools.partial(c.freeBlock, k)
+                info = "{}: {}".format(c.name, k)
+                q.push((policy.priority(t, compute_time, size), info, cleanupFun))
+        c = None
+        caches = None
+        policy.forget(oldest_access_time)
+
+        while total > self._target_usage * cache_memory:
+            # take the block with the lowest priority, either from
+            # the index or from the queue
+            indexed_priority = self._index.peek()
+            if len(q) > 0 and (indexed_priority is None
+                               or q.peek()[0] < indexed_priority):
+                priority, info, cleanupFun = q.pop()
+                mem = cleanupFun()
+            else:
+                victim = self._index.pop()
+                if victim is None:
+                    break
+                priority, c, k = victim
+                info = "{}: {}".format(c.name, k)
+                mem = c.freeBlock(k)
+                c = None
+            policy.evicted(priority)
+            logger.debug("Cleaned up {} ({})".format(
+                info, Memory.format(mem)))
+            total -= mem
+        gc.collect()
+        return total
+
     def _wait(self):
         """
         sleep for _refresh_interval seconds or until woken up
@@ -257,6 +601,26 @@ class CacheMemoryManager(threading.Thread):
             self._refresh_interval = t
             self._condition.notifyAll()
 
+    def setWatermarks(self, high, low):
+        """
+        set the fractions of Memory.getAvailableRamCaches() at which cache
+        cleanup starts (high) and stops (low)
+        """
+        assert 0 <= low <= high, "Invalid watermarks: {}, {}".format(high, low)
+        with self._disable_lock:
+            self._max_usage = high
+            self._target_usage = low
+
+    def setEvictionPolicy(self, policy):
+        """
+        set the strategy that determines which blocks are freed first
+
+        (see LRUEvictionPolicy and GreedyDualSizeEvictionPolicy)
+        """
+        with self._disable_lock:
+            self._eviction_policy = policy
+            self._index.setPolicy(policy)
+
     def disable(self):
         """
         disable all memory management
@@ -34,6 +34,7 @@ from lazyflow.graph import Operator, InputSlot, OutputSlot
 from lazyflow import roi
 from lazyflow.roi import roiToSlice, sliceToRoi, TinyVector, getIntersection
 from lazyflow.request import RequestPool
+from lazyflow.fusion import PointwiseStage, executeIsOverridden, isPointwise
 
 def axisTagObjectFromFlag(flag):
 
@@ -684,6 +685,8 @@ class OpPixelOperator(Operator):
     inputSlots = [InputSlot("Input"), InputSlot("Function")]
     outputSlots = [OutputSlot("Output")]
 
+    metaDependencies = { 'Input' : ('dtype', 'drange') }
+
     def setupOutputs(self):
         self.function = self.inputs["Function"].value
 
@@ -712,6 +715,14 @@ class OpPixelOperator(Operator):
         result[:] = self.function(matrix)
         return result
 
+    def pointwiseStage(self, slot):
+        if slot is not self.Output or executeIsOverridden(self, OpPixelOperator):
+            return None
+        if not isPointwise(self.function):
+            # Arbitrary functions may look at their whole input (e.g. to normalize it).
+            return None
+        return PointwiseStage( self, self.Input, function=self.function, input_dtype=self.Input.meta.dtype )
+
     def propagateDirty(self, slot, subindex, roi):
         key = roi.toSlice()
         if slot == self.Input:
@@ -928,6 +939,12 @@ class OpDtypeView(Operator):
         self.Input(roi.start, roi.stop).writeInto( result_view ).wait()
         return result
 
+    def pointwiseStage(self, slot):
+        if slot is not self.Output or executeIsOverridden(self, OpDtypeView):
+            return None
+        input_dtype = self.Input.meta.dtype
+        return PointwiseStage( self, self.Input, input_view=lambda result: result.view( input_dtype ) )
+
     def propagateDirty(self, slot, subindex, roi):
         self.Output.setDirty( roi )
 
@@ -947,6 +964,16 @@ class OpConvertDtype(Operator):
             input_data = self.Input(roi.start, roi.stop).wait()
             result[:] = input_data.astype(self.ConversionDtype.value)
 
+    def pointwiseStage(self, slot):
+        if slot is not self.Output or executeIsOverridden(self, OpConvertDtype):
+            return None
+        dtype = self.ConversionDtype.value
+        if self.Input.meta.dtype == dtype:
+            return PointwiseStage( self, self.Input, input_view=lambda result: result )
+        return PointwiseStage( self, self.Input,
+                               function=lambda data: data.astype(dtype),
+                               input_dtype=self.Input.meta.dtype )
+
     def propagateDirty(self, slot, subindex, roi):
         if slot is self.ConversionDtype:
             self.Output.setDirty()
@@ -33,6 +33,7 @@ class OpBlockwiseFilesetReader(Operator):
     Adapter that provides an operator interface to the BlockwiseFileset class for reading ONLY.
     """
     name = "OpBlockwiseFilesetReader"
+    io_bound = True
 
     DescriptionFilePath = InputSlot(stype='filestring')
     Output = OutputSlot()
@@ -35,6 +35,8 @@ from libdvid.voxels import VoxelsAccessor
 logger = logging.getLogger(__name__)
 
 class OpDvidVolume(Operator):
+    io_bound = True
+
     Output = OutputSlot()
 
     class DatasetReadError(Exception):
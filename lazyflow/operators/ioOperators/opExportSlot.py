@@ -28,6 +28,7 @@ import vigra
 import h5py
 
 from lazyflow.graph import Operator, InputSlot, OutputSlot
+from lazyflow.request import Request
 from lazyflow.roi import roiFromShape
 from lazyflow.utility import OrderedSignal, format_known_keys, PathComponents
 from lazyflow.operators.ioOperators import OpH5WriterBigDataset, OpNpyWriter, OpExport2DImage, OpStackWriter, \
@@ -228,7 +229,9 @@ class OpExportSlot(Operator):
         except KeyError:
             raise Exception( "Unknown export format: {}".format( output_format ) )
         else:
-            export_func()
+            # Exports are long-running batch jobs.
+            # Don't let them delay interactive requests (e.g. from the viewer).
+            Request( export_func, scheduling_class=Request.BATCH ).wait()
     
     def _export_hdf5(self):
         self.progressSignal( 0 )
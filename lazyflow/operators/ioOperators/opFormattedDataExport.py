@@ -25,6 +25,7 @@ import warnings
 import numpy
 
 from lazyflow.utility import format_known_keys
+from lazyflow import fusion
 from lazyflow.graph import Operator, InputSlot, OutputSlot
 from lazyflow.roi import roiFromShape
 from lazyflow.operators.generic import OpSubRegion, OpPixelOperator
@@ -185,7 +186,7 @@ class OpFormattedDataExport(Operator):
                     frac = numpy.float32(0.0)
                 result = numpy.asarray(outputMinVal + (a - minVal) * frac, export_dtype)
                 return result
-            self._opNormalizeAndConvert.Function.setValue( normalize )
+            self._opNormalizeAndConvert.Function.setValue( fusion.pointwise(normalize) )
 
             # The OpPixelOperator sets the drange correctly using the function we give it.
             output_drange = self._opNormalizeAndConvert.Output.meta.drange
@@ -198,7 +199,7 @@ class OpFormattedDataExport(Operator):
             self._opDrangeInjection.Metadata.setValue( {} )
 
             # No normalization: just identity function with dtype conversion
-            self._opNormalizeAndConvert.Function.setValue( lambda a: numpy.asarray(a, export_dtype) )
+            self._opNormalizeAndConvert.Function.setValue( fusion.pointwise( lambda a: numpy.asarray(a, export_dtype) ) )
 
         # Use user-provided axis order if specified
         if self.OutputAxisOrder.ready():
@@ -17,6 +17,8 @@ class OpKlbReader( Operator ):
         - https://bitbucket.org/fernandoamat/keller-lab-block-filetype
         - https://github.com/bhoeckendorf/pyklb
     """
+    io_bound = True
+
     FilePath = InputSlot()
     Output = OutputSlot()
     
@@ -28,6 +28,7 @@ import copy
 class OpNpyFileReader(Operator):
     name = "OpNpyFileReader"
     category = "Input"
+    io_bound = True
 
     FileName = InputSlot(stype='filestring')
     Output = OutputSlot()
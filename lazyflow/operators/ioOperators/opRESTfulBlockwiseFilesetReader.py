@@ -32,6 +32,7 @@ class OpRESTfulBlockwiseFilesetReader(Operator):
     Adapter that provides an operator interface to the BlockwiseFileset class for reading ONLY.
     """
     name = "OpRESTfulBlockwiseFilesetReader"
+    io_bound = True
 
     DescriptionFilePath = InputSlot(stype='filestring')
     Output = OutputSlot()
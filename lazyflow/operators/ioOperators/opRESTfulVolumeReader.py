@@ -35,6 +35,7 @@ class OpRESTfulVolumeReader(Operator):
     The operator requires a LOCAL json config file that describes the remote dataset and interface.
     """
     name = "OpRESTfulVolumeReader"
+    io_bound = True
 
     DescriptionFilePath = InputSlot(stype='filestring')
     Output = OutputSlot()
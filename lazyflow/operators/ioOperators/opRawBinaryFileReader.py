@@ -40,6 +40,7 @@ class OpRawBinaryFileReader(Operator):
     For now, the axis order is merely guessed. 
     """
     name = "OpRawBinaryFileReader"
+    io_bound = True
 
     FilePath = InputSlot(stype='filestring')
     Output = OutputSlot()
@@ -37,6 +37,7 @@ class OpStreamingHdf5Reader(Operator):
     """
     name = "OpStreamingHdf5Reader"
     category = "Reader"
+    io_bound = True
 
     # The project hdf5 File object (already opened)
     Hdf5File = InputSlot(stype='hdf5File')
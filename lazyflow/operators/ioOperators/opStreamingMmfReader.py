@@ -40,6 +40,7 @@ class OpStreamingMmfReader(Operator):
     """    
     name = "OpStreamingMmfReader"
     category = "Input"
+    io_bound = True
 
     position = None
     
@@ -43,6 +43,7 @@ class OpStreamingUfmfReader(Operator):
     """    
     name = "OpStreamingUfmfReader"
     category = "Input"
+    io_bound = True
 
     position = None
     
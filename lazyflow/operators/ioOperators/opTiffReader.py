@@ -33,6 +33,8 @@ class OpTiffReader(Operator):
     
     TODO: Add an option to output color-mapped pixels.
     """
+    io_bound = True
+
     Filepath = InputSlot()
     Output = OutputSlot()
 
@@ -31,6 +31,8 @@ class OpTiledVolumeReader(Operator):
     The operator requires a LOCAL json config file that describes the remote dataset and interface.
     (See tiledVolume.py)
     """
+    io_bound = True
+
     DescriptionFilePath = InputSlot(stype='filestring')
     Output = OutputSlot()
 
@@ -187,11 +187,14 @@ class OpArrayCache(Operator, ManagedCache):
                 if self._cache.shape == ():
                     return
                 fshape = self._cache.shape
-                try:
-                    self._cache.resize((), refcheck = refcheck)
-                except ValueError:
-                    freed = 0
-                    self.logger.debug("OpArrayCache (name={}): freeing failed due to view references".format(self.name))
+                # Storage that doesn't own its memory (e.g. from the buffer pool) can't be resized.
+                # Dropping our reference (below) returns the memory once nobody else uses it.
+                if self._cache.flags.owndata:
+                    try:
+                        self._cache.resize((), refcheck = refcheck)
+                    except ValueError:
+                        freed = 0
+                        self.logger.debug("OpArrayCache (name={}): freeing failed due to view references".format(self.name))
                 if freed > 0:
                     self.logger.debug("OpArrayCache: freed cache of shape:{}".format(fshape))
     
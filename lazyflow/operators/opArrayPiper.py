@@ -31,6 +31,9 @@ class OpArrayPiper(Operator):
     #Outputs
     Output = OutputSlot(allow_mask=True)
 
+    # setupOutputs() only copies the meta data
+    metaDependencies = { 'Input' : () }
+
     def setupOutputs(self):
         inputSlot = self.inputs["Input"]
         self.outputs["Output"].meta.assignFrom(inputSlot.meta)
@@ -41,6 +44,13 @@ class OpArrayPiper(Operator):
         req.wait()
         return result
 
+    def forwardingSource(self, slot):
+        # Many subclasses override execute() to do real work.
+        # Only forward if we are still a simple piper.
+        if slot is self.Output and type(self).execute.im_func is OpArrayPiper.execute.im_func:
+            return self.Input
+        return None
+
     def propagateDirty(self, slot, subindex, roi):
         key = roi.toSlice()
         # Check for proper name because subclasses may define extra inputs.
@@ -49,6 +49,12 @@ class OpBlockedArrayCache(Operator, ManagedBlockedCache):
     CleanBlocks = OutputSlot() # A list of slicings indicating which blocks are stored in the cache and clean.
 
     innerBlockShape = InputSlot(optional=True) # Deprecated and ignored below.
+
+    # (No metaDependencies: our Output meta data is copied from the internal pipeline,
+    #  which computes keys of its own from any of the Input keys.)
+
+    # The blocks are indexed by the internal OpSimpleBlockedArrayCache
+    indexedBlocks = True
     
     def __init__(self, *args, **kwargs):
         super( OpBlockedArrayCache, self ).__init__(*args, **kwargs)
@@ -103,6 +109,14 @@ class OpBlockedArrayCache(Operator, ManagedBlockedCache):
             # Pass data from internal pipeline to Output
             self._opSimpleBlockedArrayCache.Output(roi.start, roi.stop).writeInto(result).wait()
 
+    def forwardingSource(self, slot):
+        # execute() always just forwards the request (see above)
+        if slot is self.Output:
+            if self.BypassModeEnabled.value:
+                return self.Input
+            return self._opSimpleBlockedArrayCache.Output
+        return None
+
     def propagateDirty(self, slot, subindex, roi):
         pass
 
@@ -124,6 +138,9 @@ class OpBlockedArrayCache(Operator, ManagedBlockedCache):
     def getBlockAccessTimes(self):
         return self._opSimpleBlockedArrayCache.getBlockAccessTimes()
 
+    def getBlockCosts(self):
+        return self._opSimpleBlockedArrayCache.getBlockCosts()
+
     def freeMemory(self):
         return self._opSimpleBlockedArrayCache.freeMemory()
 
@@ -172,6 +172,11 @@ class ManagedBlockedCache(ManagedCache):
     Interface for caches that can be managed in more detail
     """
 
+    # Caches that set this to True notify the memory manager whenever a
+    # block is stored, accessed or freed (see CacheMemoryManager.blockAdded()
+    # etc.), so the manager doesn't need to poll getBlockCosts().
+    indexedBlocks = False
+
     def lastAccessTime(self):
         """
         get the timestamp of the last access (python timestamp)
@@ -192,6 +197,18 @@ class ManagedBlockedCache(ManagedCache):
         raise NotImplementedError(
             "No default implementation for getBlockAccessTimes()")
 
+    def getBlockCosts(self):
+        """
+        get a list of (block id, time stamp, compute time, size) tuples
+
+        The compute time is the time (in seconds) it took to fill the
+        block, the size is the memory it occupies (in bytes). Both are used
+        for cost-aware eviction by the cache memory manager. The default
+        implementation reports unknown costs, which makes the manager treat
+        these blocks like the least recently used strategy would.
+        """
+        return [(k, t, 0.0, 0) for k, t in self.getBlockAccessTimes()]
+
     @abstractmethod
     def freeBlock(self, block_id):
         """
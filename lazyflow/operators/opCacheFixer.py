@@ -61,6 +61,12 @@ class OpCacheFixer(Operator):
             result[:] = 0
         else:
             self.Input(roi.start, roi.stop).writeInto(result).wait()
+
+    def forwardingSource(self, slot):
+        # While unfixed, we are merely a pass-through.
+        if slot is self.Output and not self._fixed:
+            return self.Input
+        return None
         
     def setInSlot(self, slot, subindex, roi, value):
         # Forward to the output
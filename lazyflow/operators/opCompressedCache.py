@@ -35,6 +35,7 @@ from lazyflow.request import Request, RequestPool, RequestLock
 from lazyflow.graph import Operator, InputSlot, OutputSlot
 from lazyflow.roi import TinyVector, getIntersectingBlocks, getBlockBounds, roiToSlice, getIntersection
 from lazyflow.operators.opCache import ManagedBlockedCache
+from lazyflow.operators.cacheMemoryManager import CacheMemoryManager
 from lazyflow.utility.chunkHelpers import chooseChunkShape
 
 logger = logging.getLogger(__name__)
@@ -99,6 +100,8 @@ class OpUnmanagedCompressedCache(Operator):
             self._blockLocks = {}
             self._chunkshape = self._chooseChunkshape(self._blockshape)
             self._last_access_times = collections.defaultdict(float)
+            self._block_compute_times = {}
+        self._allBlocksFreed()
 
     def cleanUp(self):
         logger.debug( "Cleaning up" )
@@ -156,20 +159,24 @@ class OpUnmanagedCompressedCache(Operator):
         block_starts = getIntersectingBlocks( self._blockshape, (roi.start, roi.stop) )
         block_starts = map( tuple, block_starts )
 
-        # Ensure all block cache files are up-to-date
-        self._waitForBlocks(block_starts)
-        self._copyData(roi, destination, block_starts)
+        # Ensure all block cache files are up-to-date, and copy each block
+        # before it can be freed again.
+        self._waitForBlocks(block_starts, roi, destination)
         return destination
 
-    def _waitForBlocks(self, block_starts):
+    def _waitForBlocks(self, block_starts, roi=None, destination=None):
         """
         Make sure that all blocks in the given list of blocks are present in the cache before returning.
         (Blocks that are not yet present will be requested from our Input slot.)
+        If a destination is given, the blocks' parts of the roi are copied into it.
         """
         reqPool = RequestPool() # (Do the work in parallel.)
         for block_start in block_starts:
             entire_block_roi = getBlockBounds( self.Output.meta.shape, self._blockshape, block_start )
-            f = partial( self._ensureCached, entire_block_roi)
+            read_block = None
+            if destination is not None:
+                read_block = partial( self._copyBlock, roi, destination, block_start )
+            f = partial( self._ensureCached, entire_block_roi, read_block )
             reqPool.add( Request(f) )
         logger.debug( "Waiting for {} blocks...".format( len(block_starts) ) )
         reqPool.wait()
@@ -179,26 +186,33 @@ class OpUnmanagedCompressedCache(Operator):
         # (Parallelism not needed here: h5py will serialize these requests anyway)
         logger.debug( "Copying data from {} blocks...".format( len(block_starts) ) )
         for block_start in block_starts:
-            entire_block_roi = getBlockBounds( self.Output.meta.shape, self._blockshape, block_start )
+            self._copyBlock(roi, destination, block_start)
 
-            # This block's portion of the roi
-            intersecting_roi = getIntersection( (roi.start, roi.stop), entire_block_roi )
-            
-            # Compute slicing within destination array and slicing within this block
-            destination_relative_intersection = numpy.subtract(intersecting_roi, roi.start)
-            block_relative_intersection = numpy.subtract(intersecting_roi, block_start)
-            destination_relative_intersection_slicing = roiToSlice(*destination_relative_intersection)
-            block_relative_intersection_slicing = roiToSlice( *block_relative_intersection )
-            
-            # Copy from block to destination
-            dataset = self._getBlockDataset( entire_block_roi )
-            if self.Output.meta.has_mask:
-                destination.data[ destination_relative_intersection_slicing ] = dataset["data"][ block_relative_intersection_slicing ]
-                destination.mask[ destination_relative_intersection_slicing ] = dataset["mask"][ block_relative_intersection_slicing ]
-                destination.fill_value = dataset["fill_value"][()]
-            else:
-                destination[ destination_relative_intersection_slicing ] = dataset[ block_relative_intersection_slicing ]
-            self._last_access_times[block_start] = time.time()
+    def _copyBlock(self, roi, destination, block_start):
+        """
+        Copy the part of the roi that lies in the given block into destination.
+        """
+        entire_block_roi = getBlockBounds( self.Output.meta.shape, self._blockshape, block_start )
+
+        # This block's portion of the roi
+        intersecting_roi = getIntersection( (roi.start, roi.stop), entire_block_roi )
+        
+        # Compute slicing within destination array and slicing within this block
+        destination_relative_intersection = numpy.subtract(intersecting_roi, roi.start)
+        block_relative_intersection = numpy.subtract(intersecting_roi, block_start)
+        destination_relative_intersection_slicing = roiToSlice(*destination_relative_intersection)
+        block_relative_intersection_slicing = roiToSlice( *block_relative_intersection )
+        
+        # Copy from block to destination
+        dataset = self._getBlockDataset( entire_block_roi )
+        if self.Output.meta.has_mask:
+            destination.data[ destination_relative_intersection_slicing ] = dataset["data"][ block_relative_intersection_slicing ]
+            destination.mask[ destination_relative_intersection_slicing ] = dataset["mask"][ block_relative_intersection_slicing ]
+            destination.fill_value = dataset["fill_value"][()]
+        else:
+            destination[ destination_relative_intersection_slicing ] = dataset[ block_relative_intersection_slicing ]
+        self._last_access_times[block_start] = time.time()
+        self._blockAccessed(block_start)
 
     def _executeCleanBlocks(self, destination):
         """
@@ -223,10 +237,11 @@ class OpUnmanagedCompressedCache(Operator):
         assert (block_roi == numpy.array((roi.start, roi.stop))).all(), "OutputHdf5 slot requires roi to be exactly one block."
 
         block_roi = [roi.start, roi.stop]
-        self._ensureCached( block_roi )
-        dataset = self._getBlockDataset( block_roi )
         assert str(block_roi) not in destination, "destination hdf5 group already has a dataset with this block's name"
-        destination.copy( dataset, str(block_roi) )
+        def copy_block():
+            dataset = self._getBlockDataset( block_roi )
+            destination.copy( dataset, str(block_roi) )
+        self._ensureCached( block_roi, copy_block )
         return destination        
 
     def propagateDirty(self, slot, subindex, roi):
@@ -351,21 +366,25 @@ class OpUnmanagedCompressedCache(Operator):
             group = self._cacheFiles[key]
         except KeyError:
             # entry was removed, ignore it
-            return 0
+            return 0, 0
         tot = 0
         unc = 0
-        if "data" in group:
-            ds = group["data"]
-            # actual size
-            tot += get_storage_size(ds)
-            # uncompressed size
-            unc += ds.size * self._getDtypeBytes(ds.dtype)
-        if "mask" in group:
-            tot += group["mask"].size *\
-                self._getDtypeBytes(group["mask"].dtype)
-        if "fill_value" in group:
-            tot += group["fill_value"].size *\
-                self._getDtypeBytes(group["fill_value"].dtype)
+        try:
+            if "data" in group:
+                ds = group["data"]
+                # actual size
+                tot += get_storage_size(ds)
+                # uncompressed size
+                unc += ds.size * self._getDtypeBytes(ds.dtype)
+            if "mask" in group:
+                tot += group["mask"].size *\
+                    self._getDtypeBytes(group["mask"].dtype)
+            if "fill_value" in group:
+                tot += group["fill_value"].size *\
+                    self._getDtypeBytes(group["fill_value"].dtype)
+        except ValueError:
+            # the block was freed (its file closed) meanwhile
+            return 0, 0
         return tot, unc
 
     def _getCacheFile(self, entire_block_roi):
@@ -408,51 +427,76 @@ class OpUnmanagedCompressedCache(Operator):
                                             shape=tuple(),
                                             dtype=self.Output.meta.dtype )
 
-                self._blockLocks[block_start] = RequestLock()
+                # (Keep the lock of a block that was freed, it might be held right now.)
+                self._blockLocks.setdefault( block_start, RequestLock() )
                 self._cacheFiles[block_start] = mem_file
                 self._dirtyBlocks.add( block_start )
             return self._cacheFiles[block_start]
 
 
-    def _ensureCached(self, entire_block_roi):
+    def _ensureCached(self, entire_block_roi, read_block=None):
         """
         Ensure that the cache file for the given block is up-to-date.
         (Refresh it if it's dirty.)
+
+        If given, read_block() is called while the block can't be freed
+        (i.e. with the block lock held), after the block was refreshed.
         """
         block_start = tuple(entire_block_roi[0])
         block_file = self._getCacheFile(entire_block_roi)
-        if block_start in self._dirtyBlocks:
-            updated_cache = False
-            with self._blockLocks[block_start]:
-                # Check AGAIN now that we have the lock.
-                # (Avoid doing this twice in parallel requests.)
-                if block_start in self._dirtyBlocks:
-                    # Can't write directly into the hdf5 dataset because 
-                    #  h5py.dataset.__getitem__ creates a copy, not a view.
-                    # We must use a temporary numpy array to hold the data.
-                    data = self.Input(*entire_block_roi).wait()
-                    block_file['data'][...] = data
-                    if self.Output.meta.has_mask:
-                        block_file['mask'][...] = data.mask
-                        block_file['fill_value'][...] = data.fill_value
-                    
-                    if logger.isEnabledFor(logging.DEBUG):
-                        uncompressed_size = numpy.prod(data.shape) * self._getDtypeBytes(data.dtype)
-                        storage_size = block_file["data"].id.get_storage_size()
-                        if 'mask' in block_file:
-                            storage_size += block_file["mask"].id.get_storage_size()
-                        if 'fill_value' in block_file:
-                            storage_size += block_file["fill_value"].id.get_storage_size()
-                        logger.debug("Storage for block: {} is {}. ({}% of original)".format( block_start, storage_size, 100*storage_size/uncompressed_size ))
-                    with self._lock:
-                        self._dirtyBlocks.remove( block_start )
-                    updated_cache = True
-
-            if updated_cache:
-                # Now that the lock is released, signal that the cache was updated. 
-                self.Output._sig_value_changed()
-                self.OutputHdf5._sig_value_changed()
-                self.CleanBlocks._sig_value_changed()
+        if block_start not in self._dirtyBlocks and read_block is None:
+            return
+
+        updated_cache = False
+        with self._blockLocks[block_start]:
+            if block_start not in self._cacheFiles:
+                # The block was freed since we looked it up.
+                # (This marks it dirty again.)
+                block_file = self._getCacheFile(entire_block_roi)
+
+            # Check AGAIN now that we have the lock.
+            # (Avoid doing this twice in parallel requests.)
+            if block_start in self._dirtyBlocks:
+                # Take the block out of the eviction index while we
+                # hold its lock, so that freeing memory from within
+                # the upstream request can't wait for this block.
+                self._blockFreed( block_start )
+
+                # Can't write directly into the hdf5 dataset because 
+                #  h5py.dataset.__getitem__ creates a copy, not a view.
+                # We must use a temporary numpy array to hold the data.
+                start_time = time.time()
+                data = self.Input(*entire_block_roi).wait()
+                compute_time = time.time() - start_time
+                self._block_compute_times[block_start] = compute_time
+                block_file['data'][...] = data
+                if self.Output.meta.has_mask:
+                    block_file['mask'][...] = data.mask
+                    block_file['fill_value'][...] = data.fill_value
+                
+                if logger.isEnabledFor(logging.DEBUG):
+                    uncompressed_size = numpy.prod(data.shape) * self._getDtypeBytes(data.dtype)
+                    storage_size = block_file["data"].id.get_storage_size()
+                    if 'mask' in block_file:
+                        storage_size += block_file["mask"].id.get_storage_size()
+                    if 'fill_value' in block_file:
+                        storage_size += block_file["fill_value"].id.get_storage_size()
+                    logger.debug("Storage for block: {} is {}. ({}% of original)".format( block_start, storage_size, 100*storage_size/uncompressed_size ))
+                # Index the new block right away: waiting for self._lock
+                #  here could leave it stored but invisible to eviction.
+                self._dirtyBlocks.discard( block_start )
+                self._blockStored( block_start, compute_time )
+                updated_cache = True
+
+            if read_block is not None:
+                read_block()
+
+        if updated_cache:
+            # Now that the lock is released, signal that the cache was updated. 
+            self.Output._sig_value_changed()
+            self.OutputHdf5._sig_value_changed()
+            self.CleanBlocks._sig_value_changed()
+            self._checkMemoryPressure()
 
     def setInSlot(self, slot, subindex, roi, value):
         """
@@ -464,6 +508,7 @@ class OpUnmanagedCompressedCache(Operator):
             self._setInSlotInputHdf5(slot, subindex, roi, value)
         else:
             assert False, "Invalid input slot for setInSlot(): {}".format( slot.name )
+        self._checkMemoryPressure()
 
     def _setInSlotInput(self, slot, subindex, roi, value, store_zero_blocks=True):
         """
@@ -528,11 +573,14 @@ class OpUnmanagedCompressedCache(Operator):
                                self._cacheFiles[block_start].close()
                                del self._cacheFiles[block_start]
                             del self._blockLocks[block_start]
+                        self._blockFreed( block_start )
     
             # Here, we assume that if this function is used to update ANY PART of a 
             #  block, he is responsible for updating the ENTIRE block.
             # Therefore, this block is no longer 'dirty'
             self._dirtyBlocks.discard( block_start )
+            if block_start in self._cacheFiles:
+                self._blockStored( block_start )
     
     #            self.Output._sig_value_changed()
     #            self.OutputHdf5._sig_value_changed()
@@ -573,6 +621,7 @@ class OpUnmanagedCompressedCache(Operator):
 
             block_start = tuple(roi.start)
             self._dirtyBlocks.discard( block_start )
+            self._blockStored( block_start )
         else:
             # This hdf5 data does not correspond to exactly one block.
             # We must uncompress it and write it the "normal" way (the slow way)
@@ -616,9 +665,31 @@ class OpUnmanagedCompressedCache(Operator):
         with self._lock:
             self._blockLocks = {}
             self._cacheFiles = {}
+        self._allBlocksFreed()
+
+    # Notifications for the memory management of OpCompressedCache (see below)
+
+    def _blockStored(self, block_start, compute_time=0.0):
+        pass
+
+    def _blockAccessed(self, block_start):
+        pass
+
+    def _blockFreed(self, block_start):
+        pass
+
+    def _allBlocksFreed(self):
+        pass
+
+    def _checkMemoryPressure(self):
+        # Called without holding any locks after blocks were stored
+        pass
 
 class OpCompressedCache(OpUnmanagedCompressedCache, ManagedBlockedCache):
 
+    # Keep the memory manager's eviction index up to date
+    indexedBlocks = True
+
     def __init__(self, *args, **kwargs):
         super(OpCompressedCache, self).__init__(*args, **kwargs)
         # Now that we're initialized, it's safe to register with the memory manager
@@ -649,6 +720,7 @@ class OpCompressedCache(OpUnmanagedCompressedCache, ManagedBlockedCache):
         with self._lock:
             self._cacheFiles = {}
             self._dirtyBlocks = set()
+            self._block_compute_times = {}
         return mem
 
     def freeDirtyMemory(self):
@@ -677,12 +749,42 @@ class OpCompressedCache(OpUnmanagedCompressedCache, ManagedBlockedCache):
             mem = get_storage_size(ds)
             f.close()
             del self._cacheFiles[block_id]
-            del self._last_access_times[block_id]
+            self._last_access_times.pop(block_id, None)
+            self._block_compute_times.pop(block_id, None)
+            self._blockFreed(block_id)
             return mem
 
+    def _blockStored(self, block_start, compute_time=0.0):
+        # (compressed) storage size
+        size = self._memoryForBlock(block_start)[0]
+        CacheMemoryManager().blockAdded(self, block_start, size, compute_time)
+
+    def _blockAccessed(self, block_start):
+        CacheMemoryManager().blockAccessed(self, block_start)
+
+    def _blockFreed(self, block_start):
+        CacheMemoryManager().blockRemoved(self, block_start)
+
+    def _allBlocksFreed(self):
+        CacheMemoryManager().cacheCleared(self)
+
+    def _checkMemoryPressure(self):
+        CacheMemoryManager().checkMemoryPressure()
+
     def getBlockAccessTimes(self):
         with self._lock:
             # needs to be locked because dicts must not change size
             # during iteration
             return [(key, self._last_access_times[key])
                     for key in self._last_access_times]
+
+    def getBlockCosts(self):
+        with self._lock:
+            # needs to be locked because dicts must not change size
+            # during iteration
+            l = [(key, self._last_access_times[key],
+                  self._block_compute_times.get(key, 0.0))
+                 for key in self._last_access_times]
+        # (compressed) storage size
+        return [(key, t, compute_time, self._memoryForBlock(key)[0])
+                for key, t, compute_time in l]
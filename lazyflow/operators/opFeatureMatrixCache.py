@@ -8,6 +8,7 @@ from lazyflow.graph import Operator, InputSlot, OutputSlot
 from lazyflow.request import RequestLock, Request, RequestPool
 from lazyflow.utility import OrderedSignal
 from lazyflow.roi import getBlockBounds, getIntersectingBlocks, determineBlockShape
+from lazyflow.rtype import PointSet
 
 class OpFeatureMatrixCache(Operator):
     """
@@ -134,23 +135,22 @@ class OpFeatureMatrixCache(Operator):
 
         # Update each block in its own request.
         pool = RequestPool()
-        reqs = {}
         for block_start in self._dirty_blocks:
             req = Request( partial(self._get_features_for_block, block_start ) )
             req.notify_finished( update_progress )
-            reqs[block_start] = req
             pool.add( req )
-        pool.wait()
 
-        # Now store the results we got.
+        # Store the results as they come in, so that the pool doesn't have to hold on to them
+        # (and we don't have to compute more blocks at once than we have workers for).
         # It's better to store the blocks here -- rather than within each request -- to 
         #  avoid contention over self._lock from within every block's request.
-        with self._lock:
-            for block_start, req in reqs.items():
-                if req.result is None:
-                    # 'None' means the block wasn't dirty. No need to update.
-                    continue
-                labels_and_features_matrix = req.result
+        max_in_flight = max(1, 2*Request.global_thread_pool.num_workers)
+        for req in pool.as_completed( max_in_flight ):
+            block_start, labels_and_features_matrix = req.result
+            if labels_and_features_matrix is None:
+                # 'None' means the block wasn't dirty. No need to update.
+                continue
+            with self._lock:
                 self._dirty_blocks.remove(block_start)
                 
                 if labels_and_features_matrix.shape[0] > 0:
@@ -206,19 +206,19 @@ class OpFeatureMatrixCache(Operator):
     def _get_features_for_block(self, block_start):
         """
         Computes the feature matrix for the given block IFF the block is dirty.
-        Otherwise, returns None.
+        Returns (block_start, matrix), where matrix is None if the block wasn't dirty.
         """
         # Caller must ensure that the lock for this block already exists!
         with self._block_locks[block_start]:
             if block_start not in self._dirty_blocks:
                 # Nothing to do if this block isn't actually dirty
                 # (For parallel requests, its theoretically possible.)
-                return None
+                return block_start, None
             block_roi = getBlockBounds( self.LabelImage.meta.shape, self._blockshape, block_start )
             # TODO: Shrink the requested roi using the nonzero blocks slot...
             #       ...or just get rid of the nonzero blocks slot...
             labels_and_features_matrix = self._extract_feature_matrix(block_roi)
-            return labels_and_features_matrix
+            return block_start, labels_and_features_matrix
 
     def _extract_feature_matrix(self, label_block_roi):
         num_feature_channels = self.FeatureImage.meta.shape[-1]
@@ -231,26 +231,13 @@ class OpFeatureMatrixCache(Operator):
             # Return an empty label&feature matrix (of the correct shape)
             return numpy.ndarray( shape=(0, 1 + num_feature_channels), dtype=numpy.float32 )
 
-        # Shrink the roi to the bounding box of nonzero labels
-        block_bounding_box_start = numpy.array( map( numpy.min, label_block_positions ) )
-        block_bounding_box_stop = 1 + numpy.array( map( numpy.max, label_block_positions ) )
-        
-        global_bounding_box_start = block_bounding_box_start + label_block_roi[0][:-1]
-        global_bounding_box_stop  = block_bounding_box_stop + label_block_roi[0][:-1]
-
-        # Since we're just requesting the bounding box, offset the feature positions by the box start
-        bounding_box_positions = numpy.transpose( numpy.transpose(label_block_positions) - numpy.array(block_bounding_box_start) )
-        bounding_box_positions = tuple(bounding_box_positions)
-
-        # Append channel roi (all feature channels)
-        feature_roi_start = list(global_bounding_box_start) + [0]
-        feature_roi_stop = list(global_bounding_box_stop) + [num_feature_channels]
-
-        # Request features (bounding box only)
-        features = self.FeatureImage(feature_roi_start, feature_roi_stop).wait()
+        # Request the features at the label positions only.
+        # (They are computed for small tiles around the labels, or extracted from a cache.)
+        label_positions = numpy.transpose( label_block_positions ) + label_block_roi[0][:-1]
+        features = self.FeatureImage.get( PointSet(self.FeatureImage, label_positions) ).wait()
 
         # Cast as plain ndarray (not VigraArray), since we don't need/want axistags
-        features_matrix = features[bounding_box_positions].view(numpy.ndarray)
+        features_matrix = features.view(numpy.ndarray)
         return numpy.concatenate( (labels_matrix, features_matrix), axis=1)
 
         
\ No newline at end of file
@@ -25,6 +25,7 @@ import collections
 import numpy
 import vigra
 from lazyflow.graph import Operator, InputSlot, OutputSlot
+from lazyflow.fusion import PointwiseStage, executeIsOverridden
 
 class OpReorderAxes(Operator):
     Input = InputSlot()
@@ -116,12 +117,25 @@ class OpReorderAxes(Operator):
         assert len(self._invalid_axes) == 0, \
             "Can't exceute this OpReorderAxes because you are attempting to drop "\
             "the following non-singleton axes: {}.".format( self._invalid_axes )
-        out_roi_dict = dict( enumerate( zip(out_roi.start, out_roi.stop) ) )
+        in_roi = self._inputRoi( out_roi.start, out_roi.stop )
+        
+        # Now write into the special result view
+        self.Input( *in_roi ).writeInto( self._inputView(result) ).wait()
+        return result
+
+    def pointwiseStage(self, slot):
+        if slot is not self.Output or self._invalid_axes or executeIsOverridden(self, OpReorderAxes):
+            return None
+        return PointwiseStage( self, self.Input, input_view=self._inputView, input_roi=self._inputRoi )
+
+    def _inputRoi(self, out_start, out_stop):
+        out_roi_dict = dict( enumerate( zip(out_start, out_stop) ) )
         out_roi_dict[-1] = (0,1) # Input axes that are missing on the output map to roi of 0:1
 
         in_roi_pairs = map( out_roi_dict.__getitem__, self._in_out_map ) # e.g. [(0,1), (0,10), (0,20)]
-        in_roi = zip( *in_roi_pairs ) # e.g. [(0,0,0), (1,10,20)]
+        return zip( *in_roi_pairs ) # e.g. [(0,0,0), (1,10,20)]
 
+    def _inputView(self, result):
         # Create a view of the result that can be written to by the input slot.
         #   1) Drop (singleton) result axes that aren't used by the input
         #   2) Transpose such that 'common' axes are in the order expected by input
@@ -137,11 +151,7 @@ class OpReorderAxes(Operator):
         # This should be faster than using VigraArray.withAxes()
         result_squeezed = result[self._out_squeeze_slicing] # (1)
         result_reordered = numpy.transpose(result_squeezed, self._common_axis_transpose_order) # (2)
-        result_input_view = result_reordered[self._in_unsqueeze_slicing] # (3)
-        
-        # Now write into the special result view
-        self.Input( *in_roi ).writeInto( result_input_view ).wait()
-        return result
+        return result_reordered[self._in_unsqueeze_slicing] # (3)
 
     def propagateDirty(self, inputSlot, subindex, in_roi):
         if inputSlot == self.AxisOrder:
@@ -1,15 +1,18 @@
 import sys
+import collections
 import numpy
 from functools import partial
 from lazyflow.graph import Operator, InputSlot
 from opUnblockedArrayCache import OpUnblockedArrayCache
 from lazyflow.request import Request, RequestPool
 from lazyflow.roi import getIntersectingRois, roiToSlice
-from lazyflow.rtype import SubRegion
+from lazyflow.rtype import SubRegion, PointSet
 
 class OpSimpleBlockedArrayCache(OpUnblockedArrayCache):
     BlockShape = InputSlot(optional=True)
 
+    metaDependencies = { 'Input' : ('shape', 'dtype', 'axistags', 'ram_usage_per_requested_pixel') }
+
     def __init__(self, *args, **kwargs):
         super( OpSimpleBlockedArrayCache, self ).__init__(*args, **kwargs)
         self._blockshape = None
@@ -55,7 +58,8 @@ class OpSimpleBlockedArrayCache(OpUnblockedArrayCache):
 
             # If data data exists already or we can just fetch it without needing extra scratch space,
             # just call the base class
-            block_roi = self._get_containing_block_roi( clipped_block_roi )
+            with self._lock:
+                block_roi = self._get_containing_block_roi( clipped_block_roi )
             if block_roi is not None or (full_block_roi == clipped_block_roi).all():
                 self._execute_Output_impl( clipped_block_roi, result[roiToSlice(*output_roi)] )
             elif self.Input.meta.dontcache:
@@ -67,7 +71,8 @@ class OpSimpleBlockedArrayCache(OpUnblockedArrayCache):
                 
                 # (We use allocateDestination() here to support MaskedArray types.)
                 # TODO: We should probably just get rid of MaskedArray support altogether...
-                full_block_data = self.Output.stype.allocateDestination( SubRegion(self.Output, *full_block_roi ) )
+                # (The cache stores a copy, so this is only scratch space.)
+                full_block_data = self.Output.stype.allocateDestination( SubRegion(self.Output, *full_block_roi ), pooled=True )
                 self._execute_Output_impl( full_block_roi, full_block_data )
     
                 roi_within_block = clipped_block_roi - full_block_roi[0]
@@ -82,4 +87,104 @@ class OpSimpleBlockedArrayCache(OpUnblockedArrayCache):
             req = Request( partial( copy_block, full_block_roi, clipped_block_roi ) )
             pool.add(req)
         pool.wait()
+
+    def execute_points(self, slot, subindex, roi, result):
+        """
+        Overridden from OpUnblockedArrayCache.
+        The blocks that contain the points are fetched (and stored) as usual,
+        then the points are gathered from them.
+        """
+        assert slot is self.Output, "Unknown output slot: {}".format( slot.name )
+        if len(roi.points) == 0:
+            return result
+        shape = numpy.asarray( self.Input.meta.shape )
+        k = roi.dim
+        blockshape = numpy.minimum( self._blockshape, shape )[:k]
+        block_coords = roi.points // blockshape
+        block_grid_shape = 1 + block_coords.max(axis=0)
+        block_ids = numpy.ravel_multi_index( tuple(block_coords.transpose()), block_grid_shape )
+        unique_block_ids, block_indexes = numpy.unique( block_ids, return_inverse=True )
+
+        def gather_block( i, block_id ):
+            # The block (along the point axes), over the full extent of the remaining axes
+            start = numpy.array( numpy.unravel_index( block_id, block_grid_shape ) ) * blockshape
+            stop = numpy.minimum( start + blockshape, shape[:k] )
+            block_roi = SubRegion( self.Output, list(start) + [0]*(len(shape) - k), list(stop) + list(shape[k:]) )
+            block_data = self.Output.stype.allocateDestination( block_roi, pooled=True )
+            self._execute_Output( slot, subindex, block_roi, block_data )
+
+            inside = (block_indexes == i)
+            result[inside] = PointSet( None, roi.points[inside] ).gather( block_data, block_roi.start )
+
+        pool = RequestPool()
+        for i, block_id in enumerate( unique_block_ids ):
+            pool.add( Request( partial( gather_block, i, block_id ) ) )
+        pool.wait()
+        return result
+
+    def requiredInputRois(self, slot, roi):
+        """
+        Overridden from OpUnblockedArrayCache.
+        Uncached data is requested block by block.
+        """
+        if slot is not self.Output:
+            return None
+        full_block_rois = getIntersectingRois( self.Input.meta.shape, self._blockshape, (roi.start, roi.stop), False )
+        return [ (self.Input, block_start, block_stop) for block_start, block_stop in full_block_rois ]
+
+    def _execute_Output_many(self, rois, results):
+        """
+        Overridden from OpUnblockedArrayCache.
+        Each block is fetched (or decompressed) only once, no matter how many of the rois it intersects.
+        """
+        # Find the parts of each block that are needed by each roi
+        parts_by_block = collections.OrderedDict()
+        for roi, result in zip(rois, results):
+            clipped_block_rois = getIntersectingRois( self.Input.meta.shape, self._blockshape, (roi.start, roi.stop), True )
+            full_block_rois = getIntersectingRois( self.Input.meta.shape, self._blockshape, (roi.start, roi.stop), False )
+            for full_block_roi, clipped_block_roi in zip( full_block_rois, clipped_block_rois ):
+                full_block_roi = self._standardize_roi( *full_block_roi )
+                parts_by_block.setdefault(full_block_roi, []).append( (numpy.asarray(clipped_block_roi), roi.start, result) )
+
+        def copy_parts( full_block_roi, parts ):
+            block_start = numpy.asarray( full_block_roi[0] )
+            with self._lock:
+                block_roi = self._get_containing_block_roi( full_block_roi )
+            if block_roi is not None or not self.Input.meta.dontcache:
+                block_data = self._get_block_data( block_roi, full_block_roi )
+            else:
+                # Data isn't in the cache, but we don't need it in the cache anyway.
+                # Just request the bounding box of the parts we need.
+                block_start = numpy.min( [clipped_roi[0] for clipped_roi, _, _ in parts], axis=0 )
+                block_stop = numpy.max( [clipped_roi[1] for clipped_roi, _, _ in parts], axis=0 )
+                block_data = self.Input(block_start, block_stop).wait()
+
+            for clipped_roi, roi_start, result in parts:
+                output_roi = clipped_roi - roi_start
+                roi_within_block = clipped_roi - block_start
+                self.Output.stype.copy_data( result[roiToSlice(*output_roi)],
+                                             block_data[roiToSlice(*roi_within_block)] )
+
+        pool = RequestPool()
+        for full_block_roi, parts in parts_by_block.items():
+            pool.add( Request( partial( copy_parts, full_block_roi, parts ) ) )
+        pool.wait()
+
+    def _get_block_data(self, block_roi, full_block_roi):
+        """
+        Return the data for the given full block, from the given stored block (if it isn't None),
+        or else fetch it and store it in the cache.
+        """
+        if block_roi is not None:
+            with self._lock:
+                data = self._block_data.get(block_roi)
+                if data is not None:
+                    self._touchBlock(block_roi)
+            if data is not None:
+                # Extra [:] here is in case we are decompressing from a chunkedarray
+                if block_roi == full_block_roi:
+                    return data[:]
+                block_relative_roi = numpy.array( full_block_roi ) - block_roi[0]
+                return data[ roiToSlice(*block_relative_roi) ]
+        return self._fetch_and_store_block( full_block_roi, out=None )
         
\ No newline at end of file
@@ -21,16 +21,21 @@
 ###############################################################################
 
 import time
+import threading
 import collections
 from itertools import starmap
+from functools import partial
 import numpy
 import vigra
 
 from lazyflow.graph import Operator, InputSlot, OutputSlot
 from lazyflow.operators.opCache import ManagedBlockedCache
-from lazyflow.request import RequestLock
-from lazyflow.roi import getIntersection, roiFromShape, roiToSlice, containing_rois,\
-    sliceToRoi
+from lazyflow.operators.cacheMemoryManager import CacheMemoryManager
+from lazyflow.request import Request, RequestLock, RequestPool
+from lazyflow.rtype import PointSet
+from lazyflow.utility.roiIndex import RoiIndex
+from lazyflow.roi import getIntersection, roiFromShape, roiToSlice, sliceToRoi,\
+    subtract_rois
 
 import logging
 logger = logging.getLogger(__name__)
@@ -55,10 +60,22 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
     Output = OutputSlot(allow_mask=True)
 
     CleanBlocks = OutputSlot() # A list of slicings indicating which blocks are stored in the cache and clean.
+
+    metaDependencies = { 'Input' : ('shape', 'dtype', 'axistags') }
+
+    # Keep the memory manager's eviction index up to date
+    indexedBlocks = True
+
+    # If the part of a request that isn't covered by stored blocks falls
+    # apart into more pieces than this, the whole request is fetched instead
+    max_missing_parts = 8
     
     def __init__(self, *args, **kwargs):
         super( OpUnblockedArrayCache, self ).__init__(*args, **kwargs)
-        self._lock = RequestLock()
+        # Only guards the dicts below and is never held while waiting for
+        # a request. A plain lock can't suspend the calling request, so
+        # blocks are freed right away when the memory manager asks for it.
+        self._lock = threading.Lock()
         self._resetBlocks()
 
         # Now that we're initialized, it's safe to register with the memory manager
@@ -84,8 +101,86 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
         else:
             assert False, "Unknown output slot: {}".format( slot.name )
         
+    def execute_many(self, slot, subindex, rois, results):
+        if slot is not self.Output:
+            return super( OpUnblockedArrayCache, self ).execute_many(slot, subindex, rois, results)
+        self._execute_Output_many(rois, results)
+        return results
+
+    def requiredInputRois(self, slot, roi):
+        # Uncached data is requested exactly as it was requested from us.
+        if slot is self.Output:
+            return [ (self.Input, roi.start, roi.stop) ]
+        return None
+
+    def execute_points(self, slot, subindex, roi, result):
+        """
+        Points within stored blocks are extracted from the cache.
+        For the rest, small tiles around them are requested (and stored),
+        as for operators that can't compute points (see PointSet.tiles()).
+        """
+        assert slot is self.Output, "Unknown output slot: {}".format( slot.name )
+        points = roi.points
+        k = roi.dim
+        shape = self.Input.meta.shape
+        remaining = numpy.ones( len(points), dtype=bool )
+        with self._lock:
+            stored_blocks = self._block_data.items()
+
+        for block_roi, block_data in stored_blocks:
+            block_start, block_stop = map(numpy.array, block_roi)
+            if (block_start[k:] != 0).any() or (block_stop[k:] != shape[k:]).any():
+                # Block doesn't contain all values of the remaining axes.
+                continue
+            inside = remaining & ((points >= block_start[:k]) & (points < block_stop[:k])).all(axis=1)
+            if not inside.any():
+                continue
+            # Extra [:] here is in case we are decompressing from a chunkedarray
+            block_points = PointSet( None, points[inside] )
+            result[inside] = block_points.gather( block_data[:], block_start )
+            remaining &= ~inside
+
+        if remaining.any():
+            remaining_points = PointSet( self.Output, points[remaining] )
+            result[remaining] = self.Output._getPointsFromTiles( remaining_points ).wait()
+        return result
+
     def _execute_Output(self, slot, subindex, roi, result):
         self._execute_Output_impl((roi.start, roi.stop), result)
+
+    def _execute_Output_many(self, rois, results):
+        # Group the rois by the stored block they fit into.
+        parts_by_block = collections.OrderedDict()
+        missing_parts = []
+        with self._lock:
+            for roi, result in zip(rois, results):
+                request_roi = self._standardize_roi(roi.start, roi.stop)
+                block_roi = self._get_containing_block_roi( request_roi )
+                if block_roi is None:
+                    missing_parts.append( (request_roi, result) )
+                else:
+                    parts_by_block.setdefault(block_roi, []).append( (request_roi, result) )
+                    self._touchBlock(block_roi)
+            block_data = dict( (block_roi, self._block_data[block_roi]) for block_roi in parts_by_block )
+
+        # Request the missing data first, so it's computed while we copy the rest.
+        requests = [ Request( partial(self._execute_Output_impl, request_roi, result) )
+                     for request_roi, result in missing_parts ]
+        for req in requests:
+            req.submit()
+
+        for block_roi, parts in parts_by_block.items():
+            data = block_data[block_roi]
+            if len(parts) > 1:
+                # Extra [:] here is in case we are decompressing from a chunkedarray
+                # (Decompress once for all rois within this block.)
+                data = data[:]
+            for request_roi, result in parts:
+                block_relative_roi = numpy.array( request_roi ) - block_roi[0]
+                self.Output.stype.copy_data(result, data[ roiToSlice(*block_relative_roi) ])
+
+        for req in requests:
+            req.wait()
         
     def _execute_Output_impl(self, request_roi, result):
         request_roi = self._standardize_roi(*request_roi)
@@ -95,25 +190,51 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
                 # Data is already in the cache. Just extract it.
                 block_relative_roi = numpy.array( request_roi ) - block_roi[0]
                 self.Output.stype.copy_data(result, self._block_data[block_roi][ roiToSlice(*block_relative_roi) ])
+                self._touchBlock(block_roi)
                 return
 
+            # Maybe (parts of) the roi are stored in several blocks
+            overlapping_blocks = [ (block_roi, self._block_data[block_roi])
+                                   for block_roi in self._block_index.intersecting( request_roi ) ]
+            for block_roi, _ in overlapping_blocks:
+                self._touchBlock(block_roi)
+
+        missing_rois = [ request_roi ]
+        if overlapping_blocks:
+            uncovered_rois = subtract_rois( request_roi, [ block_roi for block_roi, _ in overlapping_blocks ],
+                                            self.max_missing_parts )
+            if uncovered_rois is not None:
+                missing_rois = uncovered_rois
+                for block_roi, block_data in overlapping_blocks:
+                    intersection = numpy.array( getIntersection( block_roi, request_roi ) )
+                    self.Output.stype.copy_data( result[ roiToSlice(*(intersection - request_roi[0])) ],
+                                                 block_data[ roiToSlice(*(intersection - block_roi[0])) ] )
+
+        # Request the missing data (if any) from upstream
+        if len(missing_rois) == 1:
+            missing_roi = missing_rois[0]
+            self._fetch_missing(missing_roi, result[ roiToSlice(*(numpy.array(missing_roi) - request_roi[0])) ])
+        elif missing_rois:
+            pool = RequestPool()
+            for missing_roi in missing_rois:
+                out = result[ roiToSlice(*(numpy.array(missing_roi) - request_roi[0])) ]
+                pool.add( Request( partial(self._fetch_missing, missing_roi, out) ) )
+            pool.wait()
+
+    def _fetch_missing(self, missing_roi, out):
         if self.Input.meta.dontcache:
             # Data isn't in the cache, but we don't want to cache it anyway.
-            self.Input(*request_roi).writeInto(result).block()
+            self.Input(*missing_roi).writeInto(out).block()
             return
         
         # Data isn't in the cache, so request it and cache it
-        self._fetch_and_store_block(request_roi, out=result)
+        self._fetch_and_store_block(missing_roi, out=out)
 
     def _get_containing_block_roi(self, request_roi):
         # Does this roi happen to fit ENTIRELY within an existing stored block?
+        # (Call this with self._lock held.)
         request_roi = self._standardize_roi(*request_roi)
-        outer_rois = containing_rois( self._block_data.keys(), request_roi )
-        if len(outer_rois) > 0:
-            # Standardize roi for usage as dict key
-            block_roi = self._standardize_roi( *outer_rois[0] )
-            return block_roi
-        return None
+        return self._block_index.containing( request_roi )
 
     def _fetch_and_store_block(self, block_roi, out):
         if out is not None:
@@ -141,15 +262,22 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
             req = self.Input(*block_roi)
             if out is not None:
                 req.writeInto(out)
+            start_time = time.time()
             block_data = req.wait()
-            self._store_block_data(block_roi, block_data)
+            compute_time = time.time() - start_time
+            self._store_block_data(block_roi, block_data, compute_time)
+
+        # Free memory right away if we crossed the high watermark.
+        # (Not while holding the block lock, any block may be freed.)
+        CacheMemoryManager().checkMemoryPressure()
         return block_data
 
     
-    def _store_block_data(self, block_roi, block_data):
+    def _store_block_data(self, block_roi, block_data, compute_time=0.0):
         """
         Copy block_data and store it into the cache.
         The block_lock is not obtained here, so lock it before you call this.
+        The compute_time (in seconds) is used for cost-aware eviction.
         """
         if self.CompressionEnabled.value and numpy.dtype(block_data.dtype) in [numpy.dtype(numpy.uint8),
                                                                                numpy.dtype(numpy.uint32),
@@ -166,9 +294,21 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
             #   cache while we were requesting it. 
             # (Could have happened via propagateDirty() or eventually the arrayCacheMemoryMgr)
             if block_roi in self._block_locks:
+                mem = self._blockMemory(block_storage_data)
+                self._used_memory += mem - self._blockMemory(self._block_data.get(block_roi))
                 self._block_data[block_roi] = block_storage_data
+                self._block_index.add(block_roi)
+                self._block_compute_times[block_roi] = compute_time
+                self._last_access_times[block_roi] = time.time()
+                CacheMemoryManager().blockAdded(self, block_roi, mem, compute_time)
 
+    def _touchBlock(self, block_roi):
+        """
+        Update the access time of a stored block.
+        Call this with self._lock held.
+        """
         self._last_access_times[block_roi] = time.time()
+        CacheMemoryManager().blockAccessed(self, block_roi)
 
     def _execute_CleanBlocks(self, slot, subindex, roi, result):
         with self._lock:
@@ -187,6 +327,7 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
 
         with block_lock:
             self._store_block_data(block_roi, block_data)
+        CacheMemoryManager().checkMemoryPressure()
 
     def propagateDirty(self, slot, subindex, roi):
         dirty_roi = self._standardize_roi( roi.start, roi.stop )
@@ -198,11 +339,10 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
             # Everything is dirty, so no need to loop
             self._resetBlocks()
         else:
-            # FIXME: This is O(N) for now.
-            #        We should speed this up by maintaining a bookkeeping data structure in execute().
-            for block_roi in self._block_data.keys():
-                if getIntersection(block_roi, dirty_roi, assertIntersect=False):
-                    self.freeBlock(block_roi)
+            with self._lock:
+                dirty_blocks = self._block_index.intersecting(dirty_roi)
+            for block_roi in dirty_blocks:
+                self.freeBlock(block_roi)
 
         self.Output.setDirty( roi.start, roi.stop )
 
@@ -210,20 +350,8 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
     ## OpManagedCache interface implementation
     ##
     def usedMemory(self):
-        total = 0.0
-        for k in self._block_data.keys():
-            try:
-                block = self._block_data[k]
-                bytes_per_pixel = numpy.dtype(block.dtype).itemsize
-                portion = block.size * bytes_per_pixel
-            except (KeyError, AttributeError):
-                # what could have happened and why it's fine
-                #  * block was deleted (then it does not occupy memory)
-                #  * block is not array data (then we don't know how
-                #    much memory it ouccupies)
-                portion = 0.0
-            total += portion
-        return total
+        # (running sum, updated whenever a block is stored or freed)
+        return self._used_memory
     
     def fractionOfUsedMemoryDirty(self):
         # dirty memory is discarded immediately
@@ -240,6 +368,25 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
                  for k in self._last_access_times]
         return l
 
+    def getBlockCosts(self):
+        with self._lock:
+            l = [(k, self._last_access_times[k],
+                  self._block_compute_times.get(k, 0.0),
+                  self._blockMemory(self._block_data.get(k)))
+                 for k in self._last_access_times]
+        return l
+
+    def _blockMemory(self, block):
+        if block is None:
+            return 0
+        try:
+            bytes_per_pixel = numpy.dtype(block.dtype).itemsize
+            return block.size * bytes_per_pixel
+        except AttributeError:
+            # block is not array data (then we don't know how much
+            # memory it occupies)
+            return 0
+
     def freeMemory(self):
         used = self.usedMemory()
         self._resetBlocks()
@@ -249,12 +396,14 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
         with self._lock:
             if key not in self._block_locks:
                 return 0
-            block = self._block_data[key]
-            bytes_per_pixel = numpy.dtype(block.dtype).itemsize
-            mem = block.size * bytes_per_pixel
-            del self._block_data[key]
+            mem = self._blockMemory(self._block_data.get(key))
+            self._block_data.pop(key, None)
+            self._block_index.remove(key)
             del self._block_locks[key]
-            del self._last_access_times[key]
+            self._last_access_times.pop(key, None)
+            self._block_compute_times.pop(key, None)
+            self._used_memory -= mem
+            CacheMemoryManager().blockRemoved(self, key)
             return mem
 
     def freeDirtyMemory(self):
@@ -263,5 +412,10 @@ class OpUnblockedArrayCache(Operator, ManagedBlockedCache):
     def _resetBlocks(self):
         with self._lock:
             self._block_data = {}
+            # spatial index over the keys of _block_data
+            self._block_index = RoiIndex()
             self._block_locks = {}
             self._last_access_times = collections.defaultdict(float)
+            self._block_compute_times = {}
+            self._used_memory = 0.0
+            CacheMemoryManager().cacheCleared(self)
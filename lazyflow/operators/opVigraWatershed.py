@@ -97,6 +97,15 @@ class OpVigraWatershed(Operator):
         
         return paddedSlices, outputSlices
     
+    def requiredInputRois(self, slot, roi):
+        paddedSlices, outputSlices = self.getSlicings(roi)
+        start = tuple( s.start for s in paddedSlices )
+        stop = tuple( s.stop for s in paddedSlices )
+        input_rois = [ (self.InputImage, start, stop) ]
+        if self.SeedImage.ready():
+            input_rois.append( (self.SeedImage, start, stop) )
+        return input_rois
+
     def execute(self, slot, subindex, roi, result):
         assert slot == self.Output
 
@@ -40,6 +40,7 @@ from lazyflow.graph import Operator, InputSlot, OutputSlot, OrderedSignal
 from lazyflow import roi
 from lazyflow.roi import sliceToRoi, roiToSlice
 from lazyflow.request import RequestPool
+from lazyflow.utility.bufferPool import default_buffer_pool
 from operators import OpArrayPiper
 from lazyflow.rtype import SubRegion
 from generic import OpMultiArrayStacker, popFlagsFromTheKey
@@ -365,7 +366,24 @@ class OpPixelFeaturesPresmoothed(Operator):
             self.Output.setDirty(slice(None))
         else:
             assert False, "Unknown dirty input slot."
-            
+
+    def requiredInputRois(self, slot, rroi):
+        """
+        execute() reads all channels of the Input, with the halo of the features (sigma 0.7)
+        plus the halo of the presmoothing (maxSigma) around the spatial axes of the roi.
+        """
+        if slot is not self.Output:
+            return None
+        axiskeys = self.Input.meta.getAxisKeys()
+        spatial_axes = [ key not in 'ct' for key in axiskeys ]
+        shape = self.Input.meta.shape
+        maxSigma = max(0.7,self.maxSigma)
+        start, stop = roi.enlargeRoiForHalo(rroi.start, rroi.stop, shape, 0.7, self.WINDOW_SIZE, enlarge_axes=spatial_axes)
+        start, stop = roi.enlargeRoiForHalo(start, stop, shape, maxSigma, self.WINDOW_SIZE, enlarge_axes=spatial_axes)
+        channelAxis = axiskeys.index('c')
+        start[channelAxis] = 0
+        stop[channelAxis] = shape[channelAxis]
+        return [ (self.Input, start, stop) ]
 
     def execute(self, slot, subindex, rroi, result):
         assert slot == self.Features or slot == self.Output
@@ -512,7 +530,7 @@ class OpPixelFeaturesPresmoothed(Operator):
                             vigOpSourceShape.insert(timeAxis-1, ( oldstop - oldstart)[timeAxis])
                         vigOpSourceShape.insert(channelAxis, inShape[channelAxis])
     
-                        sourceArraysForSigmas[j] = numpy.ndarray(tuple(vigOpSourceShape),numpy.float32)
+                        sourceArraysForSigmas[j] = default_buffer_pool.allocate(tuple(vigOpSourceShape),numpy.float32)
                         for i,vsa in enumerate(sourceArrayV.timeIter()):
                             droi = (tuple(vigOpSourceStart._asint()), tuple(vigOpSourceStop._asint()))
                             tmp_key = getAllExceptAxis(len(sourceArraysForSigmas[j].shape),timeAxis, i)
@@ -601,12 +619,11 @@ class OpPixelFeaturesPresmoothed(Operator):
             pool.wait()
             pool.clean()
 
+            # Release the presmoothed source arrays. (They come from the buffer pool, so they
+            #  can't be resized. Their memory is returned once the last reference is gone.)
+            del closures
             for i in range(len(sourceArraysForSigmas)):
-                if sourceArraysForSigmas[i] is not None:
-                    try:
-                        sourceArraysForSigmas[i].resize((1,))
-                    except:
-                        sourceArraysForSigmas[i] = None
+                sourceArraysForSigmas[i] = None
 
 ###################################################3
 class OpPixelFeaturesInterpPresmoothed(Operator):
@@ -1031,7 +1048,7 @@ class OpPixelFeaturesInterpPresmoothed(Operator):
                         vigOpSourceShape.insert(timeAxis-1, ( oldstop - oldstart)[timeAxis])
                     vigOpSourceShape.insert(channelAxis, inShape[channelAxis])
                     logger.debug( "vigOpSourceShape: {}".format( vigOpSourceShape ) )
-                    sourceArraysForSigmas[j] = numpy.ndarray(tuple(vigOpSourceShape),numpy.float32)
+                    sourceArraysForSigmas[j] = default_buffer_pool.allocate(tuple(vigOpSourceShape),numpy.float32)
                     for i,vsa in enumerate(sourceArrayVInterp.timeIter()):
                         droi = (tuple(vigOpSourceStart._asint()), tuple(vigOpSourceStop._asint()))
                         tmp_key = getAllExceptAxis(len(sourceArraysForSigmas[j].shape),timeAxis, i)
@@ -1136,12 +1153,11 @@ class OpPixelFeaturesInterpPresmoothed(Operator):
             pool.wait()
             pool.clean()
 
+            # Release the presmoothed source arrays. (They come from the buffer pool, so they
+            #  can't be resized. Their memory is returned once the last reference is gone.)
+            del closures
             for i in range(len(sourceArraysForSigmas)):
-                if sourceArraysForSigmas[i] is not None:
-                    try:
-                        sourceArraysForSigmas[i].resize((1,))
-                    except:
-                        sourceArraysForSigmas[i] = None
+                sourceArraysForSigmas[i] = None
 
 
 
@@ -1166,6 +1182,26 @@ class OpBaseVigraFilter(OpArrayPiper):
     supportsRoi = False
     supportsWindow = False
 
+    def requiredInputRois(self, slot, rroi):
+        """
+        execute() reads the input channels that the requested channels are computed from,
+        with a halo (sigma 0.7) around the spatial axes of the roi.
+        """
+        axiskeys = self.Input.meta.getAxisKeys()
+        if 'c' not in axiskeys:
+            # The output has an extra channel axis.
+            return None
+        spatial_axes = [ key not in 'ct' for key in axiskeys ]
+        windowSize = 3.5
+        if self.supportsWindow:
+            windowSize = self.window_size_smoother
+        start, stop = roi.enlargeRoiForHalo(rroi.start, rroi.stop, self.Input.meta.shape, 0.7, windowSize, enlarge_axes=spatial_axes)
+        channelAxis = axiskeys.index('c')
+        channelsPerChannel = self.resultingChannels()
+        start[channelAxis] = rroi.start[channelAxis] // channelsPerChannel
+        stop[channelAxis] = -(-rroi.stop[channelAxis] // channelsPerChannel)
+        return [ (self.Input, start, stop) ]
+
     def execute(self, slot, subindex, rroi, result, sourceArray=None):
         assert len(subindex) == self.Output.level == 0
         key = roiToSlice(rroi.start, rroi.stop)
@@ -20,3 +20,6 @@
 #		   http://ilastik.org/license/
 ###############################################################################
 from request import *
+from processPool import ProcessPool, SharedArray
+from asyncioBridge import as_future, get_async
+from tracing import RequestTracer
@@ -0,0 +1,113 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+"""
+Adapters for awaiting lazyflow requests from an asyncio event loop.
+
+Unlike ``req.wait()`` (or ``loop.run_in_executor(None, req.wait)``), awaiting
+a request doesn't block any thread: the request's completion callbacks resolve
+an asyncio future in the event loop thread.  Cancelling the future (e.g. by
+cancelling the task that awaits it) calls ``Request.cancel()``.
+
+Example (with ``trollius``, the Python 2 backport of ``asyncio``)::
+
+    import trollius
+    from trollius import From, Return
+
+    @trollius.coroutine
+    def load(op, roi):
+        data = yield From( get_async( op.Output, roi ) )
+        raise Return( data )
+
+Requires ``asyncio`` or ``trollius``, unless an event loop that provides
+``create_future()`` and ``call_soon_threadsafe()`` is passed explicitly.
+"""
+import logging
+logger = logging.getLogger(__name__)
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
+def as_future(request, loop=None):
+    """
+    Submit the given request (if necessary) and return an asyncio future for its result.
+    Must be called from the event loop thread.
+
+    - If the request finishes, the future's result is the request's result.
+    - If the request fails, the future raises the request's exception.
+    - If the request is cancelled, the future is cancelled.
+    - If the future is cancelled, the request is cancelled (if nobody else is waiting for it).
+
+    :param request: The Request to await.
+    :param loop: The event loop to resolve the future in (default: the current event loop).
+    """
+    if asyncio is None and (loop is None or not hasattr(loop, 'create_future')):
+        raise ImportError("as_future() requires asyncio (or trollius)")
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    if hasattr(loop, 'create_future'):
+        future = loop.create_future()
+    else:
+        future = asyncio.Future(loop=loop)
+
+    # The request callbacks are called in whichever thread finishes the request,
+    # so they must hand over to the event loop thread.
+    def resolve(fn, *args):
+        try:
+            loop.call_soon_threadsafe(fn, *args)
+        except RuntimeError:
+            # The loop was closed in the meantime.  Nobody is waiting for the result any more.
+            logger.debug("Event loop closed before request completed: {}".format(request))
+
+    def set_result(result):
+        if not future.done():
+            future.set_result(result)
+
+    def set_exception(exc):
+        if not future.done():
+            future.set_exception(exc)
+
+    def cancel_future():
+        future.cancel()
+
+    request.notify_finished( lambda result: resolve(set_result, result) )
+    request.notify_failed( lambda exc, exc_info: resolve(set_exception, exc) )
+    request.notify_cancelled( lambda: resolve(cancel_future) )
+
+    def cancel_request(f):
+        if f.cancelled():
+            request.cancel()
+    future.add_done_callback(cancel_request)
+
+    request.submit()
+    return future
+
+def get_async(slot, roi, loop=None):
+    """
+    Awaitable equivalent of ``slot.get(roi).wait()``.
+    Returns an asyncio future for the data of the given roi.
+    """
+    return as_future(slot.get(roi), loop)
@@ -0,0 +1,321 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+# Built-in
+import os
+import tempfile
+import traceback
+import functools
+import itertools
+import threading
+import multiprocessing
+from multiprocessing.queues import SimpleQueue
+import cPickle as pickle
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Third-party
+import numpy
+
+# lazyflow
+from request import Request, RequestLock
+
+# Arrays smaller than this (in bytes) are simply pickled.
+# For bigger arrays, a shared memory file is cheaper.
+SHARED_MEMORY_THRESHOLD = 64*1024
+
+# How often (in seconds) the pool checks that the workers of running jobs are still alive.
+LIVENESS_CHECK_INTERVAL = 0.2
+
+def _shared_memory_dir():
+    # On Linux, /dev/shm is a RAM-backed filesystem.
+    # Elsewhere, fall back to a normal temp file (which the OS page cache will keep in RAM anyway).
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+class SharedArray(object):
+    """
+    Picklable handle to a numpy array stored in a (memory-backed) file,
+    so that it can be passed between processes without copying it through a pipe.
+    The creator of a SharedArray is responsible for calling unlink() when it is no longer needed.
+    """
+    def __init__(self, path, shape, dtype):
+        self.path = path
+        self.shape = tuple(shape)
+        self.dtype = numpy.dtype(dtype)
+
+    @classmethod
+    def create(cls, shape, dtype):
+        fd, path = tempfile.mkstemp(prefix='lazyflow-shared-', dir=_shared_memory_dir())
+        try:
+            os.ftruncate(fd, max(1, numpy.prod(shape)) * numpy.dtype(dtype).itemsize)
+        finally:
+            os.close(fd)
+        return SharedArray(path, shape, dtype)
+
+    @classmethod
+    def from_array(cls, a):
+        shared = cls.create(a.shape, a.dtype)
+        view = shared.open('r+')
+        view[...] = a
+        del view
+        return shared
+
+    def open(self, mode='r+'):
+        """
+        Return a numpy.memmap of the shared data.
+        Use mode='c' for a private (copy-on-write) view.
+        """
+        return numpy.memmap(self.path, dtype=self.dtype, mode=mode, shape=self.shape)
+
+    def unlink(self):
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+def _ship(a):
+    if isinstance(a, numpy.ndarray) and a.nbytes >= SHARED_MEMORY_THRESHOLD:
+        return SharedArray.from_array(a)
+    return a
+
+# (In the worker processes) The queue on which workers report which job they have started.
+_started_jobs = None
+
+def _init_worker(started_jobs):
+    global _started_jobs
+    _started_jobs = started_jobs
+
+def _execute_in_child(job_id, payload):
+    """
+    Runs in the worker process.
+    Both the task and its outcome are pickled by hand, so that (un)pickling errors
+    are reported to the caller instead of getting stuck in the multiprocessing machinery.
+    """
+    _started_jobs.put( (job_id, os.getpid()) )
+    try:
+        fn, args, kwargs, out_handle = pickle.loads(payload)
+        args = [ a.open('c') if isinstance(a, SharedArray) else a for a in args ]
+        result = fn(*args, **kwargs)
+        if out_handle is not None:
+            out = out_handle.open('r+')
+            out[...] = result
+            out.flush()
+            del out
+            result = None
+        elif isinstance(result, numpy.memmap):
+            result = numpy.array(result)
+        return pickle.dumps( (True, _ship(result)), pickle.HIGHEST_PROTOCOL )
+    except Exception as ex:
+        tb = traceback.format_exc()
+        try:
+            return pickle.dumps( (False, (ex, tb)), pickle.HIGHEST_PROTOCOL )
+        except Exception:
+            return pickle.dumps( (False, (RuntimeError(str(ex)), tb)), pickle.HIGHEST_PROTOCOL )
+
+class ProcessPool(object):
+    """
+    A pool of persistent worker processes for GIL-bound work (pure-Python loops, etc.),
+    which gain nothing from the request ThreadPool.
+
+    Work is expressed as a picklable function (e.g. a module-level function) and its arguments.
+    Large numpy arrays among the arguments and the result are transferred via shared memory.
+    The function must not depend on the operator graph, which is not available in the worker processes.
+
+    Example (within an operator's ``execute()``)::
+
+        data = self.Input(roi.start, roi.stop).wait()
+        ProcessPool.global_process_pool.apply( _compute_histograms, data, nbins, out=result )
+
+    If the pool has no workers (the default), ``apply()`` simply calls the function in the current thread.
+
+    If a worker process dies while it executes a job (e.g. it is killed for using too much memory),
+    multiprocessing silently replaces the worker and drops the job.  A watchdog thread notices that
+    and raises a RuntimeError in the caller instead.
+    """
+
+    #: The pool used by operators that opt in to process-based execution. See reset_global_process_pool()
+    global_process_pool = None
+
+    @classmethod
+    def reset_global_process_pool(cls, num_workers=multiprocessing.cpu_count()):
+        """
+        Replace the global process pool with a pool of ``num_workers`` processes.
+        A pool with 0 workers executes everything in the calling thread.
+
+        .. note:: Worker processes are forked when the pool is created.
+                  It should be (re)set during startup, before any graph state is needed in them.
+        """
+        if cls.global_process_pool is not None:
+            cls.global_process_pool.stop()
+        cls.global_process_pool = ProcessPool(num_workers)
+
+    def __init__(self, num_workers):
+        self.num_workers = num_workers
+        self._pool = None
+        if num_workers > 0:
+            self._jobs = {} # job id : _Job, for the jobs that haven't finished yet
+            self._jobs_lock = threading.Lock()
+            self._job_ids = itertools.count()
+            self._started_jobs = SimpleQueue()
+            self._pool = multiprocessing.Pool(num_workers, _init_worker, (self._started_jobs,))
+
+            self._stopped = threading.Event()
+            self._watchdog = threading.Thread( target=self._watch_workers, args=(self._pool,),
+                                               name="ProcessPool watchdog" )
+            self._watchdog.daemon = True
+            self._watchdog.start()
+
+    def stop(self):
+        if self._pool is not None:
+            self._stopped.set()
+            self._watchdog.join()
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+            # Nobody will finish the remaining jobs anymore.
+            with self._jobs_lock:
+                job_ids = self._jobs.keys()
+            for job_id in job_ids:
+                self._fail( job_id, RuntimeError("The process pool was stopped.") )
+
+    def apply(self, fn, *args, **kwargs):
+        """
+        Call ``fn(*args, **kwargs)`` in a worker process and return its result.
+        If called from within a Request, the request is suspended (not its worker thread)
+        until the result is available.
+
+        :param out: (keyword-only) If given, the result is written into this array (which is returned).
+        """
+        out = kwargs.pop('out', None)
+        if self._pool is None:
+            result = fn(*args, **kwargs)
+            if out is not None:
+                out[...] = result
+                return out
+            return result
+
+        shared_arrays = []
+        try:
+            shipped_args = []
+            for a in args:
+                a = _ship(a)
+                if isinstance(a, SharedArray):
+                    shared_arrays.append(a)
+                shipped_args.append(a)
+
+            out_handle = None
+            if out is not None:
+                out_handle = SharedArray.create(out.shape, out.dtype)
+                shared_arrays.append(out_handle)
+
+            payload = pickle.dumps( (fn, shipped_args, kwargs, out_handle), pickle.HIGHEST_PROTOCOL )
+            success, value = pickle.loads( self._run(payload) )
+            if not success:
+                ex, tb = value
+                logger.debug("Exception in process pool worker:\n" + tb)
+                raise ex
+
+            if out_handle is not None:
+                out[...] = out_handle.open('r')
+                return out
+            if isinstance(value, SharedArray):
+                shared_arrays.append(value)
+                return numpy.array(value.open('r'))
+            return value
+        finally:
+            for shared in shared_arrays:
+                shared.unlink()
+
+    def request(self, fn, *args, **kwargs):
+        """
+        Return a Request that runs ``apply(fn, *args, **kwargs)``.
+        It can be waited for or added to a RequestPool like any other request.
+        """
+        return Request( functools.partial(self.apply, fn, *args, **kwargs) )
+
+    def _run(self, payload):
+        # The pool's result-handler thread (or the watchdog) releases the lock when the job is done.
+        # RequestLock suspends the current request in the meantime (or blocks a foreign thread).
+        job = _Job()
+        job.lock.acquire()
+        job_id = next(self._job_ids)
+        with self._jobs_lock:
+            self._jobs[job_id] = job
+        self._pool.apply_async( _execute_in_child, (job_id, payload),
+                                callback=functools.partial(self._finish, job_id) )
+        job.lock.acquire()
+        job.lock.release()
+        return job.outcome
+
+    def _finish(self, job_id, outcome):
+        with self._jobs_lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            job.outcome = outcome
+            job.lock.release()
+
+    def _fail(self, job_id, ex):
+        self._finish( job_id, pickle.dumps( (False, (ex, "")), pickle.HIGHEST_PROTOCOL ) )
+
+    def _watch_workers(self, pool):
+        """
+        Fail the jobs whose worker process has died.
+        (Runs in its own thread until the pool is stopped.)
+        """
+        while not self._stopped.wait(LIVENESS_CHECK_INTERVAL):
+            while not self._started_jobs.empty():
+                job_id, pid = self._started_jobs.get()
+                with self._jobs_lock:
+                    job = self._jobs.get(job_id)
+                    if job is not None:
+                        job.pid = pid
+
+            # The pool removes dead workers from this list (and replaces them).
+            # (Don't poll the worker processes ourselves: that would reap them before the pool does.)
+            live_pids = set( process.pid for process in list(pool._pool) )
+            with self._jobs_lock:
+                orphaned = [ (job_id, job) for job_id, job in self._jobs.items()
+                             if job.pid is not None and job.pid not in live_pids ]
+            for job_id, job in orphaned:
+                if not job.orphaned:
+                    # Its result might still be on its way. Check again next time.
+                    job.orphaned = True
+                    continue
+                logger.error( "Process pool worker {} died while executing a job".format( job.pid ) )
+                self._fail( job_id, RuntimeError("The process pool worker (pid {}) died while executing this job."
+                                                 .format( job.pid )) )
+
+class _Job(object):
+    """
+    A job that has been submitted to the worker processes.
+    """
+    __slots__ = ('lock', 'outcome', 'pid', 'orphaned')
+    def __init__(self):
+        self.lock = RequestLock()
+        self.outcome = None
+        self.pid = None       # The worker process that executes the job (once it has started)
+        self.orphaned = False # True once the job's worker has been found dead
+
+ProcessPool.reset_global_process_pool(0)
@@ -25,6 +25,8 @@ import heapq
 import functools
 import itertools
 import threading
+import collections
+import contextlib
 import multiprocessing
 import platform
 import traceback
@@ -87,18 +89,66 @@ def log_exception( logger, msg=None, exc_info=None, level=logging.ERROR ):
     if msg:
         logger.log(level, msg )
 
+# Shared placeholder for the (usually empty) sets of related requests.
+# Each request only allocates its own set once it actually needs to add something.
+_NO_REQUESTS = frozenset()
+
+# Sorts after all real deadlines
+_NO_DEADLINE = float('inf')
+
+class _ThreadScheduling(threading.local):
+    """
+    The scheduling class and deadline of new root requests, per (foreign) thread.
+    See Request.scheduling_context()
+    """
+    scheduling_class = 0 # Request.INTERACTIVE
+    deadline = None
+
+_thread_scheduling = _ThreadScheduling()
+
 class Request( object ):
-    
+
+    # Requests are created in huge numbers, so we keep them as small (and cheap to construct) as possible.
+    # The '__dict__' slot still permits other attributes to be added to individual requests.
+    # (The dict is only allocated if that actually happens.)
+    __slots__ = ( '_lock', '_sig_failed', '_sig_cancelled', '_sig_finished', '_sig_execution_complete',
+                  'fn', 'io_bound', '_result',
+                  'started', 'cancelled', 'uncancellable', 'finished', 'execution_complete', '_finished_event',
+                  'exception', 'exception_info', '_cleaned',
+                  'greenlet', '_assigned_worker',
+                  'pending_requests', 'blocking_requests', 'child_requests',
+                  '_current_foreign_thread', 'parent_request', '_max_child_priority', '_priority',
+                  'scheduling_class', 'deadline', 'urgency', '_sort_key',
+                  '__weakref__', '__dict__' )
+
+    #: Scheduling classes (see the ``scheduling_class`` parameter of the constructor).
+    #: Requests of a more urgent class (lower value) are always scheduled first.
+    INTERACTIVE = 0
+    PREFETCH = 1
+    BATCH = 2
+
     # One thread pool shared by all requests.
     # See initialization after this class definition (below)
     global_thread_pool = None
 
+    # An optional, separate thread pool for I/O-bound requests.
+    # If None, I/O-bound requests are executed in the global_thread_pool, like all others.
+    # See reset_io_thread_pool()
+    global_io_thread_pool = None
+
+    # The active RequestTracer, if any.  See tracing.py
+    _tracer = None
+
+    # If not None, called with True when wait() starts waiting for an unfinished request,
+    # and with False when it's done.  See lazyflow/executionStats.py
+    _wait_listener = None
+
     # For protecting class variables
     class_lock = threading.Lock()
     active_count = 0
 
     @classmethod
-    def reset_thread_pool( cls, num_workers = multiprocessing.cpu_count() ):
+    def reset_thread_pool( cls, num_workers = multiprocessing.cpu_count(), work_stealing=False, adaptive=False, min_workers=1 ):
         """
         Change the number of threads allocated to the request system.
 
@@ -107,16 +157,53 @@ class Request( object ):
         Instead, all requests will execute synchronously, from within the submitting thread.  
         Utilities like ``RequestLock``, ``SimpleRequestCondition`` will use alternate 
         implementations based on equivalent classes in the builtin ``threading`` module. 
-        
+
+        :param work_stealing: If True, use a :py:class:`WorkStealingThreadPool`,
+                              in which each worker has its own task queue and idle
+                              workers steal from their peers.
+        :param adaptive: If True, ``num_workers`` is only an upper bound: the pool adjusts
+                         the number of active workers (but at least ``min_workers``) to the
+                         measured CPU utilisation and the available CPUs (including cgroup quotas).
+                         See :py:class:`ThreadPool` for details.
+
         .. note:: It is only valid to call this function during startup.
                   Any existing requests will be dropped from the pool!
         """
+        # Stop the old pool without holding the class_lock:
+        #  its workers may still need that lock to finish their last requests.
+        if cls.global_thread_pool is not None:
+            cls.global_thread_pool.stop()
+
         with cls.class_lock:
             active_count = 0
     
-            if cls.global_thread_pool is not None:
-                cls.global_thread_pool.stop()
-            cls.global_thread_pool = threadPool.ThreadPool( num_workers )
+            if work_stealing:
+                cls.global_thread_pool = threadPool.WorkStealingThreadPool( num_workers, adaptive=adaptive, min_workers=min_workers )
+            else:
+                cls.global_thread_pool = threadPool.ThreadPool( num_workers, adaptive=adaptive, min_workers=min_workers )
+
+    @classmethod
+    def reset_io_thread_pool( cls, num_workers ):
+        """
+        Change the number of threads reserved for I/O-bound requests (see the ``io_bound``
+        parameter of the Request constructor).  Such requests are typically blocked in a
+        file read or network transfer, so running them in their own pool keeps the
+        workers of the global thread pool busy with computations in the meantime.
+
+        If ``num_workers`` is 0 (the default at startup), there is no separate I/O pool
+        and I/O-bound requests are executed in the global thread pool like all others.
+
+        .. note:: It is only valid to call this function during startup.
+                  Any existing I/O requests will be dropped from the pool!
+        """
+        if cls.global_io_thread_pool is not None:
+            cls.global_io_thread_pool.stop()
+
+        with cls.class_lock:
+            if num_workers > 0:
+                cls.global_io_thread_pool = threadPool.ThreadPool( num_workers )
+            else:
+                cls.global_io_thread_pool = None
 
     class CancellationException(Exception):
         """
@@ -166,20 +253,55 @@ class Request( object ):
     
     _root_request_counter = itertools.count()
 
-    def __init__(self, fn, root_priority=[0]):
+    @classmethod
+    @contextlib.contextmanager
+    def scheduling_context(cls, scheduling_class, deadline=None):
+        """
+        Context manager.  Within the context, root requests created by the current (foreign) thread
+        receive the given scheduling class and deadline by default.
+        (Requests created from within other requests inherit them from their parent instead.)
+
+        For example, a background thread that runs an export::
+
+            with Request.scheduling_context( Request.BATCH ):
+                opExport.run_export()
+        """
+        old_class = _thread_scheduling.scheduling_class
+        old_deadline = _thread_scheduling.deadline
+        _thread_scheduling.scheduling_class = scheduling_class
+        _thread_scheduling.deadline = deadline
+        try:
+            yield
+        finally:
+            _thread_scheduling.scheduling_class = old_class
+            _thread_scheduling.deadline = old_deadline
+
+    def __init__(self, fn, root_priority=[0], io_bound=False, scheduling_class=None, deadline=None):
         """
         Constructor.
         Postconditions: The request has the same cancelled status as its parent (the request that is creating this one).
+
+        :param io_bound: If True, this request spends most of its time waiting for I/O,
+                         so it is executed in the global_io_thread_pool (if there is one).
+        :param scheduling_class: One of ``Request.INTERACTIVE``, ``Request.PREFETCH``, ``Request.BATCH``.
+                                 If None, the class is inherited from the parent request.
+                                 (For root requests, see scheduling_context().  The default is INTERACTIVE.)
+        :param deadline: Optional.  An absolute time (as returned by ``time.time()``) by which this request should be done.
+                         Within a scheduling class, requests with earlier deadlines are scheduled first.
+                         If None, the deadline is inherited just like the scheduling class.
         """
 
         self._lock = threading.Lock() # NOT an RLock, since requests may share threads
-        self._sig_failed = SimpleSignal()
-        self._sig_cancelled = SimpleSignal()
-        self._sig_finished = SimpleSignal()
-        self._sig_execution_complete = SimpleSignal()
+
+        # Signals are only created when somebody subscribes to them.
+        self._sig_failed = None
+        self._sig_cancelled = None
+        self._sig_finished = None
+        self._sig_execution_complete = None
 
         # Workload
         self.fn = fn
+        self.io_bound = io_bound
 
         #: After this request finishes execution, this attribute holds the return value from the workload function.
         self._result = None
@@ -190,7 +312,7 @@ class Request( object ):
         self.uncancellable = False
         self.finished = False
         self.execution_complete = False
-        self.finished_event = threading.Event()
+        self._finished_event = None # Created on demand.  See finished_event.
         self.exception = None
         self.exception_info = (None, None, None)
         self._cleaned = False
@@ -200,35 +322,56 @@ class Request( object ):
         self._assigned_worker = None
 
         # Request relationships
-        self.pending_requests = set()  # Requests that are waiting for this one
-        self.blocking_requests = set() # Requests that this one is waiting for (currently one at most since wait() can only be called on one request at a time)
-        self.child_requests = set()    # Requests that were created from within this request (NOT the same as pending_requests)
+        # (These are replaced with real sets when the first element is added.)
+        self.pending_requests = _NO_REQUESTS  # Requests that are waiting for this one
+        self.blocking_requests = _NO_REQUESTS # Requests that this one is waiting for (currently one at most since wait() can only be called on one request at a time)
+        self.child_requests = _NO_REQUESTS    # Requests that were created from within this request (NOT the same as pending_requests)
         
         self._current_foreign_thread = None
         current_request = Request._current_request()
         self.parent_request = current_request
         self._max_child_priority = 0
+
+        # The priority is a tuple, which is compared lexicographically.
         if current_request is None:
-            self._priority = root_priority + [ Request._root_request_counter.next() ]
+            self._priority = tuple(root_priority) + ( Request._root_request_counter.next(), )
+            parent_class = _thread_scheduling.scheduling_class
+            parent_deadline = _thread_scheduling.deadline
         else:
             with current_request._lock:
-                current_request.child_requests.add(self)
+                current_request._add_child(self)
                 # We must ensure that we get the same cancelled status as our parent.
                 self.cancelled = current_request.cancelled
                 # We acquire the same priority as our parent, plus our own sub-priority
                 current_request._max_child_priority += 1
-                self._priority = current_request._priority + root_priority + [ current_request._max_child_priority ]
+                self._priority = current_request._priority + tuple(root_priority) + ( current_request._max_child_priority, )
+                parent_class = current_request.scheduling_class
+                parent_deadline = current_request.deadline
+
+        if scheduling_class is None:
+            scheduling_class = parent_class
+        if deadline is None:
+            deadline = parent_deadline
+        self.scheduling_class = scheduling_class
+        self.deadline = deadline
+
+        #: The part of the priority that takes precedence over the structural priority:
+        #: (scheduling_class, deadline).  Lower is more urgent.
+        self.urgency = ( scheduling_class, _NO_DEADLINE if deadline is None else deadline )
+        # Requests are ordered by this key while they are queued in the ThreadPool.
+        # (See _boost_urgency() for why it is not simply computed on the fly.)
+        self._sort_key = ( self.urgency, self._priority )
 
     def __lt__(self, other):
         """
-        Request comparison is by priority.
+        Request comparison is by urgency (scheduling class and deadline), then by priority.
         This allows us to store them in a heap.
         """
         if other is None:
             # In RequestLock, we sometimes compare Request objects with None,
             #  which is permitted.  None is considered less (higher priority)
             return False
-        return self._priority < other._priority
+        return self._sort_key < other._sort_key
 
     def __str__(self):
         return "fn={}, assigned_worker={}, started={}, execution_complete={}, exception={}, "\
@@ -244,24 +387,46 @@ class Request( object ):
         :param _fullClean: Internal use only.  If False, only clean internal bookkeeping members.
                            Otherwise, delete everything, including the result.
         """
-        self._sig_cancelled.clean()
-        self._sig_finished.clean()
-        self._sig_failed.clean()
+        self._sig_cancelled = None
+        self._sig_finished = None
+        self._sig_failed = None
 
         with self._lock:
             for child in self.child_requests:
                 child.parent_request = None
-            self.child_requests.clear()
+            self.child_requests = _NO_REQUESTS
 
         parent_req = self.parent_request
         if parent_req is not None:
             with parent_req._lock:
-                parent_req.child_requests.discard(self)
+                if parent_req.child_requests is not _NO_REQUESTS:
+                    parent_req.child_requests.discard(self)
 
         if _fullClean:
             self._cleaned = True
             self._result = None
         
+    def _add_child(self, child):
+        """
+        Must be called with self._lock held.
+        """
+        if self.child_requests is _NO_REQUESTS:
+            self.child_requests = set()
+        self.child_requests.add(child)
+
+    @property
+    def finished_event(self):
+        """
+        A threading.Event that is set once this request has completed execution.
+        (Created on demand, since most requests are never waited for by a foreign thread.)
+        """
+        with self._lock:
+            if self._finished_event is None:
+                self._finished_event = threading.Event()
+                if self.execution_complete:
+                    self._finished_event.set()
+            return self._finished_event
+
     @property
     def assigned_worker(self):
         """
@@ -281,6 +446,17 @@ class Request( object ):
         # Create our greenlet now (so the greenlet has the correct parent, i.e. the worker)
         self.greenlet = RequestGreenlet(self, self._execute)
 
+    @property
+    def thread_pool(self):
+        """
+        The ThreadPool this request is executed in.
+        """
+        if ( self.io_bound
+             and Request.global_io_thread_pool is not None
+             and Request.global_thread_pool.num_workers > 0 ):
+            return Request.global_io_thread_pool
+        return Request.global_thread_pool
+
     @property
     def result(self):
         assert not self._cleaned, "Can't get this result.  The request has already been cleaned!"
@@ -293,11 +469,16 @@ class Request( object ):
         self.started = True
         with Request.class_lock:
             Request.active_count += 1
+        if Request._tracer is not None:
+            Request._tracer.request_started(self)
 
     def _execute(self):
         """
         Do the real work of this request.
         """
+        if Request._tracer is not None:
+            Request._tracer.execution_started(self)
+
         # Did someone cancel us before we even started?
         if not self.cancelled:
             try:
@@ -313,6 +494,10 @@ class Request( object ):
                 self.exception = ex
                 self.exception_info = sys.exc_info()    # Documentation warns of circular references here,
                                                         #  but that should be okay for us.
+
+        # Release the workload (and e.g. the operator it belongs to) before anyone is told that we're done.
+        # (The worker thread keeps this request around for a moment after that.)
+        self.fn = None
         self._post_execute()
 
     def _post_execute(self):
@@ -323,9 +508,10 @@ class Request( object ):
         try:
             # Notify ONE callback (never more than one)
             if self.exception is not None:
-                self._sig_failed( self.exception, self.exception_info )
+                if self._sig_failed is not None:
+                    self._sig_failed( self.exception, self.exception_info )
 
-                if ( len(self._sig_failed.callbacks) == 0 # No callbacks registered
+                if ( self._sig_failed is None             # No callbacks registered
                      and len(self.pending_requests) == 0  # No pending requests to propagate the exception to
                      and Request._current_request() is not None ): # Not executing synchronously in a non-worked ('foreign') thread
                     # This request failed, but no body is listening.
@@ -333,8 +519,9 @@ class Request( object ):
                     # (Otherwise, it would be hidden.)
                     sys.excepthook( *self.exception_info )
             elif self.cancelled:
-                self._sig_cancelled()
-            else:
+                if self._sig_cancelled is not None:
+                    self._sig_cancelled()
+            elif self._sig_finished is not None:
                 self._sig_finished(self._result)
 
         except Exception as ex:
@@ -350,11 +537,11 @@ class Request( object ):
                 
             # If we already fired sig_failed(), then there's no point in firing it again.
             #  That's the function that caused this problem in the first place!
-            if not failed_during_failure_handler:
+            if not failed_during_failure_handler and self._sig_failed is not None:
                 self._sig_failed( self.exception, self.exception_info )
 
             if failed_during_failure_handler or \
-            ( len(self._sig_failed.callbacks) == 0 # No callbacks registered
+            ( self._sig_failed is None             # No callbacks registered
               and len(self.pending_requests) == 0  # No pending requests to propagate the exception to
               and Request._current_request() is not None ): # Not executing synchronously in a non-worked ('foreign') thread
                 # This request failed, but no body is listening.
@@ -370,11 +557,17 @@ class Request( object ):
             # Unconditionally signal (internal use only)
             with self._lock:
                 self.execution_complete = True
-                self._sig_execution_complete()
-                self._sig_execution_complete.clean()
+                if self._sig_execution_complete is not None:
+                    self._sig_execution_complete()
+                    self._sig_execution_complete = None
+                finished_event = self._finished_event
+
+            if Request._tracer is not None:
+                Request._tracer.execution_finished(self)
 
             # Notify non-request-based threads
-            self.finished_event.set()
+            if finished_event is not None:
+                finished_event.set()
 
             # Clean-up
             if self.greenlet is not None:
@@ -389,7 +582,7 @@ class Request( object ):
         """
         If this request isn't started yet, schedule it to be started.
         """
-        if Request.global_thread_pool.num_workers > 0:
+        if self.thread_pool.num_workers > 0:
             with self._lock:
                 if not self.started:
                     self._set_started()
@@ -413,7 +606,30 @@ class Request( object ):
         """
         Resume this request's execution (put it back on the worker's job queue).
         """
-        Request.global_thread_pool.wake_up(self)
+        if self._sort_key[0] is not self.urgency:
+            # We were boosted since we were last queued.
+            self._sort_key = ( self.urgency, self._priority )
+        self.thread_pool.wake_up(self)
+
+    def _boost_urgency(self, urgency):
+        """
+        Called when a more urgent request has to wait for this one (priority inversion).
+        Raise our urgency (and that of the requests we are waiting for) to match.
+        Our children inherit the new scheduling class and deadline.
+
+        The sort key is only updated the next time we are queued,
+        because changing it while we sit in a heap would corrupt the heap.
+        """
+        with self._lock:
+            if urgency >= self.urgency or self.execution_complete:
+                return
+            self.urgency = urgency
+            self.scheduling_class = urgency[0]
+            self.deadline = None if urgency[1] == _NO_DEADLINE else urgency[1]
+            blocking_requests = list(self.blocking_requests)
+
+        for r in blocking_requests:
+            r._boost_urgency(urgency)
  
     def _switch_to(self):
         """
@@ -458,6 +674,10 @@ class Request( object ):
         """
         Suspend this request so another one can be woken up by the worker.
         """
+        tracer = Request._tracer
+        if tracer is not None:
+            tracer.suspended(self)
+
         # Switch back to the worker that we're currently running in.
         try:
             self.greenlet.parent.switch()
@@ -466,6 +686,9 @@ class Request( object ):
                              .format( threading.current_thread().name, self, self.greenlet.parent ) )
             raise
 
+        if tracer is not None:
+            tracer.resumed(self)
+
     def wait(self, timeout=None):
         """
         Start this request if necessary, then wait for it to complete.  Return the request's result.
@@ -494,7 +717,17 @@ class Request( object ):
         #  AFTER self.cancelled and self.exception have their final values.  See _execute().
         if self.execution_complete and not self.cancelled and self.exception is None:
             return self._result
-        
+
+        listener = Request._wait_listener
+        if listener is None:
+            return self._wait_for_completion(timeout)
+        listener(True)
+        try:
+            return self._wait_for_completion(timeout)
+        finally:
+            listener(False)
+
+    def _wait_for_completion(self, timeout):
         # Identify the request that is waiting for us (the current context)
         current_request = Request._current_request()
 
@@ -540,14 +773,27 @@ class Request( object ):
 
         if direct_execute_needed:
             self._current_foreign_thread = threading.current_thread()
-            self._execute()
+
+            # Requests created during our execution have no parent request (we're in a foreign thread),
+            # so pass our scheduling class and deadline on to them via the thread's defaults.
+            old_class = _thread_scheduling.scheduling_class
+            old_deadline = _thread_scheduling.deadline
+            _thread_scheduling.scheduling_class = self.scheduling_class
+            _thread_scheduling.deadline = self.deadline
+            try:
+                self._execute()
+            finally:
+                _thread_scheduling.scheduling_class = old_class
+                _thread_scheduling.deadline = old_deadline
         else:
             self.submit()
 
         # This is a non-worker thread, so just block the old-fashioned way
-        completed = self.finished_event.wait(timeout)
-        if not completed:
-            raise Request.TimeoutException()
+        # (unless we just executed the request ourselves)
+        if not self.execution_complete:
+            completed = self.finished_event.wait(timeout)
+            if not completed:
+                raise Request.TimeoutException()
         
         if self.cancelled:
             # It turns out this request was already cancelled.
@@ -585,10 +831,19 @@ class Request( object ):
                 # Simply raise the exception back to the current request.
                 raise self.exception_info[0], self.exception_info[1], self.exception_info[2]
 
-            direct_execute_needed = not self.started
-            suspend_needed = self.started and not self.execution_complete
+            # We can only run this request directly in the current greenlet if it
+            #  belongs to the same thread pool.  Otherwise, we must submit it to its
+            #  own pool (e.g. the I/O pool) and wait for it like any other started request.
+            same_pool = self.thread_pool is current_request.thread_pool
+            direct_execute_needed = not self.started and same_pool
+            submit_needed = not self.started and not same_pool
+            suspend_needed = (self.started or submit_needed) and not self.execution_complete
             if direct_execute_needed or suspend_needed:
+                if current_request.blocking_requests is _NO_REQUESTS:
+                    current_request.blocking_requests = set()
                 current_request.blocking_requests.add(self)
+                if self.pending_requests is _NO_REQUESTS:
+                    self.pending_requests = set()
                 self.pending_requests.add(current_request)
             
             if direct_execute_needed:
@@ -600,8 +855,20 @@ class Request( object ):
                 # This request is already started in some other greenlet.
                 # We must suspend the current greenlet while we wait for this request to complete.
                 # Here, we set up a callback so we'll wake up once this request is complete.
+                if self._sig_execution_complete is None:
+                    self._sig_execution_complete = SimpleSignal()
                 self._sig_execution_complete.subscribe( functools.partial(current_request._handle_finished_request, self) )
 
+        if ( (suspend_needed or direct_execute_needed)
+             and current_request.urgency < self.urgency
+             and current_request is not self.parent_request ):
+            # A more urgent request must wait for us.
+            # (Unless we were deliberately created with a lower urgency by the waiting request itself.)
+            self._boost_urgency(current_request.urgency)
+
+        if submit_needed:
+            self.submit()
+
         if suspend_needed:
             current_request._suspend()
         elif direct_execute_needed:
@@ -649,6 +916,8 @@ class Request( object ):
             finished = self.finished
             if not finished:
                 # Call when we eventually finish
+                if self._sig_finished is None:
+                    self._sig_finished = SimpleSignal()
                 self._sig_finished.subscribe(fn)
 
         if finished:
@@ -668,6 +937,8 @@ class Request( object ):
             cancelled = self.cancelled
             if not finished:
                 # Call when we eventually finish
+                if self._sig_cancelled is None:
+                    self._sig_cancelled = SimpleSignal()
                 self._sig_cancelled.subscribe(fn)
 
         if finished and cancelled:
@@ -689,6 +960,8 @@ class Request( object ):
             failed = self.exception is not None
             if not finished:
                 # Call when we eventually finish
+                if self._sig_failed is None:
+                    self._sig_failed = SimpleSignal()
                 self._sig_failed.subscribe(fn)
 
         if finished and failed:
@@ -714,13 +987,29 @@ class Request( object ):
             if cancelled:
                 # Any children added after this point will receive our same cancelled status
                 child_requests = self.child_requests
-                self.child_requests = set()
+                self.child_requests = _NO_REQUESTS
 
         if self.cancelled:
             # Cancel all requests that were spawned from this one.
             for child in child_requests:
                 child.cancel()
-    
+
+    def attach_to_current_request(self):
+        """
+        Treat this request as if it had (also) been spawned by the current request, if any.
+        That is, cancelling the current request will attempt to cancel this one, too.
+        (As usual, this request is only cancelled once all requests waiting for it are cancelled.)
+
+        This is useful for requests that are shared by several independent callers:
+        The request is only cancelled if all of them are.
+        """
+        current_request = Request._current_request()
+        if current_request is None or current_request is self.parent_request:
+            return
+        with current_request._lock:
+            if not current_request.cancelled:
+                current_request._add_child(self)
+
     @classmethod
     def _current_request(cls):
         """
@@ -1115,7 +1404,10 @@ class RequestPool(object):
     Requests can not be added to the pool after it has already started.
     Not threadsafe:
         - don't call add() from more than one thread
-        - don't call wait() or submit() from more than one thread
+        - don't call wait(), submit() or as_completed() from more than one thread
+
+    Instead of waiting for the whole batch, the results can also be consumed one at a time
+    as they become available.  See as_completed().
     """
 
     class RequestPoolError(Exception):
@@ -1128,6 +1420,7 @@ class RequestPool(object):
         self._started = False
         self._failed = False
         self._requests = set()
+        self._unsubmitted_requests = collections.deque()
         self._finishing_requests = set()
         self._set_lock = threading.Lock()
         self._request_completed_condition = SimpleRequestCondition()
@@ -1148,6 +1441,7 @@ class RequestPool(object):
 
         with self._set_lock:
             self._requests.add(req)
+        self._unsubmitted_requests.append(req)
         req.notify_finished( functools.partial(self._transfer_request_to_finishing_queue, req, 'finished' ) )
         req.notify_failed( functools.partial(self._transfer_request_to_finishing_queue, req, 'failed' ) )
         req.notify_cancelled( functools.partial(self._transfer_request_to_finishing_queue, req, 'cancelled' ) )
@@ -1188,6 +1482,64 @@ class RequestPool(object):
             self.clean()
             raise
 
+    def as_completed(self, max_in_flight=None):
+        """
+        Generator.  Submit the requests in the pool (in the order they were added) 
+        and yield each one as soon as it is complete (including its notify_finished callbacks).
+        
+        The pool doesn't keep a reference to a request after yielding it, so its result
+        can be freed as soon as the caller is done with it.
+        
+        :param max_in_flight: If given, at most this many requests are submitted and not yet yielded
+                              at any time.  (New requests are submitted as completed ones are consumed.)
+                              This limits the number of results that are held in RAM at once.
+        
+        If a request fails, its exception is raised from the generator.
+        If the caller stops iterating early, the requests that are still running are cancelled,
+        and those that weren't submitted yet are discarded.
+        
+        Example:
+        
+        .. code-block:: python
+        
+            pool = RequestPool()
+            for roi in rois:
+                pool.add( slot(*roi) )
+            for req in pool.as_completed(max_in_flight=8):
+                process( req.result )
+        """
+        assert max_in_flight is None or max_in_flight > 0
+        if self._started:
+            raise RequestPool.RequestPoolError("Can't re-start a RequestPool that was already started.")
+        self._started = True
+
+        completed = False
+        try:
+            in_flight = 0
+            while self._unsubmitted_requests or in_flight > 0:
+                while self._unsubmitted_requests and (max_in_flight is None or in_flight < max_in_flight):
+                    self._unsubmitted_requests.popleft().submit()
+                    in_flight += 1
+
+                with self._request_completed_condition:
+                    if not self._finishing_requests:
+                        self._request_completed_condition.wait()
+                    with self._set_lock:
+                        finishing_requests = self._finishing_requests
+                        self._finishing_requests = set()
+
+                while finishing_requests:
+                    req = finishing_requests.pop()
+                    in_flight -= 1
+                    req.block()
+                    yield req
+                    del req
+            completed = True
+        finally:
+            if not completed:
+                self._failed = True
+                self.cancel()
+
     def cancel(self):
         """
         Cancel all requests in the pool.
@@ -1206,10 +1558,8 @@ class RequestPool(object):
             raise RequestPool.RequestPoolError("Can't re-start a RequestPool that was already started.")
 
         try:        
-            # Use copy here because requests may remove themselves from self._requests as they complete.
-            requests = self._requests.copy()
-            while requests:
-                requests.pop().submit()
+            while self._unsubmitted_requests:
+                self._unsubmitted_requests.popleft().submit()
                 self._clear_finishing_requests()
         except:
             self._failed = True
@@ -1275,6 +1625,7 @@ class RequestPool(object):
         """
         with self._set_lock:
             self._requests = set()
+            self._unsubmitted_requests = collections.deque()
             self._finishing_requests = set()
 
 class RequestPool_SIMPLE(object):
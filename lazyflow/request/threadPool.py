@@ -23,41 +23,140 @@
 import atexit
 import collections
 import heapq
+import itertools
 import threading
 import platform
 import time
 import os
 import ctypes
+import multiprocessing
 
 import psutil
 
 from lazyflow.utility.priorityQueue import PriorityQueue
 
+import logging
+logger = logging.getLogger(__name__)
+
+def _read_first_line(path):
+    try:
+        with open(path) as f:
+            return f.readline().strip()
+    except (IOError, OSError):
+        return None
+
+def _cgroup_cpu_quota():
+    """
+    Return the number of CPUs this process may use according to its cgroup CPU quota
+    (e.g. ``docker run --cpus=2``), or None if there is no quota (or we can't tell).
+    """
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    line = _read_first_line('/sys/fs/cgroup/cpu.max')
+    if line is not None:
+        fields = line.split()
+        if len(fields) == 2 and fields[0] != 'max':
+            try:
+                return float(fields[0]) / float(fields[1])
+            except ValueError:
+                pass
+        return None
+
+    # cgroup v1: quota is -1 if unlimited
+    quota = _read_first_line('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+    period = _read_first_line('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    try:
+        quota, period = float(quota), float(period)
+    except (TypeError, ValueError):
+        return None
+    if quota <= 0 or period <= 0:
+        return None
+    return quota / period
+
+def available_cpus():
+    """
+    Return the number of CPUs (possibly fractional) that this process can actually use,
+    taking into account the CPU affinity mask and cgroup CPU quotas (as used by container runtimes).
+    """
+    cpus = float(multiprocessing.cpu_count())
+    try:
+        cpus = min(cpus, len(psutil.Process(os.getpid()).cpu_affinity()))
+    except (AttributeError, NotImplementedError, psutil.Error):
+        # Not supported on this platform (or by this version of psutil)
+        pass
+    quota = _cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, quota)
+    return cpus
+
+
+def _is_more_urgent(queue, other_queue):
+    """
+    Return True if the next task in ``queue`` belongs to a more urgent scheduling class
+    (or has an earlier deadline) than the next task in ``other_queue``.
+    (See ``Request.urgency``.  Tasks without an urgency are all equally urgent.)
+    """
+    try:
+        return queue.peek().urgency < other_queue.peek().urgency
+    except (IndexError, AttributeError):
+        return False
 
 class ThreadPool(object):
     """
     Manages a set of worker threads and dispatches tasks to them.
+
+    In adaptive mode, only a subset of the workers (the 'active' workers) claim new tasks.
+    A background thread periodically samples the worker states and the CPU utilisation
+    of the process, and grows or shrinks the active set within ``[min_workers, num_workers]``:
+
+    - If the busy workers use little CPU (e.g. they are blocked on I/O) and tasks are waiting,
+      more workers are activated.
+    - If each busy worker uses more than one CPU (e.g. internally multithreaded vigra filters),
+      workers are deactivated, so that the available CPUs (see :py:func:`available_cpus()`)
+      aren't oversubscribed.
+
+    Inactive workers still finish the tasks they have already started.
+    (Note that GIL-bound work doesn't benefit from more threads. Use the ProcessPool for that.)
     """
 
     #_DefaultQueueType = FifoQueue
     #_DefaultQueueType = LifoQueue
     _DefaultQueueType = PriorityQueue
     
-    def __init__(self, num_workers, queue_type=_DefaultQueueType):
+    #: Seconds between two adjustments of the active worker count (adaptive mode only).
+    ADAPTIVE_INTERVAL = 0.5
+
+    def __init__(self, num_workers, queue_type=_DefaultQueueType, adaptive=False, min_workers=1):
         """
         Constructor.  Starts all workers.
         
         :param num_workers: The number of worker threads to create.
+                            In adaptive mode, this is the maximum number of active workers.
         :param queue_type: The type of queue to use for prioritizing tasks.  Possible queue types include :py:class:`PriorityQueue`,
                            :py:class:`FifoQueue`, and :py:class:`LifoQueue`, or any class with ``push()``, ``pop()``, and ``__len__()`` methods.
+        :param adaptive: If True, adjust the number of active workers to the measured utilisation (see above).
+        :param min_workers: The minimum number of active workers (adaptive mode only).
         """
         self.job_condition = threading.Condition()
         self.unassigned_tasks = queue_type()
         #self.memory = MemoryWatcher(self)
         #self.memory.start()
         self.num_workers = num_workers
+        self.adaptive = adaptive and num_workers > 0
+        if self.adaptive:
+            self.min_workers = max(1, min(min_workers, num_workers))
+            self.cpu_budget = available_cpus()
+            initial = int(round(self.cpu_budget))
+            self.active_workers = max(self.min_workers, min(initial, num_workers))
+        else:
+            self.min_workers = num_workers
+            self.active_workers = num_workers
         self.workers = self._start_workers( num_workers, queue_type )
 
+        self._controller = None
+        if self.adaptive:
+            self._controller = _AdaptiveController(self)
+            self._controller.start()
+
         # ThreadPools automatically stop upon program exit
         atexit.register( self.stop )
 
@@ -80,6 +179,8 @@ class ThreadPool(object):
         Postcondition: All worker threads have stopped.  Unfinished tasks are simply dropped.
         """
         #self.memory.stop()
+        if self._controller is not None:
+            self._controller.stop()
         
         for w in self.workers:
             w.stop()
@@ -89,6 +190,68 @@ class ThreadPool(object):
     
     def get_states(self):
         return [w.state for w in self.workers]
+
+    def set_active_workers(self, active_workers):
+        """
+        Change the number of workers that claim new tasks.
+        (Used by the adaptive mode, but may also be called directly.)
+        """
+        active_workers = max(1, min(active_workers, self.num_workers))
+        if active_workers == self.active_workers:
+            return
+        logger.debug("Active workers: {} -> {}".format(self.active_workers, active_workers))
+        grown = active_workers > self.active_workers
+        self.active_workers = active_workers
+        if grown:
+            # Let the newly activated workers look for work
+            self._notify_all_workers()
+
+    def _backlog(self):
+        """
+        The number of tasks that are waiting for a worker.
+        """
+        return len(self.unassigned_tasks)
+
+    def _choose_active_workers(self, busy, cpu_used, worker_cpu_used=None):
+        """
+        Return the number of workers that should be active, given the measurements of the last interval:
+
+        :param busy: The average number of workers that were running a task.
+        :param cpu_used: The number of CPUs used by the whole process.
+        :param worker_cpu_used: The number of CPUs used by the worker threads themselves
+                                (excluding e.g. threads started by vigra), or None if unknown.
+        """
+        active = self.active_workers
+        if busy < 0.5:
+            # Nothing is running.  No information.
+            return active
+
+        if cpu_used < 0.9 * self.cpu_budget:
+            # Not saturated: Each busy worker keeps cpu_used/busy CPUs busy.
+            # (Less than one if it is blocked on I/O, more if it uses internal threads.)
+            cpu_per_worker = max(cpu_used / busy, 0.05)
+            target = self.cpu_budget / cpu_per_worker
+        elif worker_cpu_used:
+            # Saturated: We can't tell how much more the workers would use,
+            #  but we can tell how much of the load comes from threads the workers started.
+            parallelism = cpu_used / worker_cpu_used
+            if parallelism < 1.5:
+                return active
+            target = self.cpu_budget / parallelism
+        else:
+            return active
+
+        target = int(round(target))
+        target = max(self.min_workers, min(target, self.num_workers))
+
+        if target > active and (self._backlog() == 0 or busy < active - 0.5):
+            # No point in adding workers if the current ones aren't all busy.
+            return active
+
+        # Move halfway to the target, to damp oscillations.
+        if target > active:
+            return active + (target - active + 1) // 2
+        return active - (active - target + 1) // 2
     
     def _start_workers(self, num_workers, queue_type):
         """
@@ -132,6 +295,147 @@ class ThreadPool(object):
                 done = False
                     
 
+class WorkStealingThreadPool(ThreadPool):
+    """
+    A ThreadPool in which each worker owns a private queue of unassigned tasks.
+
+    - Tasks submitted from within a worker thread (e.g. child requests) are pushed
+      onto that worker's own queue.  Tasks submitted from foreign threads are
+      distributed round-robin over all workers.
+    - Each submission wakes at most one idle worker, instead of all of them.
+    - A worker that runs out of work steals the highest-priority task it can
+      find in the queues of its peers.
+    - Tasks that were already started remain pinned to their ``assigned_worker``,
+      exactly as in the default ThreadPool.
+
+    Within each queue, tasks are still processed in priority order.
+    Across queues, priority is approximated: idle workers always steal
+    the best task among the heads of their peers' queues.
+    """
+
+    def __init__(self, num_workers, queue_type=ThreadPool._DefaultQueueType, adaptive=False, min_workers=1):
+        self._idle_lock = threading.Lock()
+        self._idle_workers = []
+        self._submission_counter = itertools.count()
+        super(WorkStealingThreadPool, self).__init__(num_workers, queue_type, adaptive, min_workers)
+
+    def wake_up(self, task):
+        """
+        Schedule the given task on the worker that is assigned to it.
+        If it has no assigned worker yet, push it onto the queue of the current worker
+        (or some worker, if called from a foreign thread) and wake up one idle worker.
+        """
+        if hasattr(task, 'assigned_worker') and task.assigned_worker is not None:
+            task.assigned_worker.wake_up( task )
+            return
+
+        current_thread = threading.current_thread()
+        if getattr(current_thread, 'thread_pool', None) is self:
+            worker = current_thread
+        else:
+            worker = self.workers[ self._submission_counter.next() % self.active_workers ]
+        worker.local_tasks.push(task)
+        self._notify_one_idle_worker()
+
+    def set_active_workers(self, active_workers):
+        previous = self.active_workers
+        super(WorkStealingThreadPool, self).set_active_workers(active_workers)
+        if self.active_workers < previous:
+            # Inactive workers don't process their unassigned tasks any more.
+            # Make sure someone comes to steal them.
+            self._notify_one_idle_worker()
+
+    def _backlog(self):
+        return sum( len(w.local_tasks) for w in self.workers )
+
+    def _start_workers(self, num_workers, queue_type):
+        """
+        Start a set of workers and return them as a list (so victims can be indexed).
+        """
+        # Workers look at their peers as soon as they start,
+        #  so the complete list must exist before any of them is started.
+        self.workers = [ _WorkStealingWorker(self, i, queue_type=queue_type)
+                         for i in range(num_workers) ]
+        for w in self.workers:
+            w.start()
+        return self.workers
+
+    def _notify_one_idle_worker(self):
+        """
+        Wake up one worker that is currently waiting for work, if there is one.
+        """
+        with self._idle_lock:
+            while True:
+                if not self._idle_workers:
+                    return
+                worker = self._idle_workers.pop()
+                worker.idle = False
+                # Skip workers that were deactivated since they became idle (see adaptive mode).
+                if worker.index < self.active_workers:
+                    break
+        with worker.job_queue_condition:
+            worker.job_queue_condition.notify()
+
+    def _steal(self, thief):
+        """
+        Non-blocking.
+        Remove and return the highest-priority task from the queues of the
+        thief's peers, or None if none of them has any unassigned work.
+        """
+        while True:
+            victim = None
+            best_task = None
+            for worker in self.workers:
+                if worker is thief or len(worker.local_tasks) == 0:
+                    continue
+                try:
+                    task = worker.local_tasks.peek()
+                except IndexError:
+                    continue
+                if best_task is None or task < best_task:
+                    victim, best_task = worker, task
+            if victim is None:
+                return None
+            try:
+                return victim.local_tasks.pop()
+            except IndexError:
+                # Someone else emptied that queue in the meantime.  Try again.
+                continue
+
+    def _wait_for_idle(self):
+        """
+        Useful for testing only.
+        Wait until there are no tasks left in the threadpool.
+        """
+        done = False
+        while not done:
+            for worker in self.workers:
+                while worker.job_queue or worker.local_tasks:
+                    time.sleep(0.1)
+
+            # Second pass: did any of those completing tasks launch new tasks?
+            done = True
+            for worker in self.workers:
+                if worker.job_queue or worker.local_tasks:
+                    done = False
+
+def _native_thread_id():
+    """
+    Return the id the OS uses for the current thread (as listed by psutil.Process.threads()),
+    or None if we don't know how to get it on this platform.
+    """
+    if hasattr(threading, 'get_native_id'):
+        return threading.get_native_id()
+    if platform.system() != 'Linux':
+        return None
+    SYS_gettid = { 'x86_64' : 186, 'i386' : 224, 'i686' : 224, 'aarch64' : 178 }.get( platform.machine() )
+    if SYS_gettid is None:
+        return None
+    try:
+        return ctypes.CDLL(None).syscall(SYS_gettid)
+    except (OSError, AttributeError):
+        return None
+
 class _Worker(threading.Thread):
     """
     Runs in a loop until stopped.
@@ -143,6 +447,8 @@ class _Worker(threading.Thread):
         super(_Worker, self).__init__( name=name )
         self.daemon = True # kill automatically on application exit!
         self.thread_pool = thread_pool
+        self.index = index
+        self.native_id = None
         self.stopped = False
         self.job_queue_condition = threading.Condition()
         self.job_queue = queue_type()
@@ -152,6 +458,10 @@ class _Worker(threading.Thread):
         """
         Keep executing available tasks until we're stopped.
         """
+        if self.thread_pool.adaptive:
+            # Lets the adaptive controller tell our own CPU time from that of other threads.
+            self.native_id = _native_thread_id()
+
         # Try to get some work.
         self.state = 'waiting'
         next_task = self._get_next_job()
@@ -223,8 +533,15 @@ class _Worker(threading.Thread):
         Otherwise, get one from the global job queue.
         Return None if neither queue has work to do.
         """
-        # Try our own queue first
-        if len(self.job_queue) > 0:
+        # Inactive workers (see adaptive mode) only finish the tasks they already started.
+        if self.index >= self.thread_pool.active_workers:
+            if len(self.job_queue) > 0:
+                return self.job_queue.pop()
+            return None
+
+        # Try our own queue first,
+        #  unless there's a task of a more urgent scheduling class in the global queue.
+        if len(self.job_queue) > 0 and not _is_more_urgent(self.thread_pool.unassigned_tasks, self.job_queue):
             return self.job_queue.pop()
 
         # Otherwise, try to claim a job from the global unassigned list            
@@ -232,6 +549,9 @@ class _Worker(threading.Thread):
             #task = self.thread_pool.memory.filter(self.thread_pool.unassigned_tasks.pop())
             task = self.thread_pool.unassigned_tasks.pop()
         except IndexError:
+            # (Another worker may have claimed the urgent task first.)
+            if len(self.job_queue) > 0:
+                return self.job_queue.pop()
             return None
         else:
             task.assigned_worker = self # If this fails, then your callable is some built-in that doesn't allow arbitrary  
@@ -267,3 +587,160 @@ class _Worker(threading.Thread):
             # and you should call it again with exc=NULL to revert the effect"""
             ctypes.pythonapi.PyThreadState_SetAsyncExc(tid, 0)
             raise SystemError("PyThreadState_SetAsyncExc failed")
+
+
+class _WorkStealingWorker(_Worker):
+    """
+    Worker for the WorkStealingThreadPool.
+    In addition to its queue of pinned (already started) tasks,
+    it owns a queue of unassigned tasks that its peers may steal from.
+    """
+
+    def __init__(self, thread_pool, index, queue_type ):
+        super(_WorkStealingWorker, self).__init__( thread_pool, index, queue_type )
+        self.local_tasks = queue_type()
+        self.idle = False # Protected by thread_pool._idle_lock
+
+    def _get_next_job(self):
+        """
+        Get the next available job to perform.
+        If necessary, block until:
+            - a task is available (return it) OR
+            - the worker has been stopped (might return None)
+        """
+        with self.job_queue_condition:
+            if self.stopped:
+                return None
+            next_task = self._pop_job()
+
+            while next_task is None and not self.stopped:
+                # Announce that we are idle BEFORE looking for work one last time.
+                # A concurrent submitter either sees us in the idle list (and notifies us,
+                # which can't happen until we wait() because we own our condition),
+                # or it pushed its task before our final check (so we find it).
+                self._set_idle(True)
+                next_task = self._pop_job()
+                if next_task is None:
+                    self.job_queue_condition.wait()
+                self._set_idle(False)
+                if self.stopped:
+                    return None
+                if next_task is None:
+                    next_task = self._pop_job()
+
+        if not self.stopped:
+            assert next_task is not None
+            assert next_task.assigned_worker is self
+
+            # If there is still work waiting in our queue, recruit a peer to help.
+            if self.local_tasks:
+                self.thread_pool._notify_one_idle_worker()
+
+        return next_task
+
+    def _set_idle(self, idle):
+        pool = self.thread_pool
+        if idle and self.index >= pool.active_workers:
+            # Inactive workers don't want to be woken up for new tasks.
+            # Hand our unassigned tasks over to an active worker instead.
+            if self.local_tasks:
+                pool._notify_one_idle_worker()
+            idle = False
+        with pool._idle_lock:
+            if idle and not self.idle:
+                pool._idle_workers.append(self)
+            elif not idle and self.idle:
+                pool._idle_workers.remove(self)
+            self.idle = idle
+
+    def _pop_job(self):
+        """
+        Non-blocking.
+        If possible, get a job from our own queue of pinned tasks
+        (unless a task of a more urgent scheduling class waits in our queue of unassigned tasks).
+        Otherwise, get one from our own queue of unassigned tasks.
+        Otherwise, steal one from a peer.
+        Return None if there is no work to do anywhere.
+        """
+        if self.index >= self.thread_pool.active_workers:
+            # Inactive (see adaptive mode): only finish the tasks we already started.
+            if len(self.job_queue) > 0:
+                return self.job_queue.pop()
+            return None
+
+        if len(self.job_queue) > 0 and not _is_more_urgent(self.local_tasks, self.job_queue):
+            return self.job_queue.pop()
+
+        try:
+            task = self.local_tasks.pop()
+        except IndexError:
+            if len(self.job_queue) > 0:
+                return self.job_queue.pop()
+            task = self.thread_pool._steal(self)
+            if task is None:
+                return None
+        task.assigned_worker = self
+        return task
+
+
+class _AdaptiveController(threading.Thread):
+    """
+    Background thread of an adaptive ThreadPool.
+    Periodically samples the worker states and the CPU utilisation of this process,
+    and adjusts the number of active workers accordingly.
+    """
+    SAMPLES_PER_INTERVAL = 10
+
+    def __init__(self, thread_pool):
+        super(_AdaptiveController, self).__init__( name="ThreadPool controller" )
+        self.daemon = True
+        self.thread_pool = thread_pool
+        self._stop_event = threading.Event()
+        process = psutil.Process(os.getpid())
+        # (Older versions of psutil call these get_cpu_percent() and get_threads())
+        self._cpu_percent = getattr(process, 'cpu_percent', None) or process.get_cpu_percent
+        self._threads = getattr(process, 'threads', None) or process.get_threads
+
+    def _worker_cpu_time(self):
+        """
+        Total CPU time (in seconds) spent in the pool's worker threads,
+        or None if the worker threads can't be identified.
+        """
+        native_ids = set( w.native_id for w in self.thread_pool.workers )
+        if None in native_ids:
+            return None
+        try:
+            threads = self._threads()
+        except psutil.Error:
+            return None
+        return sum( t.user_time + t.system_time for t in threads if t.id in native_ids )
+
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
+
+    def run(self):
+        pool = self.thread_pool
+        sample_interval = pool.ADAPTIVE_INTERVAL / self.SAMPLES_PER_INTERVAL
+        self._cpu_percent(None) # Start measuring
+        last_worker_cpu_time = self._worker_cpu_time()
+        last_time = time.time()
+        while not self._stop_event.is_set():
+            busy_samples = []
+            for _ in range(self.SAMPLES_PER_INTERVAL):
+                self._stop_event.wait( sample_interval )
+                if self._stop_event.is_set():
+                    return
+                busy_samples.append( pool.get_states().count('running task') )
+            busy = float(sum(busy_samples)) / len(busy_samples)
+            cpu_used = self._cpu_percent(None) / 100.0
+
+            now = time.time()
+            worker_cpu_time = self._worker_cpu_time()
+            worker_cpu_used = None
+            if worker_cpu_time is not None and last_worker_cpu_time is not None:
+                worker_cpu_used = (worker_cpu_time - last_worker_cpu_time) / (now - last_time)
+            last_worker_cpu_time, last_time = worker_cpu_time, now
+
+            pool.set_active_workers( pool._choose_active_workers( busy, cpu_used, worker_cpu_used ) )
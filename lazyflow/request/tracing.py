@@ -0,0 +1,213 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+# Built-in
+import os
+import json
+import time
+import threading
+import functools
+import itertools
+
+# lazyflow
+from request import Request
+
+class RequestTracer(object):
+    """
+    Records a trace of every request that executes while tracing is enabled,
+    and writes it in the Chrome trace event format, which can be viewed in
+    ``chrome://tracing`` or the Perfetto UI (https://ui.perfetto.dev).
+
+    For each request, the trace shows:
+
+    - Each interval in which it was running, on the track of the worker thread that ran it.
+      (Requests that were executed synchronously within another request are nested in their parent.)
+    - Its overall lifetime (from submission to completion), as an async span with
+      the queue wait time, the run time, and the time spent suspended (waiting for other requests).
+    - For requests created by ``Slot.get()``, the operator class, slot name and roi.
+
+    Example::
+
+        with RequestTracer() as tracer:
+            opExport.run_export()
+        tracer.save('export-trace.json')
+
+    Tracing is disabled by default, in which case it costs (almost) nothing.
+    Only one tracer can be active at a time.
+    """
+    def __init__(self):
+        self._events = []
+        self._records = {}
+        self._thread_names = {}
+        self._request_ids = itertools.count()
+        self._t0 = time.time()
+        self._pid = os.getpid()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """
+        Start tracing all requests.
+        """
+        assert Request._tracer is None, "Another tracer is already active."
+        Request._tracer = self
+
+    def stop(self):
+        """
+        Stop tracing.  Requests that are still running at this point won't be fully recorded.
+        """
+        if Request._tracer is self:
+            Request._tracer = None
+
+    def events(self):
+        """
+        Return the trace events recorded so far, as a list of dicts in the Chrome trace event format.
+        """
+        metadata = [ { "name" : "thread_name", "ph" : "M", "pid" : self._pid, "tid" : tid, "args" : { "name" : name } }
+                     for tid, name in self._thread_names.items() ]
+        return metadata + list(self._events)
+
+    def save(self, path):
+        """
+        Write the trace to the given path as a Chrome trace JSON file.
+        """
+        with open(path, 'w') as f:
+            json.dump( { "traceEvents" : self.events(), "displayTimeUnit" : "ms" }, f )
+
+    def annotate(self, request, **info):
+        """
+        Attach extra information (e.g. operator, slot, roi) to the trace of the given request.
+        """
+        record = self._records.get(request)
+        if record is not None:
+            record.info.update( (k, str(v)) for k,v in info.items() )
+
+    #
+    # Hooks, called by the Request class
+    #
+
+    def request_started(self, request):
+        # The request has been submitted (or is about to be executed synchronously).
+        self._records[request] = _RequestRecord( self._request_ids.next(), self._now() )
+
+    def execution_started(self, request):
+        record = self._records.get(request)
+        if record is None:
+            return
+        record.execution_start = record.segment_start = self._now()
+        # (The request drops its function once it has been executed.)
+        fn = self._unwrap(request.fn)
+        record.fn_name = getattr(fn, '__name__', type(fn).__name__)
+
+        # Requests created by Slot.get() execute a Slot.RequestExecutionWrapper
+        slot = getattr(fn, 'slot', None)
+        if slot is not None and not record.info:
+            self.annotate( request,
+                           operator=fn.operator.__class__.__name__,
+                           slot=slot.name,
+                           roi=fn.roi )
+
+    def suspended(self, request):
+        record = self._records.get(request)
+        if record is None or record.segment_start is None:
+            return
+        now = self._now()
+        self._add_segment(request, record, now)
+        record.suspend_start = now
+
+    def resumed(self, request):
+        record = self._records.get(request)
+        if record is None or record.suspend_start is None:
+            return
+        now = self._now()
+        record.suspended += now - record.suspend_start
+        record.suspend_start = None
+        record.segment_start = now
+
+    def execution_finished(self, request):
+        record = self._records.pop(request, None)
+        if record is None or record.segment_start is None:
+            return
+        now = self._now()
+        self._add_segment(request, record, now)
+
+        queue_wait = record.execution_start - record.submitted
+        total = now - record.execution_start
+        args = dict(record.info)
+        args.update( { "queue_wait_ms" : queue_wait / 1000.0,
+                       "run_ms" : (total - record.suspended) / 1000.0,
+                       "suspended_ms" : record.suspended / 1000.0,
+                       "cancelled" : request.cancelled,
+                       "failed" : request.exception is not None } )
+        name = self._name(request, record)
+        span = { "name" : name, "cat" : "request", "id" : record.id, "pid" : self._pid, "tid" : record.first_tid }
+        self._events.append( dict(span, ph="b", ts=record.submitted, args=args) )
+        self._events.append( dict(span, ph="e", ts=now) )
+
+    def _add_segment(self, request, record, now):
+        thread = threading.current_thread()
+        tid = thread.ident
+        if tid not in self._thread_names:
+            self._thread_names[tid] = thread.name
+        if record.first_tid is None:
+            record.first_tid = tid
+        self._events.append( { "name" : self._name(request, record),
+                               "cat" : "request",
+                               "ph" : "X",
+                               "ts" : record.segment_start,
+                               "dur" : now - record.segment_start,
+                               "pid" : self._pid,
+                               "tid" : tid,
+                               "args" : { "request" : record.id } } )
+        record.segment_start = None
+
+    def _name(self, request, record):
+        if 'operator' in record.info:
+            return "{}.{}".format( record.info['operator'], record.info.get('slot', '') )
+        return record.fn_name
+
+    def _unwrap(self, fn):
+        # Partials, e.g. from Request.writeInto(), may wrap the function several times.
+        while isinstance(fn, (functools.partial, Request._PartialWithAppendedArgs)):
+            fn = fn.func
+        return fn
+
+    def _now(self):
+        # Chrome trace timestamps are in microseconds
+        return (time.time() - self._t0) * 1e6
+
+class _RequestRecord(object):
+    __slots__ = ('id', 'submitted', 'execution_start', 'segment_start', 'suspend_start', 'suspended', 'first_tid', 'info', 'fn_name')
+    def __init__(self, request_id, submitted):
+        self.id = request_id
+        self.submitted = submitted
+        self.execution_start = None
+        self.segment_start = None
+        self.suspend_start = None
+        self.suspended = 0.0
+        self.first_tid = None
+        self.info = {}
+        self.fn_name = None
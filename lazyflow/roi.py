@@ -526,6 +526,153 @@ def is_fully_contained( inner_roi, outer_roi ):
     inner_roi = numpy.asarray(inner_roi)
     return (inner_roi[0] >= outer_roi[0]).all() and (inner_roi[1] <= outer_roi[1]).all()
 
+def group_points_by_tile( points, tile_size ):
+    """
+    Group the given N x k array of point coordinates by tile (of the given edge length).
+    Returns a list of (start, stop, indexes) for each tile that contains any points, where
+    (start, stop) is the bounding box of the points within the tile, and
+    indexes selects these points from the array.
+    """
+    points = numpy.asarray(points)
+    if len(points) == 0:
+        return []
+    tile_coords = points // tile_size
+    tile_grid_shape = 1 + tile_coords.max(axis=0)
+    tile_ids = numpy.ravel_multi_index( tuple(tile_coords.transpose()), tile_grid_shape )
+
+    order = numpy.argsort( tile_ids, kind='mergesort' )
+    split_points = 1 + numpy.nonzero( numpy.diff( tile_ids[order] ) )[0]
+
+    tiles = []
+    for indexes in numpy.split( order, split_points ):
+        tile_points = points[indexes]
+        tiles.append( (tile_points.min(axis=0), 1 + tile_points.max(axis=0), indexes) )
+    return tiles
+
+def subtract_rois( roi, other_rois, max_rois=None ):
+    """
+    Return the part of roi that is not covered by any of the other rois,
+    as a list of disjoint (start, stop) tuples.
+
+    If max_rois is given and the result would consist of more rois than
+    that, None is returned instead.
+
+    Example:
+        >>> subtract_rois( ((0,0), (10,10)), [((0,0), (5,10))] )
+        [((5, 0), (10, 10))]
+        >>> subtract_rois( ((0,0), (10,10)), [((0,0), (20,20))] )
+        []
+    """
+    remaining = [ ( tuple(int(x) for x in roi[0]), tuple(int(x) for x in roi[1]) ) ]
+    if _box_volume(remaining[0]) == 0:
+        return []
+    for other in other_rois:
+        other = ( tuple(other[0]), tuple(other[1]) )
+        pieces = []
+        for box in remaining:
+            if _box_volume(_intersection(box, other)) == 0:
+                pieces.append(box)
+                continue
+            # Cut off the slabs in front of and behind the other roi,
+            # one axis after another.
+            start, stop = list(box[0]), list(box[1])
+            for axis in range(len(start)):
+                if start[axis] < other[0][axis]:
+                    slab_stop = list(stop)
+                    slab_stop[axis] = other[0][axis]
+                    pieces.append( (tuple(start), tuple(slab_stop)) )
+                    start[axis] = other[0][axis]
+                if other[1][axis] < stop[axis]:
+                    slab_start = list(start)
+                    slab_start[axis] = other[1][axis]
+                    pieces.append( (tuple(slab_start), tuple(stop)) )
+                    stop[axis] = other[1][axis]
+        if max_rois is not None and len(pieces) > max_rois:
+            return None
+        remaining = pieces
+    return remaining
+
+class RegionSet(object):
+    """
+    A compact set of boxes (rois), e.g. for accumulating dirty regions.
+
+    Boxes that are contained in other boxes are dropped, and boxes are merged
+    whenever their bounding box doesn't cover much more than the boxes themselves
+    (see ``slack``).  The set therefore always covers everything that was added,
+    but may cover a little more.
+    
+    >>> regions = RegionSet()
+    >>> regions.add( [0,0], [10,10] )
+    >>> regions.add( [2,2], [5,5] )
+    >>> regions.add( [0,10], [10,20] )
+    >>> regions.add( [20,20], [30,30] )
+    >>> regions.rois()
+    [([0, 0], [10, 20]), ([20, 20], [30, 30])]
+    """
+    def __init__(self, slack=0.25, max_boxes=64):
+        """
+        :param slack: Two boxes are merged if their bounding box is at most
+                      this fraction larger than the volume covered by the two boxes.
+        :param max_boxes: If the set contains more boxes than this, they are all merged into their bounding box.
+        """
+        self.slack = slack
+        self.max_boxes = max_boxes
+        self._boxes = []
+
+    def add(self, start, stop):
+        box = ( tuple(int(x) for x in start), tuple(int(x) for x in stop) )
+        if _box_volume(box) == 0:
+            return
+
+        i = 0
+        while i < len(self._boxes):
+            other = self._boxes[i]
+            if _box_contains(other, box):
+                return
+            if _box_contains(box, other) or self._should_merge(box, other):
+                # Remove the other box and start over with the merged box,
+                # which may now be mergeable with boxes we've already checked.
+                del self._boxes[i]
+                box = _bounding_box(box, other)
+                i = 0
+            else:
+                i += 1
+        self._boxes.append(box)
+
+        if len(self._boxes) > self.max_boxes:
+            self._boxes = [ reduce( _bounding_box, self._boxes ) ]
+
+    def rois(self):
+        """
+        Return the boxes as a list of (start, stop) lists.
+        """
+        return [ (list(start), list(stop)) for start, stop in self._boxes ]
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def _should_merge(self, a, b):
+        covered = _box_volume(a) + _box_volume(b) - _box_volume(_intersection(a, b))
+        return _box_volume(_bounding_box(a, b)) <= (1.0 + self.slack) * covered
+
+def _box_volume(box):
+    volume = 1
+    for start, stop in zip(*box):
+        if stop <= start:
+            return 0
+        volume *= stop - start
+    return volume
+
+def _box_contains(outer, inner):
+    return all( o_start <= i_start and i_stop <= o_stop
+                for o_start, o_stop, i_start, i_stop in zip(outer[0], outer[1], inner[0], inner[1]) )
+
+def _bounding_box(a, b):
+    return ( tuple(map(min, a[0], b[0])), tuple(map(max, a[1], b[1])) )
+
+def _intersection(a, b):
+    return ( tuple(map(max, a[0], b[0])), tuple(map(min, a[1], b[1])) )
+
 def getBlockBounds(dataset_shape, block_shape, block_start):
     """
     Given a block start coordinate and block shape, return a roi for 
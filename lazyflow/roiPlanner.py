@@ -0,0 +1,191 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+"""
+Planning the rois that a request causes throughout a graph.
+
+Many operators read more than the requested roi from their inputs, e.g. a halo around it.
+When such operators are stacked, each enlarges the roi again, so the data at the top of
+the graph may be read many times over, in different sizes.
+
+RoiPlan walks upstream from a requested roi, the same way the requests would, and records
+every roi that each slot is asked for.  It follows
+
+- connections between slots,
+- forwarding operators (see Operator.forwardingSource()),
+- pointwise operators (see Operator.pointwiseStage()), and
+- operators that declare the input rois they read (see Operator.requiredInputRois()).
+
+The walk ends at "source" slots: slots with a value, and outputs of operators that don't
+declare their input rois.  The plan reports
+
+- region(slot): the bounding box of all rois requested from a slot, i.e. the region it must provide once,
+- amplification: the number of source voxels read per requested voxel (counting repeated reads), and
+- consolidated_amplification: the same, if each source only provided its region once.
+
+prefetch() issues one request for the region of each cache in the plan,
+so that the requests of the operators below it are served from the cache.
+
+Example::
+
+    plan = RoiPlan( opFeatures.Output, start, stop )
+    print plan # Prints a summary
+    plan.prefetch()
+"""
+import collections
+import logging
+
+import numpy
+
+from lazyflow.roi import TinyVector
+from lazyflow.rtype import SubRegion
+
+logger = logging.getLogger(__name__)
+
+def _volume(start, stop):
+    return int( numpy.prod( numpy.asarray(stop) - start ) )
+
+class RoiPlan(object):
+    """
+    The rois requested from each slot upstream of the given roi of the given slot.
+    """
+    def __init__(self, slot, start, stop):
+        self.slot = slot
+        self.start = TinyVector(start)
+        self.stop = TinyVector(stop)
+
+        # slot : list of (start, stop), in the order the walk reached them
+        self.rois = collections.OrderedDict()
+        self.sources = []
+        self._forwarded = set()
+        self._walk( slot, self.start, self.stop )
+
+    def _walk(self, slot, start, stop):
+        start, stop = TinyVector(start), TinyVector(stop)
+        self.rois.setdefault(slot, []).append( (start, stop) )
+
+        if slot.partner is not None:
+            self._walk( slot.partner, start, stop )
+            return
+
+        op = slot.getRealOperator()
+        if slot.level != 0 or slot._type == "input" or op is None:
+            self._addSource(slot)
+            return
+
+        source = op.forwardingSource(slot)
+        if source is not None:
+            self._forwarded.add(source)
+            self._walk( source, start, stop )
+            return
+
+        stage = op.pointwiseStage(slot)
+        if stage is not None:
+            self._walk( stage.source, *stage.inputRoi(start, stop) )
+            return
+
+        input_rois = op.requiredInputRois( slot, SubRegion(slot, start, stop) )
+        if input_rois is None:
+            self._addSource(slot)
+            return
+        for input_slot, input_start, input_stop in input_rois:
+            self._walk( input_slot, input_start, input_stop )
+
+    def _addSource(self, slot):
+        if slot not in self.sources:
+            self.sources.append(slot)
+
+    def region(self, slot):
+        """
+        The bounding box (start, stop) of all rois requested from the given slot.
+        """
+        rois = self.rois[slot]
+        start = numpy.min( [start for start, stop in rois], axis=0 )
+        stop = numpy.max( [stop for start, stop in rois], axis=0 )
+        return TinyVector(start), TinyVector(stop)
+
+    def requestedVoxels(self, slot):
+        """
+        The total number of voxels requested from the given slot (counting repeated requests).
+        """
+        return sum( _volume(start, stop) for start, stop in self.rois[slot] )
+
+    @property
+    def source_voxels(self):
+        """
+        The total number of voxels read from the sources (counting repeated reads).
+        """
+        return sum( self.requestedVoxels(slot) for slot in self.sources )
+
+    @property
+    def amplification(self):
+        """
+        Source voxels read per requested voxel.
+        """
+        return self.source_voxels / float( _volume(self.start, self.stop) )
+
+    @property
+    def consolidated_amplification(self):
+        """
+        Source voxels read per requested voxel, if each source provided its region only once.
+        """
+        read = sum( _volume( *self.region(slot) ) for slot in self.sources )
+        return read / float( _volume(self.start, self.stop) )
+
+    def caches(self):
+        """
+        The output slots of caches in the plan.
+        (Not counting caches whose requests are merely forwarded from another cache.)
+        """
+        from lazyflow.operators.opCache import Cache # (circular import)
+        return [ slot for slot in self.rois
+                 if slot._type == "output"
+                 and slot not in self._forwarded
+                 and isinstance( slot.getRealOperator(), Cache ) ]
+
+    def prefetch(self, slots=None):
+        """
+        Request the region of each of the given slots (by default: the caches in the plan)
+        with a single request each.  Returns the submitted requests.
+        """
+        if slots is None:
+            slots = self.caches()
+        requests = []
+        for slot in slots:
+            start, stop = self.region(slot)
+            logger.debug( "Prefetching {} of {}.{}".format( (start, stop), slot.getRealOperator().name, slot.name ) )
+            req = slot( start, stop )
+            req.submit()
+            requests.append( req )
+        return requests
+
+    def __str__(self):
+        lines = [ "RoiPlan for {} of {}.{}: amplification {:.2f} (consolidated: {:.2f})"
+                  .format( (tuple(self.start), tuple(self.stop)),
+                           self.slot.getRealOperator().name, self.slot.name,
+                           self.amplification, self.consolidated_amplification ) ]
+        for slot, rois in self.rois.items():
+            start, stop = self.region(slot)
+            lines.append( "  {}{}.{}: {} request(s), {} voxels, region {}"
+                          .format( "* " if slot in self.sources else "",
+                                   slot.getRealOperator().name, slot.name,
+                                   len(rois), self.requestedVoxels(slot), (tuple(start), tuple(stop)) ) )
+        return "\n".join(lines)
@@ -23,7 +23,7 @@ import numpy, copy
 import cPickle as pickle
 import collections
 
-from lazyflow.roi import TinyVector, sliceToRoi, roiToSlice, roiFromShape
+from lazyflow.roi import TinyVector, sliceToRoi, roiToSlice, roiFromShape, group_points_by_tile
 from lazyflow.utility import slicingtools
 
 import logging
@@ -103,6 +103,105 @@ class List(Roi):
         return str(self._l)
 
     
+class PointSet(Roi):
+    """
+    A sparse set of points, e.g. the positions of some labels.
+
+    ``points`` is an N x k array of coordinates along the first k axes of the slot.
+    The data for a PointSet has shape (N,) + shape[k:], i.e. it contains the full
+    remaining axes for each point.  For example, for features with axes 'xyzc',
+    a PointSet with N x 3 coordinates (xyz) yields an N x C feature matrix.
+
+    Operators that don't handle PointSets natively (see Operator.execute_points())
+    are asked for the data of a few small tiles around the points instead (see tiles()).
+    """
+    #: Default edge length for tiles()
+    TILE_SIZE = 32
+
+    def __init__(self, slot, points):
+        super(PointSet, self).__init__(slot)
+        points = numpy.asarray(points, dtype=numpy.int64)
+        if points.ndim == 1:
+            points = points[:, numpy.newaxis]
+        assert points.ndim == 2, "PointSet requires an N x k array of coordinates"
+        if slot is not None and slot.meta.shape is not None:
+            assert points.shape[1] <= len(slot.meta.shape), \
+                "Points have {} coordinates, but the slot has only {} axes".format( points.shape[1], len(slot.meta.shape) )
+        self.points = points
+
+    def __len__(self):
+        return len(self.points)
+
+    def __str__(self):
+        return "PointSet: {} points".format( len(self.points) )
+
+    @property
+    def dim(self):
+        """The number of coordinates per point"""
+        return self.points.shape[1]
+
+    def resultShape(self, shape):
+        """
+        The shape of the data for these points, for a slot of the given (full) shape.
+        """
+        return (len(self.points),) + tuple(shape[self.dim:])
+
+    def boundingBox(self, shape):
+        """
+        Return the (start, stop) roi of the bounding box of all points,
+        over all axes of the given (full) shape.
+        """
+        start = list(self.points.min(axis=0)) + [0]*(len(shape) - self.dim)
+        stop = list(self.points.max(axis=0) + 1) + list(shape[self.dim:])
+        return TinyVector(start), TinyVector(stop)
+
+    def tiles(self, shape, tile_size=None, cost=None):
+        """
+        Group the points by tile (of the given size along each of the first k axes),
+        and return a list of (start, stop, indexes, local_points), where:
+
+        - (start, stop) is the bounding box of the points within the tile (over all axes of the given shape),
+        - indexes selects these points from self.points, and
+        - local_points are their coordinates relative to start.
+
+        If the tiles don't save much compared to the overall bounding box
+        (i.e. the points are dense), the bounding box is returned as the only tile.
+        By default, that is decided by the volumes of the tiles.
+        ``cost(start, stop)`` may estimate the cost of a roi instead,
+        e.g. including the halo that the producer reads around it.
+        """
+        tile_size = tile_size or self.TILE_SIZE
+        cost = cost or (lambda start, stop: numpy.prod( numpy.subtract(stop, start) ))
+        num_points = len(self.points)
+        if num_points == 0:
+            return []
+
+        extra_start = [0]*(len(shape) - self.dim)
+        extra_stop = list(shape[self.dim:])
+        def tile( start, stop, indexes, local_points ):
+            return ( TinyVector(list(start) + extra_start), TinyVector(list(stop) + extra_stop), indexes, local_points )
+
+        tiles = [ tile( start, stop, indexes, self.points[indexes] - start )
+                  for start, stop, indexes in group_points_by_tile( self.points, tile_size ) ]
+        if len(tiles) == 1:
+            return tiles
+
+        bb_start, bb_stop = self.boundingBox(shape)
+        tiles_cost = sum( cost(start, stop) for start, stop, _, _ in tiles )
+        if 2*tiles_cost > cost(bb_start, bb_stop):
+            return [ tile( bb_start[:self.dim], bb_stop[:self.dim], numpy.arange(num_points), self.points - bb_start[:self.dim] ) ]
+        return tiles
+
+    def gather(self, data, start=None):
+        """
+        Extract the data for these points from the given array,
+        which contains the data of a roi that begins at the given start coordinate.
+        """
+        points = self.points
+        if start is not None:
+            points = points - numpy.asarray(start[:self.dim])
+        return data[ tuple(points.transpose()) ]
+
 class SubRegion(Roi):
     def __init__(self, slot, start = None, stop = None, pslice = None):
         super(SubRegion,self).__init__(slot)
@@ -21,6 +21,7 @@
 ###############################################################################
 #Python
 import sys
+import copy
 import logging
 import collections
 import itertools
@@ -35,6 +36,8 @@ import vigra
 
 #lazyflow
 from lazyflow import rtype
+from lazyflow import fusion
+from lazyflow.roiPlanner import RoiPlan
 from lazyflow.roi import TinyVector
 from lazyflow.request import Request
 from lazyflow.stype import ArrayLike
@@ -124,6 +127,8 @@ class Slot(object):
     # output and diagramming purposes.
     _global_counter = itertools.count()
 
+    # The active ExecutionStats, if any.  See executionStats.py
+    _execution_stats = None
 
     class SlotNotReadyError(Exception):
         pass
@@ -134,7 +139,7 @@ class Slot(object):
     
     def __init__(self, name="", operator=None, stype=ArrayLike,
                  rtype=rtype.SubRegion, value=None, optional=False,
-                 level=0, nonlane=False, allow_mask=False):
+                 level=0, nonlane=False, allow_mask=False, coalesce_requests=False):
         """Constructor of the Slot class.
 
         :param name: user readable name of the slot, is normally
@@ -159,6 +164,10 @@ class Slot(object):
         :param nonlane: For multislot, this flag protects it from
           being considered lane-indexed
 
+        :param coalesce_requests: (OutputSlots only) If True, concurrent
+          requests for the same roi share a single execution of the
+          operator. Useful for expensive outputs without a cache.
+
         """
         # This assertion is here for a reason: default values do NOT work on OutputSlots.
         # (We should probably change that at some point...)
@@ -234,6 +243,11 @@ class Slot(object):
         self._settingUp = False
         self._condition = threading.Condition()
 
+        # In-flight computations, keyed by roi (see get())
+        self._coalesce_requests = coalesce_requests
+        self._inFlight = {}
+        self._inFlightLock = threading.Lock()
+
         # Allow slots to be sorted by their order of creation for
         # debug output and diagramming purposes.
         self._global_slot_id = Slot._global_counter.next()
@@ -794,14 +808,174 @@ class Slot(object):
                 Request.raise_if_cancelled()
                 assert self._type != "input", "This inputSlot has no value and no partner.  You can't ask for its data yet!"
             # normal (outputslot) case
+            op = self.getRealOperator()
+            if op is not None and self._isForwarding(op):
+                # --> this operator would just relay the request, so skip it.
+                return Request(Slot.ForwardingWrapper(self, roi))
+
+            if isinstance(roi, rtype.PointSet) and not self._executesPoints():
+                # --> the operator only computes whole regions, so ask for tiles around the points
+                return self._getPointsFromTiles(roi)
+
+            if self._coalesce_requests:
+                key = Slot._inFlightKey(roi)
+                if key is not None:
+                    # --> share the execution with other requests for the same roi
+                    return self._getCoalescedRequest(key, roi)
+
             # --> construct heavy request object..
+            return self._createExecutionRequest(roi)
+
+    def get_many(self, rois):
+        """Retrieve the content of several rois of this slot at once.
+
+        If the operator that provides the data implements
+        Operator.execute_many(), it receives all rois in a single call,
+        so it can share work between them (e.g. load or decompress
+        each block only once).  Otherwise, each roi is requested
+        separately, as if by get().
+
+        :param rois: a list of rois, e.g. SubRegion objects or
+          (start, stop) pairs
+
+        Returns:
+          a request.Request object, whose result is the list of
+          results (one for each roi, in the same order).
+
+        """
+        rois = [ roi if isinstance(roi, rtype.Roi) else self.rtype(self, *roi)
+                 for roi in rois ]
+        if self._value is None and self.partner is not None:
+            # --> just relay the request
+            return self.partner.get_many(rois)
+
+        op = self.getRealOperator()
+        if self._value is None and self._type == "output" and self.ready() \
+          and op is not None and not op._settingUp:
+            if self._isForwarding(op):
+                return Request(Slot.ForwardingWrapper(self, rois, many=True))
+
+            from lazyflow.operator import Operator # (circular import)
+            if type(self.operator).execute_many.im_func is not Operator.execute_many.im_func:
+                execWrapper = Slot.ManyExecutionWrapper(self, rois)
+                request = Request(execWrapper, io_bound=op.io_bound)
+                request.notify_cancelled(execWrapper.handleCancel)
+                return request
+
+        # --> one request per roi
+        requests = [ self.get(roi) for roi in rois ]
+        def wait_all():
+            for req in requests:
+                req.submit()
+            return [ req.wait() for req in requests ]
+        return Request(wait_all)
+
+    def _executesPoints(self):
+        from lazyflow.operator import Operator # (circular import)
+        return type(self.operator).execute_points.im_func is not Operator.execute_points.im_func
+
+    def _getPointsFromTiles(self, points):
+        # Compare the tiles with the bounding box including the halos that are read around them upstream.
+        tiles = points.tiles(self.meta.shape, cost=lambda start, stop: RoiPlan(self, start, stop).source_voxels)
+        tiles_request = self.get_many( [ (start, stop) for start, stop, _, _ in tiles ] )
+        
+        def gather_points(destination=None):
+            if destination is None:
+                destination = self.stype.allocateDestination(points)
+            for (_, _, indexes, local_points), data in zip(tiles, tiles_request.wait()):
+                destination[indexes] = data[ tuple(local_points.transpose()) ]
+            return destination
+        return Request(gather_points)
+
+    def _createExecutionRequest(self, roi):
+        stages = None
+        if fusion.enabled and isinstance(roi, rtype.SubRegion):
+            stages = fusion.findFusableChain(self)
+        if stages is not None:
+            # --> compute the whole chain of pointwise operators at once
+            execWrapper = Slot.FusedExecutionWrapper(self, roi, stages)
+        else:
             execWrapper = Slot.RequestExecutionWrapper(self, roi)
-            request = Request(execWrapper)
+        op = self.getRealOperator()
+        request = Request(execWrapper, io_bound=(op is not None and op.io_bound))
+
+        # We must decrement the execution count even if the
+        # request is cancelled
+        request.notify_cancelled(execWrapper.handleCancel)
+        return request
+
+    def _isForwarding(self, op):
+        """
+        Return True if the given operator (our own) currently relays requests
+        for this slot to another slot.  Never blocks: while the operator is
+        being set up, it is treated as not forwarding.
+        """
+        with op._condition:
+            return not op._settingUp and self._forwardingSource(op) is not None
+
+    def _forwardingSource(self, op):
+        """
+        Return the slot the given operator (our own) relays requests for this slot to, or None.
+        Must be called with op._condition held.  (See Operator.forwardingSource())
+        """
+        source = op.forwardingSource(self)
+        if source is None or Slot._providesValue(source):
+            return None
+        return source
+
+    @staticmethod
+    def _providesValue(slot):
+        """
+        Return True if the given (input) slot, or the input it is connected to, has a value.
+        Requests for such slots are answered with a ValueRequest, which callers of an
+        OutputSlot don't expect.  (See Operator.forwardingSource())
+        """
+        while slot._value is None and slot.partner is not None:
+            slot = slot.partner
+        return slot._value is not None
 
-            # We must decrement the execution count even if the
-            # request is cancelled
-            request.notify_cancelled(execWrapper.handleCancel)
-            return request
+    @staticmethod
+    def _forwardedRoi(roi, source):
+        """
+        Return a copy of the given roi for the given source slot.
+        The source (or the operators upstream of it) may keep the roi,
+        so it must not refer to the operator that was skipped.
+        (See Operator.forwardingSource())
+        """
+        roi = copy.copy(roi)
+        roi.slot = source
+        return roi
+
+    @staticmethod
+    def _inFlightKey(roi):
+        if isinstance(roi, rtype.SubRegion):
+            return (tuple(roi.start), tuple(roi.stop))
+        # Other roi types are not coalesced.
+        return None
+
+    def _getCoalescedRequest(self, key, roi):
+        """
+        Return a new request for the given roi, which shares its execution
+        with all other requests for the same roi that are currently in flight.
+        """
+        with self._inFlightLock:
+            computation = self._inFlight.get(key)
+            if computation is None:
+                computation = Slot.InFlightComputation(self, key, roi)
+                self._inFlight[key] = computation
+            computation.readers += 1
+        return Request(computation)
+
+    def _discardInFlightComputations(self):
+        """
+        Requests issued from now on must not attach to computations that were
+        started before the data changed.  (The old computations still finish
+        for the requests that are already attached to them.)
+        """
+        with self._inFlightLock:
+            for computation in self._inFlight.values():
+                computation.closed = True
+            self._inFlight.clear()
 
     @staticmethod
     def _findUpstreamProblemSlot(slot):
@@ -813,16 +987,92 @@ class Slot(object):
                     return inputSlot
         return "Couldn't find an upstream problem slot."
 
+    class InFlightComputation(object):
+        """
+        The workload of every request that was created by a coalescing slot.
+        All requests for the same roi wait for a single shared execution request,
+        then copy its result into their own destination.
+
+        The shared request is created by the first of them that starts executing,
+        so it is an ordinary child request: it is only cancelled when
+        ALL requests waiting for it have been cancelled.
+        """
+        def __init__(self, slot, key, roi):
+            self.slot = slot
+            self.key = key
+            self.roi = roi
+            self.request = None
+
+            # Number of requests that may still read the shared result.
+            # (Protected by slot._inFlightLock)
+            self.readers = 0
+
+            # If True, no more requests can attach to this computation.
+            self.closed = False
+
+        def __call__(self, destination=None):
+            try:
+                result = self._waitForSharedResult()
+                with self.slot._inFlightLock:
+                    if destination is None and self.closed and self.readers == 1:
+                        # Nobody else needs the shared result, so we can simply take it.
+                        return result
+
+                if destination is None:
+                    destination = self.slot.stype.allocateDestination(self.roi)
+                self.slot.stype.copy_data(dst=destination, src=result)
+                return destination
+            finally:
+                with self.slot._inFlightLock:
+                    self.readers -= 1
+                    if self.closed and self.readers == 0:
+                        # Release the shared result
+                        self.request = None
+
+        def _waitForSharedResult(self):
+            while True:
+                with self.slot._inFlightLock:
+                    if self.request is None or self.request.cancelled:
+                        self.request = self.slot._createExecutionRequest(self.roi)
+                        self.request.notify_finished(self._retire)
+                        self.request.notify_failed(self._retire)
+                        self.request.notify_cancelled(self._retire)
+                    request = self.request
+
+                # The shared request must only be cancelled if ALL of its callers are cancelled.
+                request.attach_to_current_request()
+                try:
+                    return request.wait()
+                except Request.InvalidRequestException:
+                    # The shared request was cancelled by the other requests that
+                    # were waiting for it, before we started waiting for it ourselves.
+                    # Start it again.
+                    pass
+
+        def _retire(self, *args):
+            with self.slot._inFlightLock:
+                if self.slot._inFlight.get(self.key) is self:
+                    del self.slot._inFlight[self.key]
+                self.closed = True
+
     class RequestExecutionWrapper(object):
         def __init__(self, slot, roi):
             self.started = False
             self.finished = False
             self.slot = slot
             self.operator = slot.operator
+            # The operators that must not be set up while we execute.
+            self.operators = [self.operator]
             self.lock = threading.Lock()
             self.roi = roi
 
         def __call__(self, destination=None):
+            stats = Slot._execution_stats
+            if stats is not None:
+                return stats.measure(self, destination)
+            return self._call(destination)
+
+        def _call(self, destination=None):
             # store whether the user wants the results in a given
             # destination area
             destination_given = destination is not None
@@ -843,7 +1093,7 @@ class Slot(object):
             try:
                 # Execute the workload, which might not ever return
                 # (if we get cancelled).
-                result_op = self.operator.execute(self.slot, (), self.roi, destination)
+                result_op = self._execute(destination)
 
                 # copy data from result_op to destination, if
                 # destination was actually given by the user, and the
@@ -879,16 +1129,22 @@ class Slot(object):
                 self._decrementOperatorExecutionCount()
                 raise
 
+        def _execute(self, destination):
+            if isinstance(self.roi, rtype.PointSet):
+                return self.operator.execute_points(self.slot, (), self.roi, destination)
+            return self.operator.execute(self.slot, (), self.roi, destination)
+
         def _incrementOperatorExecutionCount(self):
             self.started = True
-            assert self.operator._executionCount >= 0, \
-                          "BUG: How did the execution count get negative?"
-            # We can't execute while the operator is in the middle of
-            # setupOutputs
-            with self.operator._condition:
-                while self.operator._settingUp:
-                    self.operator._condition.wait()
-                self.operator._executionCount += 1
+            for operator in self.operators:
+                assert operator._executionCount >= 0, \
+                              "BUG: How did the execution count get negative?"
+                # We can't execute while the operator is in the middle of
+                # setupOutputs
+                with operator._condition:
+                    while operator._settingUp:
+                        operator._condition.wait()
+                    operator._executionCount += 1
 
         def handleCancel(self, *args):
             # The new request api does clean up by handling an
@@ -906,12 +1162,117 @@ class Slot(object):
                 # Only do this once per execution. If we were cancelled
                 # after we finished working, don't do anything
                 if self.started and not self.finished:
-                    assert self.operator._executionCount > 0, \
-                          "BUG: Can't decrement the execution count below zero!"
                     self.finished = True
-                    with self.operator._condition:
-                        self.operator._executionCount -= 1
-                        self.operator._condition.notifyAll()
+                    for operator in self.operators:
+                        assert operator._executionCount > 0, \
+                              "BUG: Can't decrement the execution count below zero!"
+                        with operator._condition:
+                            operator._executionCount -= 1
+                            operator._condition.notifyAll()
+
+    class ManyExecutionWrapper(RequestExecutionWrapper):
+        """
+        Executes Operator.execute_many() for the rois of Slot.get_many().
+        """
+        def __init__(self, slot, rois):
+            super(Slot.ManyExecutionWrapper, self).__init__(slot, rois)
+
+        def _call(self, destination=None):
+            assert destination is None, "Slot.get_many() can't write into a given destination"
+            results = [ self.slot.stype.allocateDestination(roi) for roi in self.roi ]
+
+            self._incrementOperatorExecutionCount()
+            try:
+                results_op = self.operator.execute_many(self.slot, (), self.roi, results)
+            finally:
+                self._decrementOperatorExecutionCount()
+
+            if results_op is not None:
+                results = list(results_op)
+            assert len(results) == len(self.roi), \
+                "Operator {} returned {} results for {} rois".format( self.operator.name, len(results), len(self.roi) )
+            return results
+
+    class ForwardingWrapper(object):
+        """
+        The workload of a request for a slot whose operator only relays it
+        (see Operator.forwardingSource()): skips the whole chain of such
+        operators and requests the data from the end of it directly.
+
+        Like the RequestExecutionWrapper, it increments the execution count
+        of every operator it skips while the request runs, so none of them
+        can be set up meanwhile.  Whether an operator forwards is decided
+        under its condition, together with the increment.
+        """
+        def __init__(self, slot, roi, many=False):
+            self.slot = slot
+            self.roi = roi
+            # If True, roi is a list of rois (see Slot.get_many())
+            self.many = many
+            # The skipped operators
+            self.operators = []
+
+        def __call__(self, destination=None):
+            try:
+                slot, roi = self._skipForwardingOperators()
+                if self.many:
+                    assert destination is None, "Slot.get_many() can't write into a given destination"
+                    return slot.get_many(roi).wait()
+                request = slot.get(roi)
+                if destination is not None:
+                    request.writeInto(destination)
+                return request.wait()
+            finally:
+                self._decrementOperatorExecutionCount()
+
+        def _skipForwardingOperators(self):
+            slot, roi = self.slot, self.roi
+            while True:
+                op = slot.getRealOperator()
+                with op._condition:
+                    while op._settingUp:
+                        op._condition.wait()
+                    source = slot._forwardingSource(op)
+                    if source is None:
+                        return slot, roi
+                    op._executionCount += 1
+                self.operators.append(op)
+
+                if self.many:
+                    roi = [ Slot._forwardedRoi(r, source) for r in roi ]
+                else:
+                    roi = Slot._forwardedRoi(roi, source)
+
+                # Continue with the output slot the source is connected to, if any.
+                slot = source
+                while slot.partner is not None:
+                    slot = slot.partner
+                if slot._type != "output" or not slot.ready() or slot.getRealOperator() is None:
+                    return slot, roi
+
+        def _decrementOperatorExecutionCount(self):
+            for op in self.operators:
+                assert op._executionCount > 0, \
+                      "BUG: Can't decrement the execution count below zero!"
+                with op._condition:
+                    op._executionCount -= 1
+                    op._condition.notifyAll()
+            self.operators = []
+
+    class FusedExecutionWrapper(RequestExecutionWrapper):
+        """
+        Computes a chain of pointwise operators in one go, instead of
+        executing each of them (see lazyflow.fusion).
+        """
+        def __init__(self, slot, roi, stages):
+            super(Slot.FusedExecutionWrapper, self).__init__(slot, roi)
+            self.stages = stages
+            for stage in stages[1:]:
+                if stage.operator not in self.operators:
+                    self.operators.append(stage.operator)
+
+        def _execute(self, destination):
+            return fusion.executeFused(self.stages, self.roi, destination)
 
     @is_setup_fn    
     def setDirty(self, *args, **kwargs):
@@ -932,6 +1293,14 @@ class Slot(object):
             else:
                 roi = args[0]
 
+            graph = self.graph
+            if graph is not None and graph._dirty_batch is not None and graph._batchDirty(self, roi):
+                # --> will be propagated when the batch is flushed
+                return
+
+            if self._inFlight:
+                self._discardInFlightComputations()
+
             for c in self.partners:
                 c.setDirty(roi)
 
@@ -1353,6 +1722,7 @@ class Slot(object):
         init_kwargs['level'] = self.level
         init_kwargs['nonlane'] = self.nonlane
         init_kwargs['allow_mask'] = self.allow_mask
+        init_kwargs['coalesce_requests'] = self._coalesce_requests
         if self._type == "input":
             init_kwargs['optional'] = self._optional
         
@@ -1408,6 +1778,11 @@ class Slot(object):
         if self.operator is not None:
             # check whether all slots are connected and notify operator
             if self.operator.configured():
+                from lazyflow.operator import Operator # (circular import)
+                if ( self._type == "input"
+                     and isinstance(self.operator, Operator)
+                     and self.operator._handleIrrelevantMetaChange(self) ):
+                    return
                 self.operator._setupOutputs()
 
     def _setupOutputs(self):
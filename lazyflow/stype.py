@@ -24,7 +24,9 @@ import collections
 import warnings
 
 from roi import roiToSlice
+from lazyflow.rtype import PointSet
 from lazyflow.utility.helpers import warn_deprecated
+from lazyflow.utility.bufferPool import default_buffer_pool
 
 import h5py
 
@@ -97,7 +99,15 @@ class SlotType( object ):
 
 
 class ArrayLike( SlotType ):
-    def allocateDestination( self, roi ):
+    def allocateDestination( self, roi, pooled=False ):
+        """
+        Allocate an (uninitialized) array for the data of the given roi.
+
+        :param pooled: If True, the array is backed by the default buffer pool.
+                       Only use this for internal scratch space that is dropped soon:
+                       such an array doesn't own its memory (so it can't be resized to free it),
+                       and its buffer may be somewhat larger than the array.
+        """
         # If we do not support masked arrays, ensure that we are not allocating one.
         assert self.slot.allow_mask or (not self.slot.meta.has_mask), \
             "Allocation of a masked array is expected by the slot, \"%s\", of operator, " "\"%s\"," \
@@ -105,8 +115,14 @@ class ArrayLike( SlotType ):
             "please pass the keyword argument `allow_mask=True` to the slot constructor." \
             % (self.slot.operator.name, self.slot.name)
 
-        shape = roi.stop - roi.start if roi else self.slot.meta.shape
-        storage = numpy.ndarray(shape, dtype=self.slot.meta.dtype)
+        if isinstance(roi, PointSet):
+            shape = roi.resultShape(self.slot.meta.shape)
+        else:
+            shape = roi.stop - roi.start if roi else self.slot.meta.shape
+        if pooled:
+            storage = default_buffer_pool.allocate(shape, self.slot.meta.dtype)
+        else:
+            storage = numpy.ndarray(shape, dtype=self.slot.meta.dtype)
 
         # if self.slot.meta.axistags is True:
         #     storage = vigra.taggedView(storage, self.slot.meta.axistags)
@@ -135,6 +151,12 @@ class ArrayLike( SlotType ):
             "please pass the keyword argument `allow_mask=True` to the slot constructor." \
             % (self.slot.operator.name, self.slot.name)
 
+        if isinstance(roi, PointSet):
+            if destination is None:
+                return roi.gather(value)
+            self.copy_data(destination, roi.gather(value))
+            return destination
+
         if destination is not None:
             if not isinstance(destination, list):
                 assert(roi.dim == destination.ndim), "%r ndim=%r, shape=%r" % (roi.toSlice(), destination.ndim, destination.shape)
@@ -223,7 +245,11 @@ class ArrayLike( SlotType ):
             dst[...] = src[...]
 
     def check_result_valid(self, roi, result):
-        if isinstance(result, numpy.ndarray):
+        if isinstance(roi, PointSet):
+            expected_shape = roi.resultShape(self.slot.meta.shape)
+            assert result.shape == expected_shape, \
+                "check_result_valid: result has wrong shape.  Got {}, expected {}".format( result.shape, expected_shape )
+        elif isinstance(result, numpy.ndarray):
             assert len(roi.start) == result.ndim, "check_result_valid: result has wrong number of dimensions (%d instead of %d)" % (result.ndim, len(roi.start))
             for d in range(result.ndim):
                 assert (result.shape == (roi.stop - roi.start)).all(), \
@@ -21,6 +21,7 @@
 ###############################################################################
 from alternative_numpy_functions import vigra_bincount
 from memory import Memory
+from bufferPool import BufferPool, default_buffer_pool
 import helpers
 import jsonConfig
 import slicingtools
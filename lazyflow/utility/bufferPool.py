@@ -0,0 +1,212 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+"""
+A pool of reusable memory for (large) temporary arrays.
+
+Many operators allocate and discard arrays of the same few sizes over and over
+(full-block scratch space in caches, presmoothed feature sources, etc.).
+Each fresh allocation of a large array is a fresh mmap, so every page of it must be
+faulted in again, and the heap gets fragmented.
+
+BufferPool.allocate() hands out arrays that are backed by pooled memory.
+As soon as the last reference to such an array (or any view of it) is gone,
+its memory is returned to the pool and can be reused by the next allocation
+from the same size bucket.  No explicit release is necessary: dropping the array
+(e.g. when a request is cleaned) is enough.
+
+The memory held by idle buffers is limited to a fraction of
+Memory.getAvailableRamComputation().
+
+Pooled arrays don't own their memory (so they can't be resized to free it),
+and their buffers may be up to 1/BUCKETS_PER_OCTAVE larger than the arrays.
+So only internal scratch space should be pooled, not arrays that are handed
+to other code (e.g. request results).
+"""
+from __future__ import division
+
+import collections
+import logging
+import threading
+
+import numpy
+
+from lazyflow.utility.memory import Memory
+
+logger = logging.getLogger(__name__)
+
+class BufferPool(object):
+    #: Smaller arrays are cheap to allocate, so they aren't pooled.
+    MIN_BYTES = 64 * 1024
+
+    #: Size buckets per power of two.
+    #: (A buffer is at most 1/BUCKETS_PER_OCTAVE larger than the array that uses it.)
+    BUCKETS_PER_OCTAVE = 4
+
+    #: Default limit for the memory held by idle buffers,
+    #: as a fraction of Memory.getAvailableRamComputation()
+    DEFAULT_RAM_FRACTION = 0.1
+
+    def __init__(self, limit=None):
+        """
+        :param limit: Maximum number of bytes to keep in idle buffers.
+                      If None (the default), use DEFAULT_RAM_FRACTION of the RAM available for computation.
+        """
+        self.enabled = True
+        self._limit = limit
+        self._lock = threading.RLock()
+        self._idle_buffers = collections.defaultdict(list) # bucket size -> [raw buffer, ...]
+        self._idle_bytes = 0
+        self.reset_stats()
+
+    @property
+    def limit(self):
+        if self._limit is not None:
+            return self._limit
+        return int( Memory.getAvailableRamComputation() * self.DEFAULT_RAM_FRACTION )
+
+    @limit.setter
+    def limit(self, limit):
+        """
+        Set the maximum number of bytes to keep in idle buffers (None for the default).
+        """
+        self._limit = limit
+        self._trim()
+
+    def allocate(self, shape, dtype):
+        """
+        Return an uninitialized C-contiguous array of the given shape and dtype
+        (like numpy.ndarray(shape, dtype)), preferably backed by a pooled buffer.
+        """
+        dtype = numpy.dtype(dtype)
+        shape = tuple( int(s) for s in shape )
+        nbytes = int( numpy.prod(shape) ) * dtype.itemsize
+        if not self.enabled or nbytes < self.MIN_BYTES or dtype.hasobject:
+            return numpy.ndarray(shape, dtype=dtype)
+
+        bucket = self._bucket_size(nbytes)
+        with self._lock:
+            self.allocations += 1
+            idle = self._idle_buffers.get(bucket)
+            if idle:
+                raw = idle.pop()
+                self._idle_bytes -= bucket
+                self.reused += 1
+                self.reused_bytes += nbytes
+            else:
+                raw = None
+
+        if raw is None:
+            raw = numpy.ndarray( (bucket,), dtype=numpy.uint8 )
+        return numpy.asarray( _PooledMemory(self, raw, shape, dtype) )
+
+    def clear(self):
+        """
+        Free all idle buffers.
+        """
+        with self._lock:
+            self._idle_buffers.clear()
+            self._idle_bytes = 0
+
+    @property
+    def idle_bytes(self):
+        return self._idle_bytes
+
+    @property
+    def reuse_rate(self):
+        """
+        The fraction of (pooled) allocations that were served from an idle buffer.
+        """
+        if self.allocations == 0:
+            return 0.0
+        return self.reused / self.allocations
+
+    def stats(self):
+        with self._lock:
+            return { 'allocations' : self.allocations,
+                     'reused' : self.reused,
+                     'reuse_rate' : self.reuse_rate,
+                     'reused_bytes' : self.reused_bytes,
+                     'returned' : self.returned,
+                     'discarded' : self.discarded,
+                     'idle_bytes' : self._idle_bytes,
+                     'limit' : self.limit }
+
+    def reset_stats(self):
+        self.allocations = 0
+        self.reused = 0
+        self.reused_bytes = 0
+        self.returned = 0
+        self.discarded = 0
+
+    def _bucket_size(self, nbytes):
+        # Round up to the next of BUCKETS_PER_OCTAVE steps between consecutive powers of two.
+        octave = 1 << (int(nbytes-1).bit_length() - 1)
+        step = max(1, octave // self.BUCKETS_PER_OCTAVE)
+        return -(-nbytes // step) * step
+
+    def _return(self, raw):
+        """
+        Called when the last array using the given raw buffer has been deleted.
+        """
+        bucket = raw.nbytes
+        with self._lock:
+            if self._idle_bytes + bucket <= self.limit:
+                self._idle_buffers[bucket].append(raw)
+                self._idle_bytes += bucket
+                self.returned += 1
+            else:
+                self.discarded += 1
+
+    def _trim(self):
+        with self._lock:
+            limit = self.limit
+            for bucket in sorted( self._idle_buffers.keys(), reverse=True ):
+                idle = self._idle_buffers[bucket]
+                while idle and self._idle_bytes > limit:
+                    idle.pop()
+                    self._idle_bytes -= bucket
+                    self.discarded += 1
+
+class _PooledMemory(object):
+    """
+    Exposes (a prefix of) a raw pooled buffer as an array of the given shape and dtype.
+    The arrays created from this object keep it alive (as their 'base').
+    Once they are all gone, the raw buffer is returned to the pool.
+    """
+    def __init__(self, pool, raw, shape, dtype):
+        self._pool = pool
+        self._raw = raw
+        self.__array_interface__ = { 'version' : 3,
+                                     'shape' : shape,
+                                     'typestr' : dtype.str,
+                                     'descr' : dtype.descr,
+                                     'data' : (raw.__array_interface__['data'][0], False) }
+
+    def __del__(self):
+        try:
+            self._pool._return(self._raw)
+        except Exception:
+            # This can happen during interpreter shutdown.
+            pass
+
+#: The pool used by ArrayLike.allocateDestination() (and others).
+default_buffer_pool = BufferPool()
@@ -200,7 +200,7 @@ class TiledVolume(object):
 
             PARALLEL_REQ = True
             if PARALLEL_REQ:
-                pool.add( Request( retrieval_fn ) )
+                pool.add( Request( retrieval_fn, io_bound=True ) )
             else:
                 # execute serially (leave the pool empty)
                 retrieval_fn()
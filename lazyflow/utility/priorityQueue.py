@@ -47,6 +47,15 @@ class PriorityQueue(object):
             item = heapq.heappop(self._heap)
         return self._reduceItem(item)
 
+    def peek(self):
+        """
+        Return the item that the next call to pop() would return,
+        without removing it.  Raises IndexError if the queue is empty.
+        """
+        with self._lock:
+            item = self._heap[0]
+        return self._reduceItem(item)
+
     def __len__(self):
         return len(self._heap)
 
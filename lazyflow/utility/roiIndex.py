@@ -0,0 +1,190 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import itertools
+import collections
+
+class RoiIndex(object):
+    """
+    Spatial index over a set of rois (start, stop), for finding the rois
+    that contain or intersect a given roi without looking at all of them.
+
+    Space is divided into a regular grid of cells, each cell knows the rois
+    that overlap it. The cell shape is taken from the first roi that is
+    added, which works well for the usual case of (mostly) equally sized
+    blocks. Rois that would span very many cells are kept in a separate
+    list that is always searched. If too many rois end up in that list, or
+    the rois overlap many cells on average (e.g. because the first roi was
+    unusually small), the cell shape is replaced by the median roi shape
+    and the grid is rebuilt.
+
+    Rois must be hashable, i.e. tuples of tuples. This class is not
+    threadsafe.
+
+    >>> index = RoiIndex()
+    >>> index.add( ((0,0), (10,10)) )
+    >>> index.add( ((10,0), (20,10)) )
+    >>> index.containing( ((12,2), (15,5)) )
+    ((10, 0), (20, 10))
+    >>> sorted(index.intersecting( ((5,5), (15,6)) ))
+    [((0, 0), (10, 10)), ((10, 0), (20, 10))]
+    """
+
+    # Rois that overlap more cells than this are not put into the grid
+    max_cells_per_roi = 64
+
+    # Rebuild the grid if more than this fraction of the rois are not in it
+    max_large_fraction = 0.25
+
+    def __init__(self):
+        self._cell_shape = None
+        # cell coordinates : set of rois
+        self._cells = collections.defaultdict(set)
+        self._large_rois = set()
+        self._rois = set()
+        # Total number of cells overlapped by the rois in the grid
+        self._num_entries = 0
+        # The grid is rebuilt at most once per doubling of the number of rois
+        self._regrid_size = 4
+
+    def __len__(self):
+        return len(self._rois)
+
+    def __contains__(self, roi):
+        return roi in self._rois
+
+    def __iter__(self):
+        return iter(self._rois)
+
+    def add(self, roi):
+        if roi in self._rois:
+            return
+        if self._cell_shape is None:
+            self._cell_shape = tuple( max(1, b - a) for a, b in zip(*roi) )
+        self._insert(roi)
+        if len(self._rois) >= 2 * self._regrid_size and self._gridIsPoor():
+            self._regrid()
+
+    def _insert(self, roi):
+        self._rois.add(roi)
+        cells = self._cellRanges(roi)
+        num_cells = self._numCells(cells)
+        if num_cells > self.max_cells_per_roi:
+            self._large_rois.add(roi)
+        else:
+            self._num_entries += num_cells
+            for cell in itertools.product(*cells):
+                self._cells[cell].add(roi)
+
+    def remove(self, roi):
+        """
+        remove a roi from the index (if it is there)
+        """
+        if roi not in self._rois:
+            return
+        self._rois.remove(roi)
+        if roi in self._large_rois:
+            self._large_rois.remove(roi)
+            return
+        cells = self._cellRanges(roi)
+        self._num_entries -= self._numCells(cells)
+        for cell in itertools.product(*cells):
+            rois = self._cells[cell]
+            rois.discard(roi)
+            if not rois:
+                del self._cells[cell]
+
+    def containing(self, inner_roi):
+        """
+        return a roi that entirely envelops inner_roi, or None
+        """
+        start, stop = inner_roi
+        if self._cell_shape is None:
+            return None
+        if any( a >= b for a, b in zip(start, stop) ):
+            # empty roi, doesn't determine a cell
+            candidates = self._rois
+        else:
+            cell = tuple( a // s for a, s in zip(start, self._cell_shape) )
+            candidates = itertools.chain( self._cells.get(cell, ()), self._large_rois )
+        for roi in candidates:
+            if all( a <= b for a, b in zip(roi[0], start) ) and \
+               all( a >= b for a, b in zip(roi[1], stop) ):
+                return roi
+        return None
+
+    def intersecting(self, roi):
+        """
+        return the list of rois that overlap the given roi
+        (touching boundaries don't count)
+        """
+        if self._cell_shape is None:
+            return []
+        cells = self._cellRanges(roi)
+        if self._numCells(cells) > len(self._rois):
+            # cheaper to look at everything
+            candidates = self._rois
+        else:
+            candidates = set(self._large_rois)
+            for cell in itertools.product(*cells):
+                candidates.update( self._cells.get(cell, ()) )
+        start, stop = roi
+        return [ r for r in candidates
+                 if all( a < d and c < b
+                         for a, b, c, d in zip(r[0], r[1], start, stop) ) ]
+
+    def _gridIsPoor(self):
+        """
+        True if too many rois are not in the grid, or the rois in the grid
+        overlap more cells than a roi of the cell shape would
+        """
+        num_gridded = len(self._rois) - len(self._large_rois)
+        return len(self._large_rois) > self.max_large_fraction * len(self._rois) or \
+               self._num_entries > 2**len(self._cell_shape) * num_gridded
+
+    def _regrid(self):
+        """
+        take the cell shape from the median roi shape and rebuild the grid
+        """
+        extents = zip(*( [ max(1, b - a) for a, b in zip(*roi) ] for roi in self._rois ))
+        self._cell_shape = tuple( sorted(e)[len(e)//2] for e in extents )
+        rois = self._rois
+        self._cells = collections.defaultdict(set)
+        self._large_rois = set()
+        self._rois = set()
+        self._num_entries = 0
+        self._regrid_size = len(rois)
+        for roi in rois:
+            self._insert(roi)
+
+    def _cellRanges(self, roi):
+        """
+        for each axis, the range of cell coordinates overlapped by roi
+        """
+        return [ xrange( a // s, max(a, b - 1) // s + 1 )
+                 for a, b, s in zip(roi[0], roi[1], self._cell_shape) ]
+
+    @staticmethod
+    def _numCells(cell_ranges):
+        n = 1
+        for r in cell_ranges:
+            n *= len(r)
+        return n
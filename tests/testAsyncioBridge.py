@@ -0,0 +1,276 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import threading
+
+import nose
+
+import numpy
+
+from lazyflow.graph import Graph
+from lazyflow.operators import OpArrayPiper
+from lazyflow.rtype import SubRegion
+from lazyflow.request import Request, RequestLock, as_future, get_async
+from lazyflow.request.asyncioBridge import asyncio
+
+class FakeFuture(object):
+    """
+    The parts of asyncio.Future that as_future() uses.
+    """
+    def __init__(self):
+        self._state = 'pending'
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+
+    def done(self):
+        return self._state != 'pending'
+
+    def cancelled(self):
+        return self._state == 'cancelled'
+
+    def result(self):
+        assert self._state == 'finished', self._state
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def set_result(self, result):
+        self._result = result
+        self._finish('finished')
+
+    def set_exception(self, exc):
+        self._exception = exc
+        self._finish('finished')
+
+    def cancel(self):
+        if self.done():
+            return False
+        self._finish('cancelled')
+        return True
+
+    def add_done_callback(self, fn):
+        self._callbacks.append(fn)
+
+    def _finish(self, state):
+        assert not self.done()
+        self._state = state
+        for fn in self._callbacks:
+            fn(self)
+
+class FakeLoop(object):
+    """
+    An event loop that only runs the callbacks it was given from other threads,
+    when asked to (in the test thread).
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._callbacks = []
+        self.closed = False
+
+    def create_future(self):
+        return FakeFuture()
+
+    def call_soon_threadsafe(self, fn, *args):
+        with self._condition:
+            if self.closed:
+                raise RuntimeError("Event loop is closed")
+            self._callbacks.append( (fn, args) )
+            self._condition.notify()
+
+    def run_until_done(self, future, timeout=10.0):
+        with self._condition:
+            while not future.done():
+                if not self._callbacks:
+                    self._condition.wait(timeout)
+                    assert self._callbacks, "Timed out waiting for the request"
+                fn, args = self._callbacks.pop(0)
+                fn(*args)
+
+class TestAsyncioBridgeWithFakeLoop(object):
+    """
+    Tests the mapping between requests and futures without asyncio.
+    """
+    def setUp(self):
+        self.loop = FakeLoop()
+
+    def test_result(self):
+        future = as_future( Request( lambda: 42 ), self.loop )
+        self.loop.run_until_done(future)
+        assert future.result() == 42
+
+    def test_failure(self):
+        def fail():
+            raise ValueError("expected")
+        future = as_future( Request( fail ), self.loop )
+        self.loop.run_until_done(future)
+        try:
+            future.result()
+        except ValueError:
+            pass
+        else:
+            assert False, "Expected the request's exception to be raised."
+
+    def test_cancel_future(self):
+        if Request.global_thread_pool.num_workers == 0:
+            raise nose.SkipTest
+        lock = RequestLock()
+        lock.acquire()
+        started = threading.Event()
+        def wait_for_lock():
+            started.set()
+            with lock:
+                pass
+            Request.raise_if_cancelled()
+            return "not cancelled"
+
+        req = Request( wait_for_lock )
+        future = as_future( req, self.loop )
+        started.wait()
+
+        # Cancelling the future cancels the request
+        assert future.cancel()
+        assert req.cancelled
+
+        finished = threading.Event()
+        req.notify_cancelled( finished.set )
+        lock.release()
+        finished.wait()
+        assert future.cancelled()
+
+    def test_cancel_request(self):
+        if Request.global_thread_pool.num_workers == 0:
+            raise nose.SkipTest
+        lock = RequestLock()
+        lock.acquire()
+        req = Request( lambda: lock.acquire() )
+        future = as_future( req, self.loop )
+
+        # Cancelling the request cancels the future
+        req.cancel()
+        lock.release()
+        self.loop.run_until_done(future)
+        assert future.cancelled()
+
+    def test_closed_loop(self):
+        # The result can't be delivered any more, but that's no error.
+        self.loop.closed = True
+        req = Request( lambda: 42 )
+        future = as_future( req, self.loop )
+        assert req.wait() == 42
+        assert not future.done()
+
+class TestAsyncioBridge(object):
+
+    def setUp(self):
+        if asyncio is None:
+            raise nose.SkipTest
+        if Request.global_thread_pool.num_workers == 0:
+            # Some of these tests block in a request until the test thread releases a lock.
+            raise nose.SkipTest
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_result(self):
+        future = as_future( Request( lambda: 42 ), self.loop )
+        assert self.loop.run_until_complete(future) == 42
+
+    def test_many(self):
+        futures = [ as_future( Request( lambda i=i: i*i ), self.loop ) for i in range(1000) ]
+        results = self.loop.run_until_complete( asyncio.gather(*futures) )
+        assert results == [ i*i for i in range(1000) ]
+
+    def test_failure(self):
+        def fail():
+            raise ValueError("expected")
+        future = as_future( Request( fail ), self.loop )
+        try:
+            self.loop.run_until_complete(future)
+        except ValueError:
+            pass
+        else:
+            assert False, "Expected the request's exception to be raised."
+
+    def test_cancel_future(self):
+        """
+        Cancelling the future cancels the request.
+        """
+        lock = RequestLock()
+        lock.acquire()
+        started = threading.Event()
+        def wait_for_lock():
+            started.set()
+            with lock:
+                pass
+            Request.raise_if_cancelled()
+            return "not cancelled"
+
+        req = Request( wait_for_lock )
+        future = as_future( req, self.loop )
+        started.wait()
+
+        future.cancel()
+        try:
+            self.loop.run_until_complete(future)
+        except asyncio.CancelledError:
+            pass
+        assert req.cancelled
+
+        lock.release()
+        finished = threading.Event()
+        req.notify_cancelled( finished.set )
+        finished.wait()
+
+    def test_cancel_request(self):
+        """
+        Cancelling the request cancels the future.
+        """
+        lock = RequestLock()
+        lock.acquire()
+        req = Request( lambda: lock.acquire() )
+        future = as_future( req, self.loop )
+        req.cancel()
+        lock.release()
+        try:
+            self.loop.run_until_complete(future)
+        except asyncio.CancelledError:
+            pass
+        else:
+            assert False, "Expected the future to be cancelled."
+        assert future.cancelled()
+
+    def test_get_async(self):
+        data = numpy.indices( (10,20) ).sum(0)
+        op = OpArrayPiper( graph=Graph() )
+        op.Input.setValue( data )
+        roi = SubRegion( op.Output, (2,3), (5,7) )
+        result = self.loop.run_until_complete( get_async( op.Output, roi, self.loop ) )
+        assert (result == data[2:5, 3:7]).all()
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
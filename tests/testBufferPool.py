@@ -0,0 +1,141 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import threading
+import unittest
+
+import numpy
+
+from lazyflow.graph import Graph
+from lazyflow.operators import OpArrayPiper
+from lazyflow.utility import Memory, BufferPool, default_buffer_pool
+
+
+class TestBufferPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = BufferPool(limit=100*2**20)
+
+    def testAllocate(self):
+        a = self.pool.allocate((100, 200), numpy.float32)
+        assert type(a) is numpy.ndarray
+        assert a.shape == (100, 200)
+        assert a.dtype == numpy.float32
+        assert a.flags.c_contiguous and a.flags.writeable
+        a[:] = 1
+        assert a.sum() == 100*200
+
+    def testSmallArraysAreNotPooled(self):
+        a = self.pool.allocate((10, 10), numpy.uint8)
+        assert a.shape == (10, 10)
+        del a
+        assert self.pool.stats()['allocations'] == 0
+        assert self.pool.idle_bytes == 0
+
+    def testReuse(self):
+        a = self.pool.allocate((100, 200), numpy.float32)
+        address = a.__array_interface__['data'][0]
+
+        # A view keeps the buffer in use
+        v = a[10:20]
+        del a
+        assert self.pool.idle_bytes == 0
+        b = self.pool.allocate((100, 200), numpy.float32)
+        assert b.__array_interface__['data'][0] != address
+        del b
+
+        del v
+        assert self.pool.idle_bytes > 0
+
+        # A slightly smaller array of a different dtype fits into the same buffer
+        c = self.pool.allocate((99, 100), numpy.float64)
+        assert c.__array_interface__['data'][0] == address
+        assert self.pool.stats()['reused'] == 1
+
+    def testLimit(self):
+        pool = BufferPool(limit=2**20)
+        arrays = [ pool.allocate((2**19,), numpy.uint8) for _ in range(3) ]
+        del arrays
+        assert pool.idle_bytes == 2**20
+        assert pool.stats()['discarded'] == 1
+
+        pool.limit = 2**19
+        assert pool.idle_bytes == 2**19
+
+    def testDefaultLimit(self):
+        pool = BufferPool()
+        expected = int(Memory.getAvailableRamComputation() * BufferPool.DEFAULT_RAM_FRACTION)
+        assert pool.limit == expected
+
+    def testDisabled(self):
+        self.pool.enabled = False
+        a = self.pool.allocate((100, 200), numpy.float32)
+        assert a.flags.owndata
+        assert self.pool.stats()['allocations'] == 0
+
+    def testThreads(self):
+        errors = []
+        def work(value):
+            try:
+                for _ in range(100):
+                    a = self.pool.allocate((128, 128), numpy.float64)
+                    a[:] = value
+                    if not (a == value).all():
+                        errors.append(value)
+            except Exception as ex:
+                errors.append(ex)
+        threads = [ threading.Thread(target=work, args=(i,)) for i in range(4) ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert not errors, errors
+        assert self.pool.stats()['reused'] > 0
+
+    def testRequestDestinations(self):
+        data = numpy.random.random((100, 1000))
+        op = OpArrayPiper(graph=Graph())
+        op.Input.setValue(data)
+
+        # Request results are handed to the caller, so they are not pooled:
+        # they must own their memory (so it can be freed by resizing them).
+        default_buffer_pool.reset_stats()
+        for _ in range(3):
+            result = op.Output[:].wait()
+            assert (result == data).all()
+            assert result.flags.owndata
+            del result
+        assert default_buffer_pool.stats()['allocations'] == 0
+
+        # Scratch space can be pooled explicitly.
+        roi = op.Output.rtype(op.Output, (0, 0), (100, 1000))
+        for _ in range(3):
+            scratch = op.Output.stype.allocateDestination(roi, pooled=True)
+            assert scratch.shape == (100, 1000)
+            del scratch
+        assert default_buffer_pool.stats()['reused'] == 2
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
@@ -22,6 +22,8 @@
 
 import gc
 import time
+import functools
+import threading
 
 import numpy as np
 import vigra
@@ -32,15 +34,19 @@ import lazyflow
 from lazyflow.graph import Graph
 from lazyflow.roi import enlargeRoiForHalo, roiToSlice
 from lazyflow.rtype import SubRegion
-from lazyflow.request import Request
+from lazyflow.request import Request, RequestPool
 from lazyflow.utility import BigRequestStreamer
 from lazyflow.operators.cacheMemoryManager import CacheMemoryManager
 from lazyflow.utility import Memory
 from lazyflow.operators.cacheMemoryManager\
     import default_refresh_interval
+from lazyflow.operators.cacheMemoryManager\
+    import LRUEvictionPolicy, GreedyDualSizeEvictionPolicy, BlockEvictionIndex
 from lazyflow.operators.opCache import Cache
 from lazyflow.operators.opArrayCache import OpArrayCache
 from lazyflow.operators.opBlockedArrayCache import OpBlockedArrayCache
+from lazyflow.operators.opUnblockedArrayCache import OpUnblockedArrayCache
+from lazyflow.operators.opCompressedCache import OpCompressedCache
 from lazyflow.operators.opSplitRequestsBlockwise\
     import OpSplitRequestsBlockwise
 from lazyflow.operators.vigraOperators import OpGaussianSmoothing
@@ -261,6 +267,233 @@ class TestCacheMemoryManager(unittest.TestCase):
         # in the best case, we have 9
         np.testing.assert_equal(pipe.accessCount, 9)
 
+    def testHighWatermarkUnderLoad(self):
+        """
+        Inserting blocks faster than the manager thread wakes up must not
+        push the caches above the high watermark (up to one block per
+        inserting thread), and must not corrupt the data that is returned.
+        """
+        mgr = CacheMemoryManager()
+        # the timer can't help us here
+        mgr.setRefreshInterval(1000)
+        mgr.setWatermarks(1.0, .9)
+        mgr.enable()
+
+        num_workers = 4
+        Request.reset_thread_pool(num_workers=num_workers)
+
+        def unblockedCache(graph, block_shape):
+            return OpUnblockedArrayCache(graph=graph)
+
+        def compressedCache(graph, block_shape):
+            cache = OpCompressedCache(graph=graph)
+            cache.BlockShape.setValue(block_shape)
+            return cache
+
+        for makeCache in (unblockedCache, compressedCache):
+            self._checkHighWatermarkUnderLoad(makeCache, num_workers)
+
+    def _checkHighWatermarkUnderLoad(self, makeCache, num_workers):
+        num_blocks = 500
+        block_shape = (20, 50)
+        data = np.random.randint(1, 256, size=(num_blocks*block_shape[0], block_shape[1]))
+        data = vigra.taggedView(data.astype(np.uint8), axistags='yx')
+
+        g = Graph()
+        op = OpArrayPiperWithAccessCount(graph=g)
+        op.Input.setValue(data)
+        cache = makeCache(g, block_shape)
+        cache.Input.connect(op.Output)
+
+        def blockRoi(i):
+            return ((block_shape[0]*i, 0), (block_shape[0]*(i+1), block_shape[1]))
+
+        # memory of a single (maybe compressed) block
+        Memory.setAvailableRamCaches(-1)
+        cache.Output(*blockRoi(0)).wait()
+        block_size = cache.usedMemory()
+        limit = 20*block_size
+        Memory.setAvailableRamCaches(limit)
+
+        peak = [0]
+        wrong_blocks = []
+        lock = threading.Lock()
+
+        def insert(i):
+            result = cache.Output(*blockRoi(i)).wait()
+            with lock:
+                peak[0] = max(peak[0], cache.usedMemory())
+                if not (result == data[roiToSlice(*blockRoi(i))]).all():
+                    wrong_blocks.append(i)
+
+        pool = RequestPool()
+        for i in range(1, num_blocks):
+            pool.add(Request(functools.partial(insert, i)))
+        pool.wait()
+
+        name = type(cache).__name__
+        assert not wrong_blocks, "{} returned wrong data for blocks {}".format(name, wrong_blocks)
+        assert op.accessCount == num_blocks
+        assert peak[0] <= limit + num_workers*block_size, (name, peak[0], limit)
+        assert cache.usedMemory() <= limit, name
+
+
+class TestEvictionPolicies(unittest.TestCase):
+    def testLRU(self):
+        policy = LRUEvictionPolicy()
+        old = policy.priority(1.0, 100.0, 1)
+        new = policy.priority(2.0, 0.0, 1000)
+        assert old < new
+
+    def testGreedyDualSizeCost(self):
+        policy = GreedyDualSizeEvictionPolicy()
+        # an old but expensive block outlives a new but cheap one
+        expensive = policy.priority(1.0, 40.0, 1000)
+        cheap = policy.priority(2.0, 0.001, 1000)
+        assert cheap < expensive
+
+        # for the same cost, larger blocks are evicted first
+        large = policy.priority(2.0, 1.0, 2000)
+        small = policy.priority(2.0, 1.0, 1000)
+        assert large < small
+
+        # without costs, recency decides
+        assert policy.priority(1.0, 0.0, 0) < policy.priority(2.0, 0.0, 0)
+
+    def testGreedyDualSizeAging(self):
+        policy = GreedyDualSizeEvictionPolicy()
+        expensive = policy.priority(1.0, 40.0, 1000)
+        # evict a lot of blocks, until the inflation value exceeds the
+        # priority of the expensive block
+        for i in range(5):
+            t = 3.0 + i
+            policy.evicted(policy.priority(t, 20.0, 1000), now=t+0.5)
+        cheap = policy.priority(10.0, 0.001, 1000)
+        assert expensive < cheap
+
+        # blocks accessed before the evictions keep their old priority
+        assert policy.priority(2.5, 0.001, 1000) < expensive
+
+        policy.forget(5.0)
+        assert policy.priority(10.0, 0.001, 1000) == cheap
+
+    def testBlockCosts(self):
+        g = Graph()
+        op = OpSlowPiper(graph=g)
+        op.Input.setValue(np.zeros((100,), dtype=np.uint8))
+        cache = OpUnblockedArrayCache(graph=g)
+        cache.Input.connect(op.Output)
+
+        cache.Output((0,), (50,)).wait()
+        costs = cache.getBlockCosts()
+        assert len(costs) == 1
+        key, t, compute_time, size = costs[0]
+        assert key == ((0,), (50,))
+        assert compute_time >= OpSlowPiper.delay
+        assert size == 50
+
+        # cache hits update the access time, but not the compute time
+        time.sleep(.01)
+        cache.Output((10,), (20,)).wait()
+        _, t2, compute_time2, _ = cache.getBlockCosts()[0]
+        assert t2 > t
+        assert compute_time2 == compute_time
+
+
+class TestBlockEvictionIndex(unittest.TestCase):
+    def testOrder(self):
+        index = BlockEvictionIndex(LRUEvictionPolicy())
+        c1 = NonRegisteredCache("c1")
+        c2 = NonRegisteredCache("c2")
+        index.add(c1, 'a', 10)
+        index.add(c2, 'b', 10)
+        index.add(c1, 'c', 10)
+        index.touch(c1, 'a')
+        index.remove(c1, 'c')
+        assert len(index) == 2
+
+        assert index.peek() is not None
+        priority, cache, block_id = index.pop()
+        assert cache is c2 and block_id == 'b'
+        priority, cache, block_id = index.pop()
+        assert cache is c1 and block_id == 'a'
+        assert index.pop() is None
+        assert index.peek() is None
+        assert len(index) == 0
+
+    def testCosts(self):
+        index = BlockEvictionIndex(GreedyDualSizeEvictionPolicy())
+        c = NonRegisteredCache("c")
+        index.add(c, 'expensive', 10, 40.0)
+        index.add(c, 'cheap', 10, 0.001)
+        assert index.pop()[2] == 'cheap'
+
+        # switching the policy recomputes the priorities
+        index.add(c, 'cheap', 10, 0.001)
+        index.setPolicy(LRUEvictionPolicy())
+        assert index.pop()[2] == 'expensive'
+
+    def testRemoveCache(self):
+        index = BlockEvictionIndex(LRUEvictionPolicy())
+        c1 = NonRegisteredCache("c1")
+        c2 = NonRegisteredCache("c2")
+        for i in range(10):
+            index.add(c1, i, 1)
+            index.add(c2, i, 1)
+        index.removeCache(c1)
+        assert len(index) == 10
+
+        # blocks of garbage collected caches are dropped
+        del c2
+        gc.collect()
+        assert index.pop() is None
+        assert len(index) == 0
+
+    def testManyTouches(self):
+        index = BlockEvictionIndex(LRUEvictionPolicy())
+        c = NonRegisteredCache("c")
+        for i in range(100):
+            index.add(c, i, 1)
+        for _ in range(100):
+            for i in range(100):
+                index.touch(c, i)
+        # invalid entries don't accumulate
+        assert len(index._heap) < 2*len(index) + 1000
+        assert [index.pop()[2] for _ in range(100)] == range(100)
+
+    def testManagerUsesIndex(self):
+        mgr = CacheMemoryManager()
+        mgr.disable()
+        g = Graph()
+        op = OpArrayPiperWithAccessCount(graph=g)
+        op.Input.setValue(np.zeros((100,), dtype=np.uint8))
+        cache = OpUnblockedArrayCache(graph=g)
+        cache.Input.connect(op.Output)
+        for i in range(10):
+            cache.Output((10*i,), (10*(i+1),)).wait()
+        assert cache.usedMemory() == 100
+
+        # free some blocks, oldest first
+        Memory.setAvailableRamCaches(60)
+        mgr.setEvictionPolicy(LRUEvictionPolicy())
+        try:
+            mgr._cleanup()
+        finally:
+            mgr.setEvictionPolicy(GreedyDualSizeEvictionPolicy())
+        assert cache.usedMemory() <= 54
+        remaining = [k for k, t in cache.getBlockAccessTimes()]
+        assert ((0,), (10,)) not in remaining
+        assert ((10,), (20,)) not in remaining
+        assert len(remaining) == cache.usedMemory()/10
+
+
+class OpSlowPiper(OpArrayPiperWithAccessCount):
+    delay = .05
+
+    def execute(self, slot, subindex, roi, result):
+        time.sleep(self.delay)
+        super(OpSlowPiper, self).execute(slot, subindex, roi, result)
+
         
 class OpEnlarge(OpArrayPiperWithAccessCount):
     delay = .1
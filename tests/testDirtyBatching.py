@@ -0,0 +1,123 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import numpy
+
+from lazyflow.graph import Graph, Operator, InputSlot, OutputSlot
+from lazyflow.operators import OpArrayPiper
+
+class OpCountDirty(Operator):
+    """
+    Pipes its input and counts the propagateDirty() calls.
+    """
+    Input = InputSlot()
+    Output = OutputSlot()
+
+    def __init__(self, *args, **kwargs):
+        super(OpCountDirty, self).__init__(*args, **kwargs)
+        self.dirtyCount = 0
+
+    def setupOutputs(self):
+        self.Output.meta.assignFrom(self.Input.meta)
+
+    def execute(self, slot, subindex, roi, result):
+        self.Input(roi.start, roi.stop).writeInto(result).wait()
+
+    def propagateDirty(self, slot, subindex, roi):
+        self.dirtyCount += 1
+        self.Output.setDirty(roi)
+
+class TestDirtyBatching(object):
+    def setUp(self):
+        self.graph = Graph()
+        self.opSource = OpArrayPiper(graph=self.graph)
+        self.opSource.Input.setValue( numpy.zeros((100,100), dtype=numpy.uint8) )
+
+        self.opCount = OpCountDirty(graph=self.graph)
+        self.opCount.Input.connect(self.opSource.Output)
+
+        self.dirty_rois = []
+        def handleDirty(slot, roi):
+            self.dirty_rois.append( (list(roi.start), list(roi.stop)) )
+        self.opCount.Output.notifyDirty( handleDirty )
+
+    def testBatch(self):
+        with self.graph.batchDirtyNotifications():
+            for x in range(10):
+                self.opSource.Output.setDirty( (x, 0), (x+1, 10) )
+            assert self.dirty_rois == []
+            assert self.opCount.dirtyCount == 0
+        assert self.dirty_rois == [ ([0,0], [10,10]) ], self.dirty_rois
+        assert self.opCount.dirtyCount == 1
+
+    def testDisjointRegions(self):
+        with self.graph.batchDirtyNotifications():
+            self.opSource.Output.setDirty( (0,0), (10,10) )
+            self.opSource.Output.setDirty( (50,50), (60,60) )
+            self.opSource.Output.setDirty( (2,2), (5,5) )
+        assert self.dirty_rois == [ ([0,0], [10,10]), ([50,50], [60,60]) ], self.dirty_rois
+
+    def testNested(self):
+        with self.graph.batchDirtyNotifications():
+            with self.graph.batchDirtyNotifications():
+                self.opSource.Output.setDirty( (0,0), (10,10) )
+            assert self.dirty_rois == []
+            self.opSource.Output.setDirty( (0,10), (10,20) )
+        assert self.dirty_rois == [ ([0,0], [10,20]) ], self.dirty_rois
+
+    def testFlushOnException(self):
+        try:
+            with self.graph.batchDirtyNotifications():
+                self.opSource.Output.setDirty( (0,0), (10,10) )
+                raise RuntimeError("Intentional error")
+        except RuntimeError:
+            pass
+        assert self.dirty_rois == [ ([0,0], [10,10]) ]
+
+        # Not batching any more
+        self.opSource.Output.setDirty( (1,1), (2,2) )
+        assert self.dirty_rois[-1] == ([1,1], [2,2])
+
+    def testSetValue(self):
+        with self.graph.batchDirtyNotifications():
+            for i in range(5):
+                self.opSource.Input.setValue( numpy.ones((100,100), dtype=numpy.uint8)*i )
+        assert self.dirty_rois == [ ([0,0], [100,100]) ], self.dirty_rois
+        assert (self.opCount.Output[:].wait() == 4).all()
+
+    def testOtherGraph(self):
+        graph = Graph()
+        opSource = OpArrayPiper(graph=graph)
+        opSource.Input.setValue( numpy.zeros((10,10), dtype=numpy.uint8) )
+        dirty_rois = []
+        opSource.Output.notifyDirty( lambda slot, roi: dirty_rois.append(roi) )
+
+        with self.graph.batchDirtyNotifications():
+            opSource.Output.setDirty( (0,0), (1,1) )
+            assert len(dirty_rois) == 1
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
@@ -0,0 +1,154 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import time
+from functools import partial
+
+import numpy
+
+from lazyflow.graph import Graph, Operator, InputSlot, OutputSlot
+from lazyflow.executionStats import ExecutionStats
+from lazyflow.operators import OpArrayPiper
+from lazyflow.operators.opUnblockedArrayCache import OpUnblockedArrayCache
+from lazyflow.request import Request
+
+class OpSleep(Operator):
+    """
+    Copies its input, after sleeping for the given time.
+    """
+    Input = InputSlot()
+    Output = OutputSlot()
+
+    def __init__(self, delay, *args, **kwargs):
+        super(OpSleep, self).__init__(*args, **kwargs)
+        self.delay = delay
+
+    def setupOutputs(self):
+        self.Output.meta.assignFrom(self.Input.meta)
+
+    def execute(self, slot, subindex, roi, result):
+        time.sleep(self.delay)
+        self.Input(roi.start, roi.stop).writeInto(result).wait()
+
+    def propagateDirty(self, slot, subindex, roi):
+        self.Output.setDirty(roi)
+
+class TestExecutionStats(object):
+    def setUp(self):
+        graph = Graph()
+        self.data = numpy.zeros((100, 100), dtype=numpy.float32)
+        self.opSource = OpArrayPiper(graph=graph)
+        self.opSource.Input.setValue(self.data)
+
+        self.opUpstream = OpSleep(0.1, graph=graph)
+        self.opUpstream.Input.connect(self.opSource.Output)
+
+        self.opCache = OpUnblockedArrayCache(graph=graph)
+        self.opCache.Input.connect(self.opUpstream.Output)
+
+        self.opDownstream = OpSleep(0.05, graph=graph)
+        self.opDownstream.Input.connect(self.opCache.Output)
+
+    def _stats(self, stats, op):
+        matches = [ s for s in stats.slots() if s.operator is op ]
+        assert len(matches) == 1
+        return matches[0]
+
+    def testTimes(self):
+        with ExecutionStats() as stats:
+            self.opDownstream.Output[:10, :20].wait()
+
+        downstream = self._stats(stats, self.opDownstream)
+        assert downstream.executes == 1
+        assert downstream.voxels == 200
+        assert downstream.bytes == 800
+        upstream = self._stats(stats, self.opUpstream)
+        assert upstream.executes == 1
+
+        # Only compare the timings with each other (and with the sleeps,
+        # as lower bounds): a busy machine can stretch any of them.
+        assert 0 <= downstream.exclusive_time <= downstream.total_time
+        assert 0 <= upstream.exclusive_time <= upstream.total_time
+        assert downstream.exclusive_time >= 0.04
+        assert upstream.exclusive_time >= 0.09
+
+        # The downstream operator was blocked while the upstream one computed
+        assert downstream.blocked_time >= 0.9 * upstream.total_time
+        assert upstream.total_time > downstream.exclusive_time
+
+    def testCacheHits(self):
+        with ExecutionStats() as stats:
+            self.opDownstream.Output[:10, :20].wait()
+            self.opDownstream.Output[:10, :20].wait()
+            self.opDownstream.Output[:5, :5].wait()
+
+        cache = self._stats(stats, self.opCache)
+        assert cache.executes == 3
+        assert cache.cache_misses == 1
+        assert cache.cache_hits == 2
+        assert self._stats(stats, self.opUpstream).executes == 1
+
+        downstream = self._stats(stats, self.opDownstream)
+        assert downstream.cache_hits == downstream.cache_misses == 0
+
+    def testParallelRequests(self):
+        # Requests that run in other greenlets are attributed correctly
+        def getBlock(i):
+            return self.opDownstream.Output[10*i:10*(i+1), :].wait()
+
+        with ExecutionStats() as stats:
+            requests = [ Request(partial(getBlock, i)) for i in range(4) ]
+            for req in requests:
+                req.submit()
+            for req in requests:
+                req.wait()
+
+        assert self._stats(stats, self.opDownstream).executes == 4
+        cache = self._stats(stats, self.opCache)
+        assert cache.cache_misses == 4
+        assert cache.voxels == 4000
+
+    def testTable(self):
+        with ExecutionStats() as stats:
+            self.opDownstream.Output[:10, :20].wait()
+
+        lines = stats.table().split("\n")
+        assert len(lines) == 1 + len(stats.slots())
+        # Sorted by exclusive time
+        assert lines[1].startswith("OpSleep.Output")
+        assert lines[2].startswith("OpSleep.Output")
+
+        lines = stats.table(per_operator=True, limit=1).split("\n")
+        assert len(lines) == 2
+
+    def testInactive(self):
+        stats = ExecutionStats()
+        self.opDownstream.Output[:10, :20].wait()
+        assert stats.slots() == []
+        assert Request._wait_listener is None
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
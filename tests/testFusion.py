@@ -0,0 +1,205 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import numpy
+import vigra
+
+from lazyflow.graph import Graph
+from lazyflow import fusion
+from lazyflow.slot import Slot
+from lazyflow.operators import OpArrayPiper
+from lazyflow.operators.generic import OpPixelOperator, OpConvertDtype, OpDtypeView
+from lazyflow.operators.opReorderAxes import OpReorderAxes
+from lazyflow.utility.testing import OpArrayPiperWithAccessCount
+
+class TestFusion(object):
+    def setUp(self):
+        self.graph = Graph()
+        self.data = numpy.random.randint(0, 100, size=(10, 20, 30)).astype(numpy.uint8)
+
+        self.source = OpArrayPiperWithAccessCount(graph=self.graph)
+        self.source.Input.setValue(self.data)
+
+        # uint8 -> float32 -> (x*2+1) -> uint32 -> view as int32
+        self.opConvert = OpConvertDtype(graph=self.graph)
+        self.opConvert.Input.connect(self.source.Output)
+        self.opConvert.ConversionDtype.setValue(numpy.float32)
+
+        self.opPixel = OpPixelOperator(graph=self.graph)
+        self.opPixel.Input.connect(self.opConvert.Output)
+        self.opPixel.Function.setValue(fusion.pointwise(lambda x: x*2+1))
+
+        self.opConvert2 = OpConvertDtype(graph=self.graph)
+        self.opConvert2.Input.connect(self.opPixel.Output)
+        self.opConvert2.ConversionDtype.setValue(numpy.uint32)
+
+        self.opView = OpDtypeView(graph=self.graph)
+        self.opView.Input.connect(self.opConvert2.Output)
+        self.opView.OutputDtype.setValue(numpy.int32)
+
+        self.expected = (self.data.astype(numpy.float32)*2+1).astype(numpy.uint32).view(numpy.int32)
+
+    def testFusedChain(self):
+        stages = fusion.findFusableChain(self.opView.Output)
+        assert [stage.operator for stage in stages] == [self.opView, self.opConvert2, self.opPixel, self.opConvert]
+
+        req = self.opView.Output[2:5, 3:17, :]
+        assert isinstance(req.fn, Slot.FusedExecutionWrapper)
+        output = req.wait()
+        assert output.dtype == numpy.int32
+        assert (output == self.expected[2:5, 3:17, :]).all()
+
+        # The source was only asked once
+        assert self.source.accessCount == 1
+
+        # All execution counts were restored
+        for op in [self.opView, self.opConvert2, self.opPixel, self.opConvert]:
+            assert op._executionCount == 0
+
+    def testWriteInto(self):
+        output = numpy.zeros((10, 20, 30), dtype=numpy.int32)
+        self.opView.Output[:].writeInto(output).wait()
+        assert (output == self.expected).all()
+
+    def testChunks(self):
+        old_chunk_bytes = fusion.CHUNK_BYTES
+        fusion.CHUNK_BYTES = 1000
+        try:
+            output = self.opView.Output[:].wait()
+        finally:
+            fusion.CHUNK_BYTES = old_chunk_bytes
+        assert (output == self.expected).all()
+
+        # The source is still requested only once
+        assert self.source.accessCount == 1
+
+    def testChunkSizedIntermediates(self):
+        # The dtype conversions must not allocate full-size intermediate arrays
+        scratch_bytes = []
+        original_scratch = fusion._scratch
+        def scratch(buffers, k, shape, dtype):
+            scratch_bytes.append( numpy.prod(shape) * numpy.dtype(dtype).itemsize )
+            return original_scratch(buffers, k, shape, dtype)
+
+        old_chunk_bytes = fusion.CHUNK_BYTES
+        fusion.CHUNK_BYTES = 5000
+        fusion._scratch = scratch
+        try:
+            output = self.opView.Output[:].wait()
+        finally:
+            fusion.CHUNK_BYTES = old_chunk_bytes
+            fusion._scratch = original_scratch
+        assert (output == self.expected).all()
+
+        # 20*30 float32 pixels per row: two rows per chunk
+        assert len(scratch_bytes) == 5, scratch_bytes
+        assert max(scratch_bytes) <= 5000, scratch_bytes
+
+        assert self.source.accessCount == 1
+        roi = self.source.requests[0]
+        assert list(roi.start) == [0,0,0] and list(roi.stop) == [10,20,30]
+
+    def testInPlace(self):
+        # uint8 -> (x+1) -> view as int8: computed directly in the result array
+        opPixel = OpPixelOperator(graph=self.graph)
+        opPixel.Input.connect(self.source.Output)
+        opPixel.Function.setValue(fusion.pointwise(lambda x: x+1))
+
+        opView = OpDtypeView(graph=self.graph)
+        opView.Input.connect(opPixel.Output)
+        opView.OutputDtype.setValue(numpy.int8)
+
+        original_scratch = fusion._scratch
+        def scratch(*args):
+            assert False, "No scratch buffer needed"
+        fusion._scratch = scratch
+        try:
+            output = opView.Output[:, 5:, :].wait()
+        finally:
+            fusion._scratch = original_scratch
+        assert (output == (self.data[:, 5:, :] + 1).view(numpy.int8)).all()
+
+    def testUnmarkedFunction(self):
+        # Functions that aren't known to be pointwise are executed as usual
+        self.opPixel.Function.setValue(lambda x: x - x.mean())
+        assert self.opPixel.pointwiseStage(self.opPixel.Output) is None
+        stages = fusion.findFusableChain(self.opView.Output)
+        assert [stage.operator for stage in stages] == [self.opView, self.opConvert2]
+
+        expected = self.data.astype(numpy.float32)
+        expected = (expected - expected[:, 3:5, :].mean()).astype(numpy.uint32).view(numpy.int32)
+        assert (self.opView.Output[:, 3:5, :].wait() == expected[:, 3:5, :]).all()
+
+        # ufuncs are pointwise
+        self.opPixel.Function.setValue(numpy.sqrt)
+        assert len(fusion.findFusableChain(self.opView.Output)) == 4
+
+    def testDisabled(self):
+        fusion.enabled = False
+        try:
+            req = self.opView.Output[:]
+            assert not isinstance(req.fn, Slot.FusedExecutionWrapper)
+            output = req.wait()
+        finally:
+            fusion.enabled = True
+        assert (output == self.expected).all()
+
+    def testSharedIntermediate(self):
+        # Another consumer of opPixel.Output ends the chain there.
+        opOther = OpArrayPiper(graph=self.graph)
+        opOther.Input.connect(self.opPixel.Output)
+
+        stages = fusion.findFusableChain(self.opView.Output)
+        assert [stage.operator for stage in stages] == [self.opView, self.opConvert2]
+        assert (self.opView.Output[:].wait() == self.expected).all()
+
+        stages = fusion.findFusableChain(self.opPixel.Output)
+        assert [stage.operator for stage in stages] == [self.opPixel, self.opConvert]
+
+        opOther.Input.disconnect()
+        assert len(fusion.findFusableChain(self.opView.Output)) == 4
+
+    def testDirtyPropagation(self):
+        dirty_rois = []
+        self.opView.Output.notifyDirty( lambda slot, roi: dirty_rois.append( (list(roi.start), list(roi.stop)) ) )
+        self.source.Output.setDirty( (1,0,0), (2,20,30) )
+        assert dirty_rois == [ ([1,0,0], [2,20,30]) ], dirty_rois
+
+    def testReorderAxes(self):
+        self.source.Input.setValue( vigra.taggedView(self.data, 'zyx') )
+        opReorder = OpReorderAxes(graph=self.graph)
+        opReorder.Input.connect(self.opView.Output)
+        opReorder.AxisOrder.setValue('txyzc')
+
+        stages = fusion.findFusableChain(opReorder.Output)
+        assert len(stages) == 5
+        
+        output = opReorder.Output[:, 1:10, 2:4, 3:5, :].wait()
+        expected = self.expected.transpose()[numpy.newaxis, ..., numpy.newaxis]
+        assert (output == expected[:, 1:10, 2:4, 3:5, :]).all()
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
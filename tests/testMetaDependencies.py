@@ -0,0 +1,168 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import numpy
+import vigra
+
+from lazyflow.graph import Graph, Operator, InputSlot, OutputSlot
+from lazyflow.metaDict import MetaDict
+from lazyflow.operators import OpArrayPiper, OpPixelOperator
+from lazyflow.operators.opUnblockedArrayCache import OpUnblockedArrayCache
+from lazyflow.operators.opBlockedArrayCache import OpBlockedArrayCache
+
+class OpSource(Operator):
+    """
+    Provides the Input data with the given extra meta data.
+    """
+    Input = InputSlot()
+    ExtraMeta = InputSlot(value={})
+    Output = OutputSlot()
+
+    def setupOutputs(self):
+        self.Output.meta.assignFrom(self.Input.meta)
+        self.Output.meta.update(self.ExtraMeta.value)
+
+    def execute(self, slot, subindex, roi, result):
+        self.Input(roi.start, roi.stop).writeInto(result).wait()
+
+    def propagateDirty(self, slot, subindex, roi):
+        self.Output.setDirty(roi)
+
+class OpShapeOnly(OpArrayPiper):
+    """
+    Adds a constant to the meta data.  Only depends on the shape.
+    """
+    metaDependencies = { 'Input' : ('shape',) }
+
+    def setupOutputs(self):
+        self.Output.meta.assignFrom(self.Input.meta)
+        self.Output.meta.num_pixels = numpy.prod(self.Input.meta.shape)
+
+class OpPiperSubclass(OpArrayPiper):
+    def setupOutputs(self):
+        super(OpPiperSubclass, self).setupOutputs()
+        self.Output.meta.drange_copy = self.Input.meta.drange
+
+class TestMetaDependencies(object):
+    def setUp(self):
+        graph = Graph()
+        self.data = numpy.zeros((10, 20), dtype=numpy.uint8)
+
+        self.opSource = OpSource(graph=graph)
+        self.opSource.Input.setValue(self.data)
+        self.opSource.ExtraMeta.setValue({'drange' : (0, 10), 'display_mode' : 'grayscale'})
+
+        self.opPiper = OpArrayPiper(graph=graph)
+        self.opPiper.Input.connect(self.opSource.Output)
+
+        self.opShapeOnly = OpShapeOnly(graph=graph)
+        self.opShapeOnly.Input.connect(self.opPiper.Output)
+
+        self.opCache = OpUnblockedArrayCache(graph=graph)
+        self.opCache.Input.connect(self.opShapeOnly.Output)
+
+        self.opPixel = OpPixelOperator(graph=graph)
+        self.opPixel.Input.connect(self.opCache.Output)
+        self.opPixel.Function.setValue(lambda a: 2*a)
+
+        self.operators = [self.opPiper, self.opShapeOnly, self.opCache, self.opPixel]
+
+    def _setupCounts(self):
+        return [op._setup_count for op in self.operators]
+
+    def testIrrelevantChange(self):
+        counts = self._setupCounts()
+        self.opSource.ExtraMeta.setValue({'drange' : (0, 10), 'display_mode' : 'rgba'})
+
+        # Nobody depends on display_mode
+        assert self._setupCounts() == counts
+        for op in self.operators:
+            assert op.Output.meta.display_mode == 'rgba'
+        assert self.opShapeOnly.Output.meta.num_pixels == 200
+        assert self.opCache.CleanBlocks.meta.display_mode is None
+
+    def testRelevantChange(self):
+        counts = self._setupCounts()
+        self.opSource.ExtraMeta.setValue({'drange' : (0, 20), 'display_mode' : 'grayscale'})
+
+        # Only OpPixelOperator depends on the drange
+        new_counts = self._setupCounts()
+        assert new_counts[:3] == counts[:3]
+        assert new_counts[3] == counts[3] + 1
+        assert self.opCache.Output.meta.drange == (0, 20)
+        assert self.opPixel.Output.meta.drange == (0, 40)
+
+    def testShapeChange(self):
+        counts = self._setupCounts()
+        self.opSource.Input.setValue(numpy.zeros((10, 30), dtype=numpy.uint8))
+
+        # OpArrayPiper doesn't depend on anything, OpPixelOperator doesn't depend on the shape
+        new_counts = self._setupCounts()
+        assert new_counts[0] == counts[0]
+        assert new_counts[1:3] == [c + 1 for c in counts[1:3]]
+        assert new_counts[3] == counts[3]
+        assert self.opPixel.Output.meta.shape == (10, 30)
+        assert self.opShapeOnly.Output.meta.num_pixels == 300
+
+    def testNewKey(self):
+        counts = self._setupCounts()
+        self.opSource.ExtraMeta.setValue({'drange' : (0, 10), 'display_mode' : 'grayscale', 'channel_names' : ['a']})
+
+        # We can't tell which outputs would copy a new key, so everybody is set up again.
+        assert self._setupCounts() == [c + 1 for c in counts]
+        assert self.opPixel.Output.meta.channel_names == ['a']
+
+    def testNotInherited(self):
+        opSubclass = OpPiperSubclass(graph=self.opPiper.graph)
+        opSubclass.Input.connect(self.opSource.Output)
+        count = opSubclass._setup_count
+        self.opSource.ExtraMeta.setValue({'drange' : (0, 20), 'display_mode' : 'grayscale'})
+        assert opSubclass._setup_count == count + 1
+        assert opSubclass.Output.meta.drange_copy == (0, 20)
+
+    def testInternalPipeline(self):
+        # OpBlockedArrayCache copies its Output meta data from an internal cache
+        self.opSource.Input.setValue(vigra.taggedView(self.data, 'yx'))
+        opBlockedCache = OpBlockedArrayCache(graph=self.opPiper.graph)
+        opBlockedCache.Input.connect(self.opSource.Output)
+        assert opBlockedCache.Output.meta.ram_usage_per_requested_pixel == 1
+
+        self.opSource.Input.setValue(vigra.taggedView(self.data + 0.5, 'yx'))
+        assert opBlockedCache.Output.meta.dtype == numpy.float64
+        assert opBlockedCache.Output.meta.ram_usage_per_requested_pixel == 8
+
+def testChangedKeys():
+    a = MetaDict(shape=(1,2), dtype=numpy.uint8, drange=(0,1))
+    b = a.copy()
+    b._dirty = not a._dirty
+    assert a.changedKeys(b) == set()
+    b.drange = (0,2)
+    b.display_mode = 'rgba'
+    del b['dtype']
+    assert a.changedKeys(b) == set(['drange', 'display_mode', 'dtype'])
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
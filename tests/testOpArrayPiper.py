@@ -25,6 +25,9 @@ __date__ = "$Feb 06, 2015 12:28:04 EST$"
 
 
 
+import gc
+import weakref
+
 import nose
 
 import numpy
@@ -32,8 +35,11 @@ import numpy
 import vigra
 
 from lazyflow.graph import Graph
+from lazyflow.slot import Slot
+from lazyflow.request import Request
 from lazyflow.operators.opArrayPiper import OpArrayPiper
 from lazyflow.roi import roiFromShape, roiToSlice
+from lazyflow.utility.testing import OpArrayPiperWithAccessCount
 
 
 
@@ -524,3 +530,97 @@ class TestOpArrayPiper7(object):
         self.operator_identity_1.Input.disconnect()
         self.operator_identity_1.Output.disconnect()
         self.operator_identity_1.cleanUp()
+
+
+class OpCountingPiper(OpArrayPiper):
+    """
+    A subclass that does its own work in execute() must not be skipped.
+    """
+    def __init__(self, *args, **kwargs):
+        super(OpCountingPiper, self).__init__(*args, **kwargs)
+        self.executionCount = 0
+
+    def execute(self, slot, subindex, roi, result):
+        self.executionCount += 1
+        return super(OpCountingPiper, self).execute(slot, subindex, roi, result)
+
+
+class TestOpArrayPiperForwarding(object):
+    def setUp(self):
+        self.graph = Graph()
+        self.data = numpy.random.random((4, 5, 6, 7, 3)).astype(numpy.float32)
+
+        self.source = OpArrayPiperWithAccessCount(graph=self.graph)
+        self.source.Input.setValue(self.data)
+
+    def _chain(self, piper_class, length):
+        upstream = self.source
+        ops = []
+        for _ in range(length):
+            op = piper_class(graph=self.graph)
+            op.Input.connect(upstream.Output)
+            ops.append(op)
+            upstream = op
+        return ops
+
+    def testForwarding(self):
+        ops = self._chain(OpArrayPiper, 5)
+        req = ops[-1].Output[1:3]
+
+        # The request goes straight to the source.
+        assert isinstance(req.fn, Slot.ForwardingWrapper)
+
+        output = req.wait()
+        assert (output == self.data[1:3]).all()
+        assert self.source.accessCount == 1
+        assert self.source.requests[0].slot is ops[0].Input
+
+    def testSkippedOperatorsAreExecuting(self):
+        # Operators that were skipped can't be set up while the request runs.
+        ops = self._chain(OpArrayPiper, 3)
+        counts = []
+        def execute(slot, subindex, roi, result):
+            counts.append( [op._executionCount for op in ops] )
+            result[:] = self.data[roi.toSlice()]
+        self.source.execute = execute
+
+        output = ops[-1].Output[1:3].wait()
+        assert (output == self.data[1:3]).all()
+        assert counts == [[1, 1, 1]], counts
+        assert [op._executionCount for op in ops] == [0, 0, 0]
+
+        outputs = ops[-1].Output.get_many( [((1,0,0,0,0), (3,5,6,7,3))] ).wait()
+        assert (outputs[0] == self.data[1:3]).all()
+        assert counts[-1] == [1, 1, 1], counts
+        assert [op._executionCount for op in ops] == [0, 0, 0]
+
+    def testForwardedRoiDoesNotKeepOperator(self):
+        ops = self._chain(OpArrayPiper, 3)
+        output = ops[-1].Output[1:3].wait()
+        assert (output == self.data[1:3]).all()
+
+        # The source keeps the roi, which must not keep the skipped pipers alive.
+        assert len(self.source.requests) == 1
+        ops[-1].Input.disconnect()
+        r = weakref.ref(ops.pop())
+        gc.collect()
+        assert r() is None, "The skipped operator was not cleaned up"
+
+    def testNoForwardingToValue(self):
+        # Users of an output slot expect a real Request, not a ValueRequest
+        op = OpArrayPiper(graph=self.graph)
+        op.Input.setValue(self.data)
+        assert isinstance(op.Output[1:3], Request)
+
+    def testSubclassesExecute(self):
+        ops = self._chain(OpCountingPiper, 3)
+        output = ops[-1].Output[1:3].wait()
+        assert (output == self.data[1:3]).all()
+        assert [op.executionCount for op in ops] == [1, 1, 1]
+
+    def testDirtyPropagation(self):
+        ops = self._chain(OpArrayPiper, 3)
+        dirty_rois = []
+        ops[-1].Output.notifyDirty( lambda slot, roi: dirty_rois.append( (list(roi.start), list(roi.stop)) ) )
+        self.source.Output.setDirty( (1,0,0,0,0), (2,5,6,7,3) )
+        assert dirty_rois == [ ([1,0,0,0,0], [2,5,6,7,3]) ], dirty_rois
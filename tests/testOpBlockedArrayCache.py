@@ -451,6 +451,27 @@ class TestOpBlockedArrayCache(unittest.TestCase):
         expectedAccessCount += 1
         assert opProvider.accessCount == expectedAccessCount, "Access count={}, expected={}".format(opProvider.accessCount, expectedAccessCount)
 
+    def testGetMany(self):
+        opCache = self.opCache
+        opProvider = self.opProvider        
+
+        # These rois all lie within the same two outer blocks
+        slicings = [ make_key[0:1, 0:10, 10:20, 0:10, 0:1],
+                     make_key[0:1, 5:15, 12:18, 2:5, 0:1],
+                     make_key[0:1, 1:2, 1:2, 1:2, 0:1],
+                     make_key[0:1, 20:25, 0:20, 0:10, 0:1] ]
+        rois = [ sliceToRoi(slicing, self.dataShape) for slicing in slicings ]
+        results = opCache.Output.get_many( rois ).wait()
+        for slicing, result in zip(slicings, results):
+            assert (result == self.data[slicing]).all()
+        assert opProvider.accessCount == 2, "Access count={}, expected={}".format(opProvider.accessCount, 2)
+
+        # Everything is cached now
+        results = opCache.Output.get_many( rois ).wait()
+        for slicing, result in zip(slicings, results):
+            assert (result == self.data[slicing]).all()
+        assert opProvider.accessCount == 2, "Access count={}, expected={}".format(opProvider.accessCount, 2)
+
 class TestOpBlockedArrayCache_masked(object):
 
     def setUp(self):
@@ -22,6 +22,7 @@
 
 import unittest
 
+import lazyflow.operators
 from lazyflow.graph import Graph, Operator
 
 from lazyflow.operators.opCache import Cache
@@ -60,6 +61,11 @@ class GeneralTestOpCache(object):
         assert r.name is not None
 
 
+# The operator modules are imported lazily, so make sure that all
+# operators are defined before we look for the implementations.
+for opName in lazyflow.operators.__all__:
+    getattr(lazyflow.operators, opName)
+
 # automagically test all implementations of Cache *and* Operator
 opClasses = set(iterSubclasses(Operator))
 knownAbstractBases = [Cache,
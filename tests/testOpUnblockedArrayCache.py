@@ -109,11 +109,48 @@ class TestOpUnblockedArrayCacheCache(object):
         opCache.Output[10:20, 20:40, 50:100].wait()
         opCache.Output[11:21, 22:43, 53:90].wait()
 
+        # The second request only fetched (and stored) the two parts
+        # that weren't in the first block.
         l = opCache.getBlockAccessTimes()
-        assert len(l) == 2
+        assert len(l) == 3
         for k, t in l:
             assert t > 0.0
 
+    def testOverlappingBlocks(self):
+        graph = Graph()
+        opDataProvider = OpArrayPiperWithAccessCount( graph=graph )
+        opCache = OpUnblockedArrayCache( graph=graph )
+
+        data = np.random.random( (100,100) ).astype(np.float32)
+        opDataProvider.Input.setValue( vigra.taggedView( data, 'yx' ) )
+        opCache.Input.connect( opDataProvider.Output )
+
+        opCache.Output( (0,0), (50,50) ).wait()
+        opCache.Output( (0,50), (50,100) ).wait()
+        assert opDataProvider.accessCount == 2
+
+        # Straddles both blocks, assembled from memory
+        roi = ((10, 30), (40, 70))
+        cache_data = opCache.Output( *roi ).wait()
+        assert (cache_data == data[roiToSlice(*roi)]).all()
+        assert opDataProvider.accessCount == 2
+
+        # Partly covered (like a viewer that was panned),
+        # only the rest is requested upstream.
+        opDataProvider.clear()
+        roi = ((30, 30), (80, 80))
+        cache_data = opCache.Output( *roi ).wait()
+        assert (cache_data == data[roiToSlice(*roi)]).all()
+        assert opDataProvider.accessCount == 1
+        upstream_roi = opDataProvider.requests[0]
+        assert list(upstream_roi.start) == [50, 30]
+        assert list(upstream_roi.stop) == [80, 80]
+
+        # ...and cached, too
+        cache_data = opCache.Output( *roi ).wait()
+        assert (cache_data == data[roiToSlice(*roi)]).all()
+        assert opDataProvider.accessCount == 1
+
     def testCompressed(self):
         graph = Graph()
         opDataProvider = OpArrayPiperWithAccessCount( graph=graph )
@@ -163,6 +200,35 @@ class TestOpUnblockedArrayCacheCache(object):
         assert (cache_data == data[roiToSlice(*inner_roi)]).all()
         assert opDataProvider.accessCount == 0
 
+    def testGetMany(self):
+        graph = Graph()
+        opDataProvider = OpArrayPiperWithAccessCount( graph=graph )
+        opCache = OpUnblockedArrayCache( graph=graph )
+        opCache.CompressionEnabled.setValue(True)
+        
+        data = np.random.random( (100,100,100) ).astype(np.float32)
+        opDataProvider.Input.setValue( vigra.taggedView( data, 'zyx' ) )
+        opCache.Input.connect( opDataProvider.Output )
+
+        opCache.Output( (30, 30, 30), (50, 50, 50) ).wait()
+        assert opDataProvider.accessCount == 1
+
+        # Two rois within the stored block, one outside
+        rois = [ ((30, 30, 30), (40, 40, 40)),
+                 ((35, 40, 45), (50, 50, 50)),
+                 ((60, 60, 60), (70, 70, 70)) ]
+        results = opCache.Output.get_many( rois ).wait()
+        assert len(results) == 3
+        for roi, result in zip(rois, results):
+            assert (result == data[roiToSlice(*roi)]).all()
+        assert opDataProvider.accessCount == 2
+
+        # The new block is cached, too
+        results = opCache.Output.get_many( rois ).wait()
+        for roi, result in zip(rois, results):
+            assert (result == data[roiToSlice(*roi)]).all()
+        assert opDataProvider.accessCount == 2
+
 if __name__ == "__main__":
     # Set up logging for debug
     import sys
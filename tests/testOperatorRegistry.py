@@ -0,0 +1,89 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import os
+import sys
+import subprocess
+
+import lazyflow
+import lazyflow.operators
+from lazyflow.graph import Operator
+
+class TestOperatorRegistry(object):
+
+    def testAllNamesResolve(self):
+        for name in lazyflow.operators.__all__:
+            op_class = getattr(lazyflow.operators, name)
+            assert issubclass(op_class, Operator), name
+            # The factory-made OpXToMulti classes share a __name__
+            assert op_class.__name__ == name or name.endswith('ToMulti'), \
+                "{} resolves to {}".format( name, op_class.__name__ )
+
+    def testSameObjectAsSubmodule(self):
+        from lazyflow.operators import OpArrayPiper
+        from lazyflow.operators.opArrayPiper import OpArrayPiper as OpArrayPiper2
+        assert OpArrayPiper is OpArrayPiper2
+        assert lazyflow.operators.generic.OpPixelOperator is lazyflow.operators.OpPixelOperator
+
+    def testSubmoduleAttribute(self):
+        import lazyflow.operators.opCache
+        assert lazyflow.operators.opCache is sys.modules['lazyflow.operators.opCache']
+
+    def testUnknownName(self):
+        try:
+            lazyflow.operators.OpDoesNotExist
+        except AttributeError:
+            pass
+        else:
+            assert False, "Expected an AttributeError"
+
+    def testStarImport(self):
+        namespace = {}
+        exec "from lazyflow.operators import *" in namespace
+        assert namespace['OpArrayPiper'] is lazyflow.operators.OpArrayPiper
+        assert namespace['OpVigraWatershed'] is lazyflow.operators.OpVigraWatershed
+
+class TestLazyPackage(object):
+
+    def testImportIsCheap(self):
+        # (In a fresh interpreter, since this one has imported everything already)
+        code = "import sys, lazyflow; print sorted( m for m in ['vigra', 'h5py', 'psutil', 'lazyflow.graph'] if m in sys.modules )"
+        package_parent = os.path.dirname( os.path.abspath(lazyflow.__path__[0]) )
+        output = subprocess.check_output( [sys.executable, '-c', code], cwd=package_parent )
+        assert output.strip() == "[]", output
+
+    def testSubmoduleAttribute(self):
+        assert lazyflow.roi is sys.modules['lazyflow.roi']
+        assert lazyflow.graph.Operator is lazyflow.operators.Operator
+        try:
+            lazyflow.doesNotExist
+        except AttributeError:
+            pass
+        else:
+            assert False, "Expected an AttributeError"
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
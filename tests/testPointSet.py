@@ -0,0 +1,180 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import numpy
+import vigra
+
+from lazyflow.graph import Graph, Operator, InputSlot, OutputSlot
+from lazyflow.operators import OpArrayPiper
+from lazyflow.operators.opUnblockedArrayCache import OpUnblockedArrayCache
+from lazyflow.operators.opBlockedArrayCache import OpBlockedArrayCache
+from lazyflow.roi import enlargeRoiForHalo, roiToSlice
+from lazyflow.rtype import PointSet
+from lazyflow.utility.testing import OpArrayPiperWithAccessCount
+
+class OpHalo(Operator):
+    """
+    A (fake) filter that reads a halo of HALO pixels around the requested roi.
+    """
+    HALO = 60
+
+    Input = InputSlot()
+    Output = OutputSlot()
+
+    def setupOutputs(self):
+        self.Output.meta.assignFrom(self.Input.meta)
+
+    def _inputRoi(self, roi):
+        return enlargeRoiForHalo(roi.start, roi.stop, self.Input.meta.shape, self.HALO, window=1)
+
+    def requiredInputRois(self, slot, roi):
+        start, stop = self._inputRoi(roi)
+        return [ (self.Input, start, stop) ]
+
+    def execute(self, slot, subindex, roi, result):
+        start, stop = self._inputRoi(roi)
+        data = self.Input(start, stop).wait()
+        result[:] = data[ roiToSlice(roi.start - start, roi.stop - start) ]
+
+    def propagateDirty(self, slot, subindex, roi):
+        self.Output.setDirty(slice(None))
+
+class TestPointSet(object):
+    def setUp(self):
+        self.graph = Graph()
+        self.data = numpy.random.random((200, 200, 3)).astype(numpy.float32)
+        self.points = numpy.array( [ (1, 2),
+                                     (3, 5),
+                                     (150, 160),
+                                     (199, 199),
+                                     (2, 190) ] )
+
+    def _expected(self):
+        return self.data[ tuple(self.points.transpose()) ]
+
+    def testTiles(self):
+        points = PointSet(None, self.points)
+        tiles = points.tiles( self.data.shape, tile_size=32 )
+        assert len(tiles) == 4
+        assert sorted( len(indexes) for _,_,indexes,_ in tiles ) == [1,1,1,2]
+        for start, stop, indexes, local_points in tiles:
+            assert start[2] == 0 and stop[2] == 3
+            assert ((self.points[indexes] - start[:2]) == local_points).all()
+            assert (local_points < (stop - start)[:2]).all()
+
+    def testTilesDense(self):
+        # Points that fill most of their bounding box are served with a single tile
+        points = PointSet(None, [ (x, y) for x in range(10) for y in range(10) if (x+y) % 3 ])
+        tiles = points.tiles( self.data.shape, tile_size=4 )
+        assert len(tiles) == 1
+        start, stop, indexes, local_points = tiles[0]
+        assert list(start) == [0,0,0] and list(stop) == [10,10,3]
+        assert len(indexes) == len(points)
+
+    def testTilesCost(self):
+        # With a large halo around each tile, the bounding box is cheaper
+        halo = 100
+        def cost(start, stop):
+            return numpy.prod( numpy.subtract(stop, start)[:2] + 2*halo )
+        points = PointSet(None, self.points)
+        tiles = points.tiles( self.data.shape, tile_size=32, cost=cost )
+        assert len(tiles) == 1
+        start, stop, indexes, local_points = tiles[0]
+        assert list(start) == [1,2,0] and list(stop) == [200,200,3]
+
+    def testGather(self):
+        points = PointSet(None, self.points)
+        assert (points.gather(self.data) == self._expected()).all()
+        assert (points.gather(self.data[1:, 2:], (1,2)) == self._expected()).all()
+
+    def testValue(self):
+        op = OpArrayPiper(graph=self.graph)
+        op.Input.setValue(self.data)
+        result = op.Input.get( PointSet(op.Input, self.points) ).wait()
+        assert result.shape == (5, 3)
+        assert (result == self._expected()).all()
+
+    def testTileFallback(self):
+        # Operators without execute_points() only compute the tiles around the points
+        opSource = OpArrayPiperWithAccessCount(graph=self.graph)
+        opSource.Input.setValue(self.data)
+        op = OpArrayPiper(graph=self.graph)
+        op.Input.connect(opSource.Output)
+
+        result = op.Output.get( PointSet(op.Output, self.points) ).wait()
+        assert result.shape == (5, 3)
+        assert (result == self._expected()).all()
+        assert opSource.accessCount == 4
+
+    def testTileFallbackHalo(self):
+        # The tiles are compared with the bounding box including the halo that is read around them
+        opSource = OpArrayPiperWithAccessCount(graph=self.graph)
+        opSource.Input.setValue(self.data)
+        op = OpHalo(graph=self.graph)
+        op.Input.connect(opSource.Output)
+
+        result = op.Output.get( PointSet(op.Output, self.points) ).wait()
+        assert (result == self._expected()).all()
+        assert opSource.accessCount == 1
+
+    def testCache(self):
+        opSource = OpArrayPiperWithAccessCount(graph=self.graph)
+        opSource.Input.setValue(self.data)
+        opCache = OpUnblockedArrayCache(graph=self.graph)
+        opCache.Input.connect(opSource.Output)
+
+        # Uncached points are fetched in tiles, which are stored
+        result = opCache.Output.get( PointSet(opCache.Output, self.points) ).wait()
+        assert (result == self._expected()).all()
+        assert len(opCache._block_data) == 4
+        assert opSource.accessCount == 4
+
+        opSource.accessCount = 0
+        result = opCache.Output.get( PointSet(opCache.Output, self.points) ).wait()
+        assert (result == self._expected()).all()
+        assert opSource.accessCount == 0
+
+        # Cached points are served from the stored blocks
+        opCache.Output[:100, :100, :].wait()
+        opSource.accessCount = 0
+        result = opCache.Output.get( PointSet(opCache.Output, self.points[:2] + 10) ).wait()
+        assert (result == self.data[ tuple((self.points[:2] + 10).transpose()) ]).all()
+        assert opSource.accessCount == 0
+
+    def testBlockedCache(self):
+        # The blocks that contain the points are fetched and stored
+        opSource = OpArrayPiperWithAccessCount(graph=self.graph)
+        opSource.Input.setValue( vigra.taggedView(self.data, 'xyc') )
+        opCache = OpBlockedArrayCache(graph=self.graph)
+        opCache.Input.connect(opSource.Output)
+        opCache.outerBlockShape.setValue( (50, 50, 3) )
+
+        for _ in range(2):
+            result = opCache.Output.get( PointSet(opCache.Output, self.points) ).wait()
+            assert result.shape == (5, 3)
+            assert (result == self._expected()).all()
+            # (1,2) and (3,5) are in the same block, and so are (150,160) and (199,199)
+            assert opSource.accessCount == 3, opSource.accessCount
+        assert opCache.usedMemory() == 3 * 50*50*3 * 4
+
+        # Regular requests are served from the same blocks
+        assert (opCache.Output[:50, :50, :].wait() == self.data[:50, :50, :]).all()
+        assert opSource.accessCount == 3
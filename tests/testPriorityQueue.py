@@ -108,3 +108,13 @@ class TestPriorityQueue(unittest.TestCase):
         y = [pq.pop()[2] for i in range(len(pq))]
 
         assert_array_equal(x, y)
+
+    def testPeek(self):
+        pq = PriorityQueue()
+        self.assertRaises(IndexError, pq.peek)
+        for i in [3, 1, 2]:
+            pq.push(i)
+        assert pq.peek() == 1
+        assert len(pq) == 3
+        assert pq.pop() == 1
+        assert pq.peek() == 2
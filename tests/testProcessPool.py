@@ -0,0 +1,144 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import os
+import glob
+import signal
+from functools import partial
+import numpy
+
+from lazyflow.request import Request, RequestPool
+from lazyflow.request.processPool import ProcessPool, SHARED_MEMORY_THRESHOLD, _shared_memory_dir
+
+# The functions below are executed in the worker processes,
+# so they must be defined at module level (picklable).
+
+def _get_pid(*args):
+    return os.getpid()
+
+def _double(a):
+    return 2*a
+
+def _sum_rows(a, offset=0):
+    # Input arrays are copy-on-write views, so this must not affect the caller's array.
+    a[:] += 1
+    return a.sum(axis=1) - a.shape[1] + offset
+
+def _fail():
+    raise ValueError("Intentional failure")
+
+def _die(*args):
+    # Like an OOM kill
+    os.kill(os.getpid(), signal.SIGKILL)
+
+def _leftover_files():
+    return set( glob.glob( os.path.join(_shared_memory_dir(), 'lazyflow-shared-*') ) )
+
+class TestProcessPool(object):
+
+    def setUp(self):
+        self.files_before = _leftover_files()
+        self.pool = ProcessPool(2)
+
+    def tearDown(self):
+        self.pool.stop()
+        assert _leftover_files() == self.files_before, "Shared memory files were not cleaned up."
+
+    def test_runs_in_other_process(self):
+        assert self.pool.apply(_get_pid) != os.getpid()
+
+    def test_big_arrays(self):
+        a = numpy.random.random( (100, 1000) )
+        assert a.nbytes > SHARED_MEMORY_THRESHOLD
+        b = self.pool.apply(_double, a)
+        assert isinstance(b, numpy.ndarray) and not isinstance(b, numpy.memmap)
+        assert (b == 2*a).all()
+
+        orig = a.copy()
+        sums = self.pool.apply(_sum_rows, a, offset=10)
+        assert (a == orig).all()
+        assert numpy.allclose( sums, a.sum(axis=1) + 10 )
+
+    def test_small_arrays(self):
+        a = numpy.arange(10)
+        assert (self.pool.apply(_double, a) == 2*a).all()
+
+    def test_out(self):
+        a = numpy.random.random( (100, 1000) )
+        out = numpy.zeros_like(a)
+        result = self.pool.apply(_double, a, out=out)
+        assert result is out
+        assert (out == 2*a).all()
+
+    def test_exception(self):
+        try:
+            self.pool.apply(_fail)
+        except ValueError:
+            pass
+        else:
+            assert False, "Expected the exception to be propagated."
+
+    def test_worker_dies(self):
+        a = numpy.random.random( (100, 1000) )
+        try:
+            self.pool.apply(_die, a, out=numpy.zeros_like(a))
+        except RuntimeError:
+            pass
+        else:
+            assert False, "Expected the lost job to fail."
+
+        # The worker was replaced
+        assert (self.pool.apply(_double, a) == 2*a).all()
+
+    def test_within_requests(self):
+        """
+        Requests that wait for the process pool must not block the worker threads.
+        """
+        a = numpy.random.random( (100, 1000) )
+        results = {}
+        def compute(i):
+            results[i] = self.pool.apply(_double, i*a)
+        
+        pool = RequestPool()
+        for i in range(10):
+            pool.add( Request( partial(compute, i) ) )
+        pool.wait()
+        for i in range(10):
+            assert (results[i] == 2*i*a).all()
+
+    def test_request(self):
+        req = self.pool.request(_double, numpy.ones((10,)))
+        assert (req.wait() == 2).all()
+
+    def test_no_workers(self):
+        pool = ProcessPool(0)
+        assert pool.apply(_get_pid) == os.getpid()
+        out = numpy.zeros((3,))
+        assert pool.apply(_double, numpy.ones((3,)), out=out) is out
+        assert (out == 2).all()
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
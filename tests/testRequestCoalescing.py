@@ -0,0 +1,231 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import time
+import threading
+
+import nose
+
+import numpy
+
+from lazyflow.graph import Graph
+from lazyflow.operator import Operator
+from lazyflow.slot import InputSlot, OutputSlot
+from lazyflow.request import Request
+
+class OpBlockingCounter(Operator):
+    """
+    Copies its input, but each execute() blocks until self.proceed is set,
+    so that tests can issue several requests while a computation is in flight.
+    """
+    Input = InputSlot()
+    Output = OutputSlot(coalesce_requests=True)
+
+    def __init__(self, *args, **kwargs):
+        super(OpBlockingCounter, self).__init__(*args, **kwargs)
+        self.executionCount = 0
+        self.cancelledCount = 0
+        self.started = threading.Event()
+        self.finished = threading.Event()
+        self.proceed = threading.Event()
+        self.fail = False
+        self._lock = threading.Lock()
+
+    def setupOutputs(self):
+        self.Output.meta.assignFrom(self.Input.meta)
+
+    def execute(self, slot, subindex, roi, result):
+        with self._lock:
+            self.executionCount += 1
+        self.started.set()
+        self.proceed.wait()
+        try:
+            if Request.current_request_is_cancelled():
+                with self._lock:
+                    self.cancelledCount += 1
+                return
+            if self.fail:
+                raise TestException()
+            self.Input(roi.start, roi.stop).writeInto(result).wait()
+        finally:
+            self.finished.set()
+
+    def propagateDirty(self, slot, subindex, roi):
+        self.Output.setDirty(roi)
+
+class TestException(Exception):
+    pass
+
+class TestRequestCoalescing(object):
+
+    def setUp(self):
+        self.num_workers = Request.global_thread_pool.num_workers
+        if self.num_workers == 0:
+            raise nose.SkipTest
+        if self.num_workers < 2:
+            # The operator blocks its worker thread, so we need another one.
+            Request.reset_thread_pool(2)
+        self.data = numpy.random.randint(0, 255, size=(10, 20)).astype(numpy.uint8)
+        self.op = OpBlockingCounter(graph=Graph())
+        self.op.Input.setValue(self.data)
+
+    def tearDown(self):
+        # Make sure no worker stays blocked.
+        self.op.proceed.set()
+        if self.num_workers != Request.global_thread_pool.num_workers:
+            Request.reset_thread_pool(self.num_workers)
+
+    def _submit(self, start, stop, n):
+        reqs = [ self.op.Output(start, stop) for _ in range(n) ]
+        for req in reqs:
+            req.submit()
+        assert self.op.started.wait(5.0)
+        return reqs
+
+    def _waitUntilAllWaiting(self, n):
+        # Wait until n requests are waiting for the shared computation
+        computation, = self.op.Output._inFlight.values()
+        for _ in range(500):
+            if len(computation.request.pending_requests) == n:
+                return
+            time.sleep(0.01)
+        assert False, "Requests didn't start waiting for the shared computation"
+
+    def testBasic(self):
+        reqs = self._submit((0, 0), (5, 10), 3)
+        self.op.proceed.set()
+        results = [ req.wait() for req in reqs ]
+        assert self.op.executionCount == 1
+
+        for result in results:
+            assert (result == self.data[0:5, 0:10]).all()
+
+        # The callers must not share their result arrays
+        results[0][:] = 0
+        assert (results[1] == self.data[0:5, 0:10]).all()
+        assert (results[2] == self.data[0:5, 0:10]).all()
+
+    def testWriteInto(self):
+        reqs = [ self.op.Output((0, 0), (5, 10)) for _ in range(2) ]
+        destinations = [ numpy.zeros((5, 10), dtype=numpy.uint8) for _ in reqs ]
+        for req, destination in zip(reqs, destinations):
+            req.writeInto(destination)
+            req.submit()
+        self.op.proceed.set()
+        for req, destination in zip(reqs, destinations):
+            req.wait()
+            assert (destination == self.data[0:5, 0:10]).all()
+        assert self.op.executionCount == 1
+
+    def testDifferentRois(self):
+        reqs = self._submit((0, 0), (5, 10), 1)
+        reqs += self._submit((5, 0), (10, 10), 1)
+        self.op.proceed.set()
+        assert (reqs[0].wait() == self.data[0:5, 0:10]).all()
+        assert (reqs[1].wait() == self.data[5:10, 0:10]).all()
+        assert self.op.executionCount == 2
+
+    def testNoCaching(self):
+        """
+        Requests for a roi that is no longer in flight trigger a new computation.
+        """
+        self.op.proceed.set()
+        self.op.Output(( 0, 0 ), (5, 10)).wait()
+        self.op.Output(( 0, 0 ), (5, 10)).wait()
+        assert self.op.executionCount == 2
+        assert not self.op.Output._inFlight
+
+    def testDirty(self):
+        """
+        After the output was set dirty, new requests must not attach to the old computation.
+        """
+        old_req, = self._submit((0, 0), (5, 10), 1)
+        self.op.Output.setDirty()
+        new_req = self.op.Output((0, 0), (5, 10))
+        self.op.proceed.set()
+        assert (old_req.wait() == self.data[0:5, 0:10]).all()
+        assert (new_req.wait() == self.data[0:5, 0:10]).all()
+        assert self.op.executionCount == 2
+
+    def testCancelOne(self):
+        """
+        If one of the callers is cancelled, the computation continues for the others.
+        """
+        reqs = self._submit((0, 0), (5, 10), 2)
+        self._waitUntilAllWaiting(2)
+        reqs[0].cancel()
+        assert reqs[0].cancelled
+        self.op.proceed.set()
+        assert (reqs[1].wait() == self.data[0:5, 0:10]).all()
+        assert self.op.executionCount == 1
+        assert self.op.cancelledCount == 0
+
+    def testCancelBeforeOthersWait(self):
+        """
+        If the shared computation was cancelled before another caller started waiting for it,
+        that caller starts it again.
+        """
+        req, = self._submit((0, 0), (5, 10), 1)
+        other_req = self.op.Output((0, 0), (5, 10))
+        req.cancel()
+        self.op.proceed.set()
+        assert self.op.finished.wait(5.0)
+        assert self.op.cancelledCount == 1
+
+        assert (other_req.wait() == self.data[0:5, 0:10]).all()
+        assert self.op.executionCount == 2
+
+    def testCancelAll(self):
+        """
+        If all callers are cancelled, the shared computation is cancelled, too.
+        """
+        reqs = self._submit((0, 0), (5, 10), 2)
+        self._waitUntilAllWaiting(2)
+        for req in reqs:
+            req.cancel()
+        self.op.proceed.set()
+        assert self.op.finished.wait(5.0)
+        assert self.op.cancelledCount == 1
+
+        # The roi can be requested again.
+        assert (self.op.Output((0, 0), (5, 10)).wait() == self.data[0:5, 0:10]).all()
+        assert self.op.executionCount == 2
+
+    def testFailure(self):
+        self.op.fail = True
+        reqs = self._submit((0, 0), (5, 10), 2)
+        self.op.proceed.set()
+        for req in reqs:
+            try:
+                req.wait()
+            except TestException:
+                pass
+            else:
+                assert False, "Expected the exception to be propagated to all callers."
+        assert self.op.executionCount == 1
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
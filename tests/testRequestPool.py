@@ -142,6 +142,83 @@ def test_pool_results_discarded_REQUEST_CONTEXT():
     mainreq.submit()
     mainreq.wait()
 
+def test_as_completed():
+    """
+    as_completed() yields every request once, as soon as it is complete.
+    """
+    pool = RequestPool()
+    for i in range(100):
+        pool.add( Request( partial(lambda i: i*i, i) ) )
+    results = [ req.result for req in pool.as_completed() ]
+    assert sorted(results) == [ i*i for i in range(100) ]
+
+def test_as_completed_max_in_flight():
+    """
+    With max_in_flight, no more than that many requests are submitted 
+    but not yet consumed at any time.
+    """
+    import threading
+    lock = threading.Lock()
+    running = [0]
+    max_running = [0]
+    def workload():
+        with lock:
+            running[0] += 1
+            max_running[0] = max(max_running[0], running[0])
+        time.sleep(0.001)
+        return 1
+
+    pool = RequestPool()
+    for _ in range(50):
+        pool.add( Request( workload ) )
+
+    total = 0
+    for req in pool.as_completed( max_in_flight=3 ):
+        with lock:
+            running[0] -= 1
+        total += req.result
+    assert total == 50
+    assert max_running[0] <= 3, "Too many requests in flight: {}".format( max_running[0] )
+
+@fail_after_timeout(5)
+def test_as_completed_failed_request():
+    class ExpectedException(Exception): pass
+    def workload(index):
+        if index == 5:
+            raise ExpectedException("Intentionally failed request.")
+        return index
+
+    pool = RequestPool()
+    for i in range(10):
+        pool.add( Request(partial(workload, i)) )
+
+    try:
+        for req in pool.as_completed( max_in_flight=2 ):
+            pass
+    except ExpectedException:
+        pass
+    else:
+        assert False, "Expected the pool to fail.  Why didn't it?"
+
+def test_as_completed_stop_early():
+    """
+    If the caller stops iterating, the remaining requests are never started.
+    """
+    import itertools
+    counter = itertools.count()
+    def workload():
+        counter.next()
+    
+    pool = RequestPool()
+    for _ in range(10):
+        pool.add( Request(workload) )
+
+    completed = pool.as_completed( max_in_flight=1 )
+    completed.next()
+    completed.close()
+    time.sleep(0.1)
+    assert counter.next() == 1
+
 if __name__ == "__main__":
     # Logging is OFF by default when running from command-line nose, i.e.:
     # nosetests thisFile.py)
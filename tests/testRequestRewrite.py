@@ -798,6 +798,195 @@ class TestRequestPool(object):
         for req in reqs:
             assert req.finished
         
+class TestRequestScheduling(object):
+    """
+    Scheduling classes and deadlines: inheritance, ordering and priority boosting.
+    """
+
+    def setUp(self):
+        self.num_workers = Request.global_thread_pool.num_workers
+        if self.num_workers == 0:
+            raise nose.SkipTest
+
+    def tearDown(self):
+        if Request.global_thread_pool.num_workers != self.num_workers:
+            Request.reset_thread_pool(self.num_workers)
+
+    def test_inheritance(self):
+        assert Request( lambda: None ).scheduling_class == Request.INTERACTIVE
+
+        def create_child():
+            return Request( lambda: None )
+
+        req = Request( create_child, scheduling_class=Request.BATCH, deadline=123.0 )
+        req.submit()
+        child = req.wait()
+        assert child.scheduling_class == Request.BATCH
+        assert child.deadline == 123.0
+
+        # Executed directly in this (foreign) thread: children are inherited via the thread defaults.
+        child = Request( create_child, scheduling_class=Request.PREFETCH ).wait()
+        assert child.scheduling_class == Request.PREFETCH
+        assert Request( lambda: None ).scheduling_class == Request.INTERACTIVE
+
+        with Request.scheduling_context( Request.BATCH, deadline=5.0 ):
+            req = Request( lambda: None )
+            assert req.scheduling_class == Request.BATCH
+            assert req.deadline == 5.0
+            assert Request( lambda: None, scheduling_class=Request.INTERACTIVE ).scheduling_class == Request.INTERACTIVE
+        assert Request( lambda: None ).scheduling_class == Request.INTERACTIVE
+
+    def test_ordering(self):
+        """
+        With a single (busy) worker, queued requests run in order of
+        scheduling class, then deadline, then creation.
+        """
+        Request.reset_thread_pool(1)
+
+        gate = threading.Event()
+        blocker = Request( gate.wait )
+        blocker.submit()
+
+        order = []
+        reqs = []
+        for name, scheduling_class, deadline in [ ('batch', Request.BATCH, None),
+                                                  ('prefetch', Request.PREFETCH, None),
+                                                  ('interactive-late', Request.INTERACTIVE, 20.0),
+                                                  ('interactive', Request.INTERACTIVE, None),
+                                                  ('interactive-early', Request.INTERACTIVE, 10.0) ]:
+            reqs.append( Request( partial(order.append, name), scheduling_class=scheduling_class, deadline=deadline ) )
+        for req in reqs:
+            req.submit()
+
+        gate.set()
+        for req in reqs:
+            req.wait()
+        assert order == ['interactive-early', 'interactive-late', 'interactive', 'prefetch', 'batch'], order
+
+    def test_boost(self):
+        """
+        If an interactive request waits for a batch request that it didn't create itself,
+        the batch request (and the requests it spawns from then on) become interactive.
+        """
+        lock = RequestLock()
+        lock.acquire()
+        child_classes = []
+        def batch_work():
+            with lock:
+                pass
+            child_classes.append( Request( lambda: None ).scheduling_class )
+
+        batch_req = Request( batch_work, scheduling_class=Request.BATCH )
+        batch_req.submit()
+        while not batch_req.started:
+            time.sleep(0.01)
+
+        interactive_req = Request( batch_req.wait )
+        interactive_req.submit()
+        for _ in range(500):
+            if batch_req.scheduling_class == Request.INTERACTIVE:
+                break
+            time.sleep(0.01)
+        assert batch_req.scheduling_class == Request.INTERACTIVE
+
+        lock.release()
+        interactive_req.wait()
+        assert child_classes == [Request.INTERACTIVE]
+
+    def test_no_boost_for_own_children(self):
+        """
+        A request may deliberately spawn children of a less urgent class.
+        Waiting for them does not boost them.
+        """
+        def export():
+            def work():
+                return Request( lambda: None ).scheduling_class
+            return Request( work, scheduling_class=Request.BATCH ).wait()
+
+        req = Request( export )
+        req.submit()
+        assert req.wait() == Request.BATCH
+
+class TestIoThreadPool(object):
+    """
+    Requests that are marked as io_bound are executed in the separate I/O thread pool (if enabled).
+    """
+
+    def setUp(self):
+        Request.reset_io_thread_pool(2)
+
+    def tearDown(self):
+        Request.reset_io_thread_pool(0)
+
+    def _in_io_pool(self):
+        return threading.current_thread() in Request.global_io_thread_pool.workers
+
+    def test_foreign_thread(self):
+        if Request.global_thread_pool.num_workers == 0:
+            raise nose.SkipTest
+
+        req = Request( self._in_io_pool, io_bound=True )
+        assert req.thread_pool is Request.global_io_thread_pool
+        req.submit()
+        assert req.wait()
+
+        req = Request( self._in_io_pool )
+        assert req.thread_pool is Request.global_thread_pool
+        req.submit()
+        assert not req.wait()
+
+    def test_wait_within_request(self):
+        """
+        A compute request that waits for an I/O request must not execute it directly in its own worker.
+        """
+        if Request.global_thread_pool.num_workers == 0:
+            raise nose.SkipTest
+
+        def read_data(x):
+            assert self._in_io_pool()
+            time.sleep(0.01)
+            return x
+
+        def compute():
+            assert not self._in_io_pool()
+            reqs = [ Request( partial(read_data, i), io_bound=True ) for i in range(10) ]
+            results = [ req.wait() for req in reqs ]
+
+            # The I/O request may also wait for compute requests
+            inner = Request( lambda: not self._in_io_pool() )
+            assert Request( inner.wait, io_bound=True ).wait()
+            return sum(results)
+
+        reqs = [ Request( compute ) for _ in range(5) ]
+        for req in reqs:
+            req.submit()
+        for req in reqs:
+            assert req.wait() == sum(range(10))
+
+    def test_exception(self):
+        def read_data():
+            raise IOError("Couldn't read the data")
+
+        def compute():
+            return Request( read_data, io_bound=True ).wait()
+
+        req = Request( compute )
+        try:
+            req.wait()
+        except IOError:
+            pass
+        else:
+            assert False, "Expected the exception to be propagated."
+
+    def test_disabled(self):
+        """
+        Without an I/O pool, I/O-bound requests run in the normal thread pool.
+        """
+        Request.reset_io_thread_pool(0)
+        req = Request( lambda: 42, io_bound=True )
+        assert req.thread_pool is Request.global_thread_pool
+        assert req.wait() == 42
+
 if __name__ == "__main__":
 
     # Logging is OFF by default when running from command-line nose, i.e.:
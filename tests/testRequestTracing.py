@@ -0,0 +1,139 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+
+import numpy
+
+from lazyflow.graph import Graph
+from lazyflow.operators import OpArrayPiper
+from lazyflow.request import Request, RequestLock, RequestTracer
+
+class TestRequestTracing(object):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _spans(self, tracer):
+        """
+        Return the args of all complete request spans, by name.
+        """
+        spans = {}
+        for event in tracer.events():
+            if event['ph'] == 'b':
+                spans[event['name']] = event['args']
+        return spans
+
+    def test_nested_requests(self):
+        lock = RequestLock()
+        lock.acquire()
+
+        def child():
+            time.sleep(0.01)
+            return 1
+
+        def waiter():
+            # Suspended until the test releases the lock.
+            with lock:
+                pass
+            return Request(child).wait()
+
+        with RequestTracer() as tracer:
+            req = Request(waiter)
+            req.submit()
+            time.sleep(0.1)
+            lock.release()
+            req.wait()
+        assert Request._tracer is None
+
+        spans = self._spans(tracer)
+        assert set(spans.keys()) == set(['waiter', 'child']), "Unexpected spans: {}".format( spans.keys() )
+
+        if Request.global_thread_pool.num_workers > 0:
+            assert spans['waiter']['suspended_ms'] >= 50, spans['waiter']
+        assert spans['child']['run_ms'] >= 10
+        assert not spans['waiter']['failed']
+
+        # Every running interval is recorded on the worker that ran it.
+        segments = [ e for e in tracer.events() if e['ph'] == 'X' ]
+        assert set( e['name'] for e in segments ) == set(['waiter', 'child'])
+        thread_names = [ e['args']['name'] for e in tracer.events() if e['ph'] == 'M' ]
+        assert len(thread_names) >= 1
+
+    def test_slot_requests(self):
+        data = numpy.indices( (10,20) ).sum(0)
+        op = OpArrayPiper( graph=Graph() )
+        op.Input.setValue( data )
+
+        with RequestTracer() as tracer:
+            op.Output( (1,2), (3,4) ).wait()
+
+        spans = self._spans(tracer)
+        assert spans.keys() == ['OpArrayPiper.Output'], spans.keys()
+        args = spans['OpArrayPiper.Output']
+        assert args['operator'] == 'OpArrayPiper'
+        assert args['slot'] == 'Output'
+        assert '[1, 2]' in args['roi'] and '[3, 4]' in args['roi'], args['roi']
+
+    def test_write_into(self):
+        data = numpy.indices( (10,20) ).sum(0)
+        op = OpArrayPiper( graph=Graph() )
+        op.Input.setValue( data )
+
+        result = numpy.zeros( (2,2), dtype=data.dtype )
+        with RequestTracer() as tracer:
+            op.Output( (1,2), (3,4) ).writeInto( result ).wait()
+        assert (result == data[1:3, 2:4]).all()
+
+        spans = self._spans(tracer)
+        assert spans.keys() == ['OpArrayPiper.Output'], spans.keys()
+        assert spans['OpArrayPiper.Output']['slot'] == 'Output'
+
+    def test_save(self):
+        with RequestTracer() as tracer:
+            Request( lambda: 42 ).wait()
+        path = os.path.join( self.tmpdir, 'trace.json' )
+        tracer.save(path)
+        with open(path) as f:
+            trace = json.load(f)
+        phases = set( e['ph'] for e in trace['traceEvents'] )
+        assert set(['b', 'e', 'X']).issubset( phases )
+
+    def test_disabled(self):
+        tracer = RequestTracer()
+        Request( lambda: 42 ).wait()
+        assert tracer.events() == []
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
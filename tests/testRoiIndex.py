@@ -0,0 +1,144 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+
+import unittest
+
+import numpy as np
+
+from lazyflow.roi import getIntersection
+from lazyflow.utility.roiIndex import RoiIndex
+
+
+def randomRoi(shape, max_size):
+    start = [np.random.randint(0, s) for s in shape]
+    stop = [min(s, a + np.random.randint(1, max_size + 1))
+            for a, s in zip(start, shape)]
+    return (tuple(start), tuple(stop))
+
+
+def contains(outer, inner):
+    return (np.asarray(outer[0]) <= inner[0]).all() and \
+           (np.asarray(outer[1]) >= inner[1]).all()
+
+
+class TestRoiIndex(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+
+    def testEmpty(self):
+        index = RoiIndex()
+        assert len(index) == 0
+        assert index.containing(((0, 0), (1, 1))) is None
+        assert index.intersecting(((0, 0), (1, 1))) == []
+
+    def testGrid(self):
+        index = RoiIndex()
+        for x in range(0, 100, 10):
+            for y in range(0, 100, 10):
+                index.add(((x, y), (x + 10, y + 10)))
+        assert len(index) == 100
+        assert index.containing(((12, 31), (20, 39))) == ((10, 30), (20, 40))
+        assert index.containing(((12, 31), (21, 39))) is None
+        # touching blocks don't intersect
+        assert sorted(index.intersecting(((10, 10), (20, 21)))) == \
+            [((10, 10), (20, 20)), ((10, 20), (20, 30))]
+        assert len(index.intersecting(((0, 0), (100, 100)))) == 100
+
+        index.remove(((10, 30), (20, 40)))
+        assert ((10, 30), (20, 40)) not in index
+        assert index.containing(((12, 31), (20, 39))) is None
+        # removing twice is ok
+        index.remove(((10, 30), (20, 40)))
+        assert len(index) == 99
+
+    def testRandomAgainstBruteForce(self):
+        shape = (200, 150, 10)
+        index = RoiIndex()
+        rois = set()
+        for i in range(500):
+            # mostly small rois, some of them spanning many cells
+            roi = randomRoi(shape, 20 if i % 10 else 150)
+            index.add(roi)
+            rois.add(roi)
+        for roi in list(rois)[::3]:
+            index.remove(roi)
+            rois.remove(roi)
+        assert len(index) == len(rois)
+        assert set(index) == rois
+
+        for i in range(200):
+            query = randomRoi(shape, 30 if i % 10 else 200)
+            expected = set(r for r in rois
+                           if getIntersection(r, query, assertIntersect=False))
+            assert set(index.intersecting(query)) == expected
+
+            found = index.containing(query)
+            candidates = [r for r in rois if contains(r, query)]
+            if candidates:
+                assert found in candidates
+            else:
+                assert found is None
+
+    def testLargeRois(self):
+        index = RoiIndex()
+        index.add(((0, 0), (1, 1)))
+        big = ((0, 0), (1000, 1000))
+        index.add(big)
+        assert index.containing(((500, 500), (600, 600))) == big
+        assert index.intersecting(((999, 999), (1001, 1001))) == [big]
+        index.remove(big)
+        assert index.containing(((500, 500), (600, 600))) is None
+
+    def testSmallFirstRoi(self):
+        # The grid adapts to the usual block size, even if the first roi is tiny.
+        index = RoiIndex()
+        index.add(((0, 0), (1, 1)))
+        for x in range(0, 1000, 100):
+            for y in range(0, 1000, 100):
+                index.add(((x, y), (x + 100, y + 100)))
+        assert len(index) == 101
+        assert len(index._large_rois) == 0
+        assert index.containing(((512, 331), (520, 339))) == ((500, 300), (600, 400))
+        assert sorted(index.intersecting(((0, 0), (1, 101)))) == \
+            [((0, 0), (1, 1)), ((0, 0), (100, 100)), ((0, 100), (100, 200))]
+
+        index.remove(((0, 0), (1, 1)))
+        assert index.containing(((0, 0), (1, 1))) == ((0, 0), (100, 100))
+
+        # Rois that aren't large enough to be kept out of the grid,
+        # but would still overlap many cells each
+        index = RoiIndex()
+        index.add(((0, 0), (1, 1)))
+        for x in range(0, 80, 8):
+            for y in range(0, 80, 8):
+                index.add(((x, y), (x + 8, y + 8)))
+        assert index._cell_shape == (8, 8)
+        assert index.containing(((17, 9), (20, 12))) == ((16, 8), (24, 16))
+
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
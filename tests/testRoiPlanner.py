@@ -0,0 +1,178 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import numpy
+
+from lazyflow.graph import Graph, Operator, InputSlot, OutputSlot
+from lazyflow.operators import OpArrayPiper
+from lazyflow.operators.generic import OpConvertDtype
+from lazyflow.operators.opUnblockedArrayCache import OpUnblockedArrayCache
+from lazyflow.roi import enlargeRoiForHalo, roiToSlice
+from lazyflow.roiPlanner import RoiPlan
+from lazyflow.utility.testing import OpArrayPiperWithAccessCount
+
+class OpHalo(Operator):
+    """
+    A (fake) filter that reads a halo of HALO pixels around the requested roi.
+    """
+    HALO = 2
+
+    Input = InputSlot()
+    Output = OutputSlot()
+
+    def setupOutputs(self):
+        self.Output.meta.assignFrom(self.Input.meta)
+
+    def _inputRoi(self, roi):
+        return enlargeRoiForHalo(roi.start, roi.stop, self.Input.meta.shape, self.HALO, window=1)
+
+    def requiredInputRois(self, slot, roi):
+        start, stop = self._inputRoi(roi)
+        return [ (self.Input, start, stop) ]
+
+    def execute(self, slot, subindex, roi, result):
+        start, stop = self._inputRoi(roi)
+        data = self.Input(start, stop).wait()
+        result[:] = data[ roiToSlice(roi.start - start, roi.stop - start) ]
+
+    def propagateDirty(self, slot, subindex, roi):
+        self.Output.setDirty(slice(None))
+
+class OpJoin(Operator):
+    """
+    Adds its inputs.
+    """
+    InputA = InputSlot()
+    InputB = InputSlot()
+    Output = OutputSlot()
+
+    def setupOutputs(self):
+        self.Output.meta.assignFrom(self.InputA.meta)
+        self.Output.meta.dtype = numpy.uint16
+
+    def requiredInputRois(self, slot, roi):
+        return [ (self.InputA, roi.start, roi.stop),
+                 (self.InputB, roi.start, roi.stop) ]
+
+    def execute(self, slot, subindex, roi, result):
+        a = self.InputA(roi.start, roi.stop).wait()
+        b = self.InputB(roi.start, roi.stop).wait()
+        result[:] = a.astype(numpy.uint16) + b
+
+    def propagateDirty(self, slot, subindex, roi):
+        self.Output.setDirty(roi)
+
+class TestRoiPlan(object):
+    def setUp(self):
+        self.graph = Graph()
+        self.data = numpy.random.randint(0, 255, size=(100, 100)).astype(numpy.uint8)
+        self.opSource = OpArrayPiperWithAccessCount(graph=self.graph)
+        self.opSource.Input.setValue(self.data)
+
+    def _stack(self, upstream, count):
+        for _ in range(count):
+            op = OpHalo(graph=self.graph)
+            op.Input.connect(upstream)
+            upstream = op.Output
+        return upstream
+
+    def testStackedHalos(self):
+        output = self._stack(self.opSource.Output, 3)
+        plan = RoiPlan(output, (10, 10), (20, 20))
+
+        assert plan.sources == [self.opSource.Output]
+        assert [tuple(x) for x in plan.region(self.opSource.Output)] == [(4, 4), (26, 26)]
+        assert plan.requestedVoxels(self.opSource.Output) == 22*22
+        assert plan.amplification == 22*22/100.0
+        assert plan.consolidated_amplification == plan.amplification
+
+    def testClippedHalo(self):
+        output = self._stack(self.opSource.Output, 3)
+        plan = RoiPlan(output, (0, 90), (10, 100))
+        assert [tuple(x) for x in plan.region(self.opSource.Output)] == [(0, 84), (16, 100)]
+
+    def testPointwiseAndForwarding(self):
+        opPiper = OpArrayPiper(graph=self.graph)
+        opPiper.Input.connect(self.opSource.Output)
+        opConvert = OpConvertDtype(graph=self.graph)
+        opConvert.Input.connect(opPiper.Output)
+        opConvert.ConversionDtype.setValue(numpy.float32)
+
+        output = self._stack(opConvert.Output, 1)
+        plan = RoiPlan(output, (10, 10), (20, 20))
+        assert plan.sources == [self.opSource.Output]
+        for slot in (opPiper.Output, opConvert.Output):
+            assert [tuple(x) for x in plan.region(slot)] == [(8, 8), (22, 22)]
+
+    def testRepeatedReads(self):
+        # Two branches read the same source with different halos
+        opNarrow = OpHalo(graph=self.graph)
+        opNarrow.Input.connect(self.opSource.Output)
+        opWide = OpHalo(graph=self.graph)
+        opWide.HALO = 4
+        opWide.Input.connect(self.opSource.Output)
+
+        opJoin = OpJoin(graph=self.graph)
+        opJoin.InputA.connect(opNarrow.Output)
+        opJoin.InputB.connect(opWide.Output)
+
+        plan = RoiPlan(opJoin.Output, (10, 10), (20, 20))
+        assert len(plan.rois[self.opSource.Output]) == 2
+        assert plan.amplification == (14*14 + 18*18)/100.0
+        assert plan.consolidated_amplification == 18*18/100.0
+
+    def testOpaqueOperator(self):
+        # Operators that don't declare their input rois are treated as sources
+        opOpaque = OpArrayPiperWithAccessCount(graph=self.graph)
+        opOpaque.Input.connect(self.opSource.Output)
+        output = self._stack(opOpaque.Output, 1)
+        plan = RoiPlan(output, (10, 10), (20, 20))
+        assert plan.sources == [opOpaque.Output]
+
+    def testPrefetch(self):
+        opCache = OpUnblockedArrayCache(graph=self.graph)
+        opCache.Input.connect(self.opSource.Output)
+        opNarrow = OpHalo(graph=self.graph)
+        opNarrow.Input.connect(opCache.Output)
+        opWide = OpHalo(graph=self.graph)
+        opWide.HALO = 4
+        opWide.Input.connect(opCache.Output)
+        opJoin = OpJoin(graph=self.graph)
+        opJoin.InputA.connect(opNarrow.Output)
+        opJoin.InputB.connect(opWide.Output)
+
+        plan = RoiPlan(opJoin.Output, (10, 10), (20, 20))
+        assert plan.caches() == [opCache.Output]
+        for req in plan.prefetch():
+            req.wait()
+        assert self.opSource.accessCount == 1
+
+        result = opJoin.Output(start=(10, 10), stop=(20, 20)).wait()
+        assert (result == 2*self.data[10:20, 10:20].astype(numpy.uint16)).all()
+        assert self.opSource.accessCount == 1
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
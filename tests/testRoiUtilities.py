@@ -1,5 +1,5 @@
 import numpy
-from lazyflow.roi import determineBlockShape, getIntersection, enlargeRoiForHalo, TinyVector, nonzero_bounding_box, containing_rois
+from lazyflow.roi import determineBlockShape, getIntersection, enlargeRoiForHalo, TinyVector, nonzero_bounding_box, containing_rois, RegionSet, roiToSlice, subtract_rois
 
 class Test_determineBlockShape(object):
     
@@ -126,6 +126,93 @@ class test_containing_rois(object):
         result = containing_rois( rois, ( [100,100,100], [200,200,200] ) )
         assert result.shape == (0,)
 
+class test_subtract_rois(object):
+
+    def testBasic(self):
+        roi = ( (0,0), (10,10) )
+        assert subtract_rois( roi, [] ) == [ ((0,0), (10,10)) ]
+        assert subtract_rois( roi, [ ((20,20), (30,30)) ] ) == [ ((0,0), (10,10)) ]
+        assert subtract_rois( roi, [ ((-5,-5), (15,15)) ] ) == []
+        assert subtract_rois( roi, [ ((0,5), (10,20)) ] ) == [ ((0,0), (10,5)) ]
+
+    def testRandom(self):
+        numpy.random.seed(0)
+        shape = (30, 20, 10)
+        for _ in range(50):
+            roi = ( (3,2,1), (25,18,9) )
+            others = []
+            for _ in range(numpy.random.randint(1, 5)):
+                start = numpy.random.randint(0, 25, size=3) % shape
+                stop = start + numpy.random.randint(1, 15, size=3)
+                others.append( (tuple(start), tuple(stop)) )
+            expected = numpy.zeros( shape, dtype=bool )
+            expected[roiToSlice(*roi)] = True
+            for other in others:
+                expected[roiToSlice(*other)] = False
+
+            covered = numpy.zeros( shape, dtype=numpy.int32 )
+            for start, stop in subtract_rois( roi, others ):
+                covered[roiToSlice(start, stop)] += 1
+            # disjoint and exactly the uncovered part
+            assert (covered == expected).all()
+
+    def testMaxRois(self):
+        roi = ( (0,0), (10,10) )
+        hole = ( (4,4), (6,6) )
+        assert len( subtract_rois( roi, [hole] ) ) == 4
+        assert subtract_rois( roi, [hole], max_rois=3 ) is None
+
+class TestRegionSet(object):
+
+    def testContainment(self):
+        regions = RegionSet()
+        regions.add( (0,0,0), (10,10,10) )
+        regions.add( (2,3,4), (5,6,7) )
+        assert regions.rois() == [ ([0,0,0], [10,10,10]) ]
+
+        regions.add( (0,0,0), (20,20,20) )
+        assert regions.rois() == [ ([0,0,0], [20,20,20]) ]
+
+    def testAdjacent(self):
+        regions = RegionSet(slack=0)
+        for x in range(10):
+            regions.add( (x,0), (x+1,10) )
+        assert regions.rois() == [ ([0,0], [10,10]) ]
+
+    def testDisjoint(self):
+        regions = RegionSet()
+        regions.add( (0,0), (10,10) )
+        regions.add( (50,50), (60,60) )
+        assert len(regions) == 2
+        regions.add( (10,0), (50,10) )
+        assert len(regions) == 2
+        assert sorted(regions.rois()) == [ ([0,0], [50,10]), ([50,50], [60,60]) ]
+
+    def testOverlappingStrokes(self):
+        # A diagonal "brush stroke" of small, overlapping boxes
+        regions = RegionSet()
+        for i in range(100):
+            regions.add( (i,i), (i+10,i+10) )
+
+        # Everything is still covered
+        covered = numpy.zeros( (120,120), dtype=bool )
+        for start, stop in regions.rois():
+            covered[roiToSlice(start, stop)] = True
+        for i in range(100):
+            assert covered[i:i+10, i:i+10].all()
+        assert len(regions) < 100
+
+    def testMaxBoxes(self):
+        regions = RegionSet(max_boxes=4)
+        for i in range(5):
+            regions.add( (10*i, 0), (10*i+1, 1) )
+        assert regions.rois() == [ ([0,0], [41,1]) ]
+
+    def testEmptyBox(self):
+        regions = RegionSet()
+        regions.add( (0,5), (10,5) )
+        assert len(regions) == 0
+
 if __name__ == "__main__":
     # Run nose
     import sys
@@ -0,0 +1,128 @@
+###############################################################################
+#   lazyflow: data flow based lazy parallel computation framework
+#
+#       Copyright (C) 2011-2014, the ilastik developers
+#                                <team@ilastik.org>
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the Lesser GNU General Public License
+# as published by the Free Software Foundation; either version 2.1
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# See the files LICENSE.lgpl2 and LICENSE.lgpl3 for full text of the
+# GNU Lesser General Public License version 2.1 and 3 respectively.
+# This information is also available on the ilastik web site at:
+#		   http://ilastik.org/license/
+###############################################################################
+import numpy
+
+from lazyflow.graph import Graph, Operator, InputSlot, OutputSlot
+from lazyflow.operators import OpArrayPiper
+from lazyflow.request import Request
+from lazyflow.roi import roiToSlice
+from lazyflow.utility.testing import OpArrayPiperWithAccessCount
+
+class OpExecuteMany(Operator):
+    """
+    Records the calls to execute() and execute_many()
+    """
+    Input = InputSlot()
+    Output = OutputSlot()
+
+    def __init__(self, *args, **kwargs):
+        super(OpExecuteMany, self).__init__(*args, **kwargs)
+        self.executeCalls = 0
+        self.executeManyCalls = []
+
+    def setupOutputs(self):
+        self.Output.meta.assignFrom(self.Input.meta)
+
+    def execute(self, slot, subindex, roi, result):
+        self.executeCalls += 1
+        self.Input(roi.start, roi.stop).writeInto(result).wait()
+
+    def execute_many(self, slot, subindex, rois, results):
+        assert self._executionCount == 1
+        self.executeManyCalls.append( len(rois) )
+        for roi, result in zip(rois, results):
+            result[:] = self.Input(roi.start, roi.stop).wait()
+        return results
+
+    def propagateDirty(self, slot, subindex, roi):
+        self.Output.setDirty(roi)
+
+class TestGetMany(object):
+    def setUp(self):
+        self.graph = Graph()
+        self.data = numpy.random.random((100, 100)).astype(numpy.float32)
+        self.rois = [ ((0,0), (10,10)),
+                      ((5,20), (15,30)),
+                      ((90,0), (100,100)) ]
+
+    def _check(self, results):
+        assert len(results) == len(self.rois)
+        for roi, result in zip(self.rois, results):
+            assert (result == self.data[roiToSlice(*roi)]).all()
+
+    def testValue(self):
+        op = OpArrayPiper(graph=self.graph)
+        op.Input.setValue(self.data)
+        self._check( op.Input.get_many(self.rois).wait() )
+
+    def testFallback(self):
+        # Operators that don't implement execute_many() get one request per roi
+        opSource = OpArrayPiper(graph=self.graph)
+        opSource.Input.setValue(self.data)
+        op = OpArrayPiperWithAccessCount(graph=self.graph)
+        op.Input.connect(opSource.Output)
+
+        req = op.Output.get_many(self.rois)
+        assert isinstance(req, Request)
+        self._check( req.wait() )
+        assert op.accessCount == 3
+
+    def testExecuteMany(self):
+        opSource = OpArrayPiper(graph=self.graph)
+        opSource.Input.setValue(self.data)
+        op = OpExecuteMany(graph=self.graph)
+        op.Input.connect(opSource.Output)
+
+        # Also through a piper, which forwards get_many() as well
+        opPiper = OpArrayPiper(graph=self.graph)
+        opPiper.Input.connect(op.Output)
+
+        self._check( opPiper.Output.get_many(self.rois).wait() )
+        assert op.executeManyCalls == [3]
+        assert op.executeCalls == 0
+        assert op._executionCount == 0
+
+    def testDefaultExecuteMany(self):
+        opSource = OpArrayPiper(graph=self.graph)
+        opSource.Input.setValue(self.data)
+        op = OpArrayPiperWithAccessCount(graph=self.graph)
+        op.Input.connect(opSource.Output)
+
+        results = [ numpy.zeros((10,10), dtype=numpy.float32),
+                    numpy.zeros((10,10), dtype=numpy.float32),
+                    numpy.zeros((10,100), dtype=numpy.float32) ]
+        results = Operator.execute_many( op, op.Output, (), [ op.Output.rtype(op.Output, *roi) for roi in self.rois ], results )
+        self._check( results )
+        assert op.accessCount == 3
+
+    def testEmpty(self):
+        op = OpExecuteMany(graph=self.graph)
+        op.Input.setValue(self.data)
+        assert op.Output.get_many([]).wait() == []
+
+if __name__ == "__main__":
+    import sys
+    import nose
+    sys.argv.append("--nocapture")    # Don't steal stdout.  Show it on the console as usual.
+    sys.argv.append("--nologcapture") # Don't set the logging level to DEBUG.  Leave it alone.
+    ret = nose.run(defaultTest=__file__)
+    if not ret: sys.exit(1)
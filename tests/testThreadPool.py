@@ -21,7 +21,8 @@
 ###############################################################################
 import time
 import threading
-from lazyflow.request.threadPool import ThreadPool
+from lazyflow.request import threadPool
+from lazyflow.request.threadPool import ThreadPool, WorkStealingThreadPool
 
 class TestThreadPool(object):
     """
@@ -51,9 +52,9 @@ class TestThreadPool(object):
             f1_started.wait()
             f2_finished.set()
         
-        TestThreadPool.thread_pool.wake_up( f2 )
+        self.thread_pool.wake_up( f2 )
         f2_started.wait()
-        TestThreadPool.thread_pool.wake_up( f1 )
+        self.thread_pool.wake_up( f1 )
         
         f2_finished.wait()
         
@@ -132,6 +133,182 @@ class TestThreadPool(object):
         self.thread_pool._wait_for_idle()
 
 
+class TestWorkStealingThreadPool(TestThreadPool):
+    """
+    Run the same tests against the work-stealing pool, plus some tests for its specific behavior.
+    """
+
+    @classmethod
+    def setupClass(cls):
+        cls.thread_pool = WorkStealingThreadPool(num_workers = 4)
+
+    def testStealing(self):
+        """
+        Tasks submitted from within a worker go to that worker's own queue.
+        If that worker is busy, its idle peers must steal them.
+        """
+        num_tasks = 20
+        all_finished = threading.Event()
+        child_thread_ids = []
+        def child():
+            child_thread_ids.append( threading.current_thread() )
+            time.sleep(0.01)
+            if len(child_thread_ids) == num_tasks:
+                all_finished.set()
+
+        parent_threads = []
+        def parent():
+            parent_threads.append( threading.current_thread() )
+            for _ in range(num_tasks):
+                self.thread_pool.wake_up( Task(child) )
+            # Block this worker until the children are done.
+            all_finished.wait()
+
+        # Tasks from previous tests may still be running.
+        while any(state != 'waiting' for state in self.thread_pool.get_states()):
+            time.sleep(0.01)
+
+        self.thread_pool.wake_up( parent )
+        all_finished.wait()
+        assert parent_threads[0] not in child_thread_ids, \
+            "The children should have been stolen by other workers"
+        assert len(set(child_thread_ids)) > 1
+        self.thread_pool._wait_for_idle()
+
+    def testPriority(self):
+        """
+        With a single worker, unassigned tasks must be executed in priority order.
+        """
+        thread_pool = WorkStealingThreadPool(num_workers = 1)
+        try:
+            blocker_started = threading.Event()
+            release_blocker = threading.Event()
+            def blocker():
+                blocker_started.set()
+                release_blocker.wait()
+            thread_pool.wake_up( blocker )
+            blocker_started.wait()
+
+            order = []
+            priorities = [5, 1, 4, 2, 3]
+            all_finished = threading.Event()
+            def record(p):
+                order.append(p)
+                if len(order) == len(priorities):
+                    all_finished.set()
+
+            for p in priorities:
+                thread_pool.wake_up( Task(record, p, p) )
+            release_blocker.set()
+            all_finished.wait()
+            assert order == sorted(priorities), "Wrong order: {}".format( order )
+        finally:
+            thread_pool.stop()
+
+class TestAdaptiveThreadPool(object):
+
+    def _testInactiveWorkers(self, thread_pool):
+        """
+        Workers beyond the active count don't claim new tasks.
+        """
+        try:
+            thread_pool.set_active_workers(1)
+            num_tasks = 20
+            all_finished = threading.Event()
+            thread_indexes = []
+            def record():
+                thread_indexes.append( threading.current_thread().index )
+                time.sleep(0.001)
+                if len(thread_indexes) == num_tasks:
+                    all_finished.set()
+
+            for _ in range(num_tasks):
+                thread_pool.wake_up( Task(record) )
+            all_finished.wait()
+            assert set(thread_indexes) == set([0]), "Inactive workers executed tasks: {}".format( thread_indexes )
+        finally:
+            thread_pool.stop()
+
+    def testInactiveWorkers(self):
+        self._testInactiveWorkers( ThreadPool(num_workers = 4) )
+
+    def testInactiveWorkersWorkStealing(self):
+        self._testInactiveWorkers( WorkStealingThreadPool(num_workers = 4) )
+
+    def testChooseActiveWorkers(self):
+        thread_pool = ThreadPool(num_workers = 8, adaptive=True)
+        try:
+            # Don't let the controller interfere with this test.
+            thread_pool._controller.stop()
+            thread_pool.cpu_budget = 4.0
+            thread_pool.active_workers = 4
+            thread_pool._backlog = lambda: 10
+
+            # Nothing running
+            assert thread_pool._choose_active_workers( 0, 0.0 ) == 4
+
+            # Workers are mostly blocked (I/O)
+            assert thread_pool._choose_active_workers( 4, 1.0 ) > 4
+
+            # ...but there's no point adding workers if nothing is waiting.
+            thread_pool._backlog = lambda: 0
+            assert thread_pool._choose_active_workers( 4, 1.0 ) == 4
+            thread_pool._backlog = lambda: 10
+
+            # Each worker's own threads keep the CPUs busy: just right.
+            assert thread_pool._choose_active_workers( 4, 4.0, 3.9 ) == 4
+
+            # Each worker uses 4 threads internally: oversubscribed
+            assert thread_pool._choose_active_workers( 4, 4.0, 1.0 ) < 4
+            assert thread_pool._choose_active_workers( 1, 2.0 ) < 4
+
+            # Never below min_workers
+            thread_pool.active_workers = 1
+            assert thread_pool._choose_active_workers( 1, 4.0, 0.5 ) == 1
+        finally:
+            thread_pool.stop()
+
+    def testCgroupQuota(self):
+        files = {}
+        original_read = threadPool._read_first_line
+        threadPool._read_first_line = files.get
+        try:
+            assert threadPool._cgroup_cpu_quota() is None
+
+            files['/sys/fs/cgroup/cpu.max'] = 'max 100000'
+            assert threadPool._cgroup_cpu_quota() is None
+
+            files['/sys/fs/cgroup/cpu.max'] = '150000 100000'
+            assert threadPool._cgroup_cpu_quota() == 1.5
+
+            del files['/sys/fs/cgroup/cpu.max']
+            files['/sys/fs/cgroup/cpu/cpu.cfs_quota_us'] = '-1'
+            files['/sys/fs/cgroup/cpu/cpu.cfs_period_us'] = '100000'
+            assert threadPool._cgroup_cpu_quota() is None
+
+            files['/sys/fs/cgroup/cpu/cpu.cfs_quota_us'] = '200000'
+            assert threadPool._cgroup_cpu_quota() == 2.0
+            assert threadPool.available_cpus() <= 2.0
+        finally:
+            threadPool._read_first_line = original_read
+
+class Task(object):
+    """
+    A prioritized callable for the ThreadPool.
+    (Lower priority values are processed first, as with Requests.)
+    """
+    def __init__(self, fn, priority=0, *args):
+        self.fn = fn
+        self.priority = priority
+        self.args = args
+        self.assigned_worker = None
+
+    def __lt__(self, other):
+        return self.priority < other.priority
+
+    def __call__(self):
+        self.fn( *self.args )
+
 if __name__ == "__main__":
     import sys
     import nose